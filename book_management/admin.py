@@ -1,8 +1,20 @@
 """
 Admin models for library_management application.
 """
-from django.contrib import admin
+import io
+
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .forms import ProvisionBorrowersForm
 from .models import Book, Borrower, Borrowing
+from .provisioning import BorrowerProvisioner, read_csv
+
+# Skipped rows listed after a provisioning upload; the rest are only counted.
+MAX_REPORTED_ERRORS = 20
 
 
 @admin.register(Book)
@@ -21,8 +33,45 @@ class BookAdmin(admin.ModelAdmin):
 @admin.register(Borrower)
 class BorrowerAdmin(admin.ModelAdmin):
     """
-    Admin class for Borrower model.
+    Admin class for Borrower model, with a page for provisioning borrowers from a CSV file.
     """
+    change_list_template = 'admin/book_management/borrower/change_list.html'
+
+    def get_urls(self):
+        """
+        Add the provisioning page to the borrower admin URLs.
+        """
+        return [
+            path('provision/', self.admin_site.admin_view(self.provision_view), name='book_management_borrower_provision'),
+        ] + super().get_urls()
+
+    def provision_view(self, request):
+        """
+        Show the upload form, and provision borrowers from the uploaded CSV file.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = ProvisionBorrowersForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            errors = []
+            provisioner = BorrowerProvisioner(error=errors.append)
+            csv_file = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+            try:
+                counts = provisioner.run(read_csv(csv_file))
+            except ValidationError as error:
+                form.add_error('csv_file', error)
+            else:
+                self.message_user(request, f"Created {counts['created']} borrowers, skipped {counts['skipped']} rows.", messages.SUCCESS)
+                for message in errors[:MAX_REPORTED_ERRORS]:
+                    self.message_user(request, message, messages.WARNING)
+                return redirect('admin:book_management_borrower_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Provision borrowers',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/book_management/borrower/provision.html', context)
     class Meta:
         """
         Meta class for the BorrowerAdmin.
@@ -0,0 +1,419 @@
+"""
+JSON API for library_management application.
+
+Read-only endpoints list and show books, borrowers and borrowings. Every endpoint takes a
+'fields' parameter naming the fields to return (a sparse fieldset), and only those columns
+are selected. Lists are ordered by id and paged by keyset: pass the 'next' value of one
+page as 'after' to get the following page. Borrowings moved to the archive are listed and
+shown together with the live ones.
+
+The database endpoint reports the connection settings and statistics of the process that
+serves the request, for librarians.
+
+The batch endpoints borrow or return several books in one transaction, for self-checkout
+kiosks, and report a result per item. They require the same permissions as the borrow and
+return views. Requests use the session and CSRF token like the rest of the site.
+"""
+import json
+import os
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.http import JsonResponse
+from django.views.generic import View
+
+from library_management.db import stats as connection_stats
+
+from . import circulation
+from .archive import needs_archive
+from .models import ArchivedBorrowing, Book, Borrower, Borrowing
+from .search import search_books
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 50
+
+
+def json_error(message, status):
+    """
+    Return a JSON error response.
+    """
+    return JsonResponse({'error': message}, status=status)
+
+
+def parse_flag(value):
+    """
+    Parse a boolean query parameter; None if it is absent.
+    """
+    if value is None:
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class ApiError(Exception):
+    """
+    An error reported to the client as a JSON response with the given status.
+    """
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class ApiView(View):
+    """
+    Base view for the API: answers authentication and permission failures with JSON
+    instead of redirecting to the login page.
+    """
+    librarian_required = False
+    permission_required = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        user = request.user
+        if not user.is_authenticated:
+            return json_error('Authentication required.', 401)
+        if self.librarian_required and not user.is_staff:
+            return json_error('You do not have permission to access this resource.', 403)
+        if self.permission_required and not user.has_perms(self.permission_required):
+            return json_error('You do not have permission to access this resource.', 403)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            return json_error(e.message, e.status)
+
+
+class ResourceMixin:
+    """
+    Sparse fieldsets for a model exposed by the API.
+
+    fields maps each API field name to the model field path it is read from;
+    default_fields are returned when the request has no 'fields' parameter.
+    """
+    model = None
+    fields = {}
+    default_fields = ()
+
+    def get_fields(self):
+        """
+        Return the requested field names.
+
+        Raises:
+            ApiError: If an unknown field is requested.
+        """
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(self.default_fields)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(self.fields)}.")
+        return names
+
+    def get_queryset(self):
+        """
+        Return the rows the user may see.
+        """
+        return self.model.objects.all()
+
+    def project(self, queryset, names):
+        """
+        Select only the requested fields, under their API names.
+        """
+        plain = [name for name in names if self.fields[name] == name]
+        renamed = {name: F(self.fields[name]) for name in names if self.fields[name] != name}
+        return queryset.values(*plain, **renamed)
+
+
+class ResourceListView(ResourceMixin, ApiView):
+    """
+    List a resource, paged by id.
+    """
+    def filter_queryset(self, queryset):
+        """
+        Apply the list's filter parameters.
+        """
+        return queryset
+
+    def get_page(self, queryset, names, after, limit):
+        """
+        Return up to limit rows of queryset, by id and after the id after (if given), with
+        the fields names.
+        """
+        if after is not None:
+            queryset = queryset.filter(id__gt=after)
+        return list(self.project(queryset.order_by('id'), names)[:limit])
+
+    def get(self, request, *args, **kwargs):
+        names = self.get_fields()
+        try:
+            page_size = min(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            after = int(request.GET['after']) if request.GET.get('after') else None
+        except ValueError:
+            raise ApiError("'page_size' and 'after' must be integers.")
+        if page_size < 1:
+            raise ApiError("'page_size' must be at least 1.")
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # The id is always read, to tell where the next page starts.
+        rows = self.get_page(queryset, names + ['id'] if 'id' not in names else names, after, page_size + 1)
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        next_after = rows[-1]['id'] if has_next else None
+        if 'id' not in names:
+            for row in rows:
+                del row['id']
+        return JsonResponse({'results': rows, 'next': next_after})
+
+
+class ResourceDetailView(ResourceMixin, ApiView):
+    """
+    Show one object of a resource.
+    """
+    def get_row(self, pk, names):
+        """
+        Return the fields names of the object pk, or None if the user may not see it.
+        """
+        return self.project(self.get_queryset().filter(pk=pk), names).first()
+
+    def get(self, request, pk, *args, **kwargs):
+        row = self.get_row(pk, self.get_fields())
+        if row is None:
+            return json_error('Not found.', 404)
+        return JsonResponse(row)
+
+
+class BookResource(ResourceMixin):
+    """
+    Books, readable by every signed-in user.
+    """
+    model = Book
+    fields = {
+        'id': 'id',
+        'title': 'title',
+        'author': 'author',
+        'isbn': 'ISBN',
+        'publication_date': 'publication_date',
+        'available': 'availability_status',
+        'total_loans': 'total_loans',
+    }
+    default_fields = ('id', 'title', 'author', 'available')
+
+
+class BorrowerResource(ResourceMixin):
+    """
+    Borrowers, readable by librarians.
+    """
+    model = Borrower
+    librarian_required = True
+    fields = {
+        'id': 'id',
+        'name': 'name',
+        'phone_number': 'phone_number',
+        'username': 'user__username',
+        'email': 'user__email',
+        'open_loans': 'open_loans',
+    }
+    default_fields = ('id', 'name', 'open_loans')
+
+    def get_queryset(self):
+        """
+        Return the borrowers, with their open loans counted when they are selected.
+        """
+        return Borrower.objects.with_open_loans()
+
+
+class BorrowingResource(ResourceMixin):
+    """
+    Borrowings, live and archived: librarians see all of them, borrowers only their own.
+    """
+    model = Borrowing
+    fields = {
+        'id': 'id',
+        'book_id': 'book_id',
+        'book_title': 'book__title',
+        'borrower_id': 'borrower_id',
+        'borrower_name': 'borrower__name',
+        'borrow_date': 'borrow_date',
+        'due_date': 'due_date',
+        'return_date': 'return_date',
+    }
+    default_fields = ('id', 'book_id', 'borrower_id', 'borrow_date', 'due_date', 'return_date')
+
+    def restrict(self, queryset):
+        """
+        Return the rows of queryset the user may see.
+        """
+        user = self.request.user
+        if user.is_staff:
+            return queryset
+        if user.has_perm('book_management.can_borrow'):
+            borrower_id = self.request.borrower.borrower_id
+            if borrower_id is None:
+                return queryset.none()
+            return queryset.filter(borrower_id=borrower_id)
+        raise ApiError('You do not have permission to access this resource.', 403)
+
+    def get_queryset(self):
+        return self.restrict(Borrowing.objects.all())
+
+    def get_archive_queryset(self):
+        """
+        Return the archived borrowings the user may see.
+        """
+        return self.restrict(ArchivedBorrowing.objects.all())
+
+
+class BookListApiView(BookResource, ResourceListView):
+    """
+    GET /api/books/?fields=&q=&available=&after=&page_size=
+    """
+    def filter_queryset(self, queryset):
+        available = parse_flag(self.request.GET.get('available'))
+        if available is not None:
+            queryset = queryset.filter(availability_status=available)
+        # The list is ordered by id, so the relevance rank is not computed.
+        return search_books(queryset, self.request.GET.get('q'), ranked=False)
+
+
+class BookDetailApiView(BookResource, ResourceDetailView):
+    """
+    GET /api/books/<pk>/?fields=
+    """
+
+
+class BorrowerListApiView(BorrowerResource, ResourceListView):
+    """
+    GET /api/borrowers/?fields=&q=&after=&page_size=
+    """
+    def filter_queryset(self, queryset):
+        query = self.request.GET.get('q')
+        if query:
+            queryset = queryset.filter(name__icontains=query)
+        return queryset
+
+
+class BorrowerDetailApiView(BorrowerResource, ResourceDetailView):
+    """
+    GET /api/borrowers/<pk>/?fields=
+    """
+
+
+class BorrowingListApiView(BorrowingResource, ResourceListView):
+    """
+    GET /api/borrowings/?fields=&open=&book=&borrower=&after=&page_size=
+    """
+    def filter_queryset(self, queryset):
+        is_open = parse_flag(self.request.GET.get('open'))
+        if is_open is not None:
+            queryset = queryset.filter(return_date__isnull=is_open)
+        try:
+            for param in ('book', 'borrower'):
+                if self.request.GET.get(param):
+                    queryset = queryset.filter(**{f'{param}_id': int(self.request.GET[param])})
+        except ValueError:
+            raise ApiError("'book' and 'borrower' must be integers.")
+        return queryset
+
+    def get_page(self, queryset, names, after, limit):
+        """
+        Return the page from the live and archived borrowings together, merged by id in SQL,
+        when anything was archived. Archived borrowings are never open.
+        """
+        if not needs_archive() or parse_flag(self.request.GET.get('open')):
+            return super().get_page(queryset, names, after, limit)
+        archive = self.filter_queryset(self.get_archive_queryset())
+        if after is not None:
+            queryset, archive = queryset.filter(id__gt=after), archive.filter(id__gt=after)
+        live, archived = self.project(queryset.order_by(), names), self.project(archive.order_by(), names)
+        return list(live.union(archived, all=True).order_by('id')[:limit])
+
+
+class BorrowingDetailApiView(BorrowingResource, ResourceDetailView):
+    """
+    GET /api/borrowings/<pk>/?fields=
+    """
+    def get_row(self, pk, names):
+        """
+        Return the borrowing, looking in the archive when it is not a live one.
+        """
+        row = super().get_row(pk, names)
+        if row is None and needs_archive():
+            row = self.project(self.get_archive_queryset().filter(pk=pk), names).first()
+        return row
+
+
+class BatchView(ApiView):
+    """
+    Base view for the batch endpoints, which take a JSON object with a list of ids.
+    """
+    ids_key = None
+
+    def get_ids(self):
+        """
+        Return the list of ids from the JSON request body.
+
+        Raises:
+            ApiError: If the body is not a JSON object with a list of up to MAX_BATCH_SIZE integers.
+        """
+        try:
+            payload = json.loads(self.request.body)
+        except ValueError:
+            raise ApiError('The request body must be JSON.')
+        ids = payload.get(self.ids_key) if isinstance(payload, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ApiError(f"'{self.ids_key}' must be a list of integers.")
+        if not ids or len(ids) > MAX_BATCH_SIZE:
+            raise ApiError(f"'{self.ids_key}' must hold between 1 and {MAX_BATCH_SIZE} ids.")
+        return ids
+
+    def respond(self, results):
+        """
+        Return the per-item results with the number that succeeded.
+        """
+        return JsonResponse({'results': results, 'succeeded': sum(result['ok'] for result in results)})
+
+
+class BorrowBatchApiView(BatchView):
+    """
+    POST /api/borrow/ with {"book_ids": [...]}: lend the books to the signed-in borrower.
+    """
+    permission_required = ('book_management.can_borrow',)
+    ids_key = 'book_ids'
+
+    def post(self, request, *args, **kwargs):
+        book_ids = self.get_ids()
+        borrower_id = request.borrower.borrower_id
+        if borrower_id is None:
+            return json_error('You are not registered as a borrower.', 403)
+        return self.respond(circulation.borrow_many(book_ids, borrower_id))
+
+
+class ReturnBatchApiView(BatchView):
+    """
+    POST /api/return/ with {"borrowing_ids": [...]}: close the borrowings.
+    """
+    permission_required = ('book_management.can_return',)
+    ids_key = 'borrowing_ids'
+
+    def post(self, request, *args, **kwargs):
+        return self.respond(circulation.return_many(self.get_ids()))
+
+
+class DatabaseStatsApiView(ApiView):
+    """
+    GET /api/database/: connection settings per database alias, and the connection
+    statistics of the serving process (open, in use, idle, waits).
+    """
+    librarian_required = True
+
+    def get(self, request, *args, **kwargs):
+        databases = {
+            alias: {
+                'conn_max_age': connections[alias].settings_dict['CONN_MAX_AGE'],
+                'conn_health_checks': connections[alias].settings_dict['CONN_HEALTH_CHECKS'],
+                'server_side_cursors': not connections[alias].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS', False),
+            }
+            for alias in settings.DATABASES
+        }
+        return JsonResponse({'pid': os.getpid(), 'databases': databases, 'connections': connection_stats.snapshot()})
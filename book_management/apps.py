@@ -17,3 +17,5 @@ class BookManagementConfig(AppConfig):
         No parameters and return type.
         """
         import book_management.signals
+        # Registers the query timer before any database connection is opened.
+        import book_management.metrics
@@ -0,0 +1,176 @@
+"""
+Borrowing archive for library_management application.
+
+Returned borrowings older than a horizon are moved from Borrowing to ArchivedBorrowing by
+archive_borrowings(), so the live table and its indexes stop growing with the history.
+Rows are moved in chunks of one transaction each, in id order, so an interrupted run
+loses nothing and the next one carries on where it stopped. Each chunk can also be
+appended to a gzipped JSON Lines file before it is committed.
+
+The horizon is recorded in BorrowingArchive before any row moves. History lists and
+exports only read the archive when their borrow date range starts before it; otherwise
+they read the Borrowing table alone, as before. Each process caches the horizon for
+ARCHIVE_HORIZON_CACHE_TIMEOUT seconds, and a run that moves the horizon waits that long
+before moving rows, so by then every process looks for them in the archive.
+"""
+import gzip
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Value
+from django.utils import timezone
+
+from .models import ArchivedBorrowing, Borrowing, BorrowingArchive, OverdueLoan
+from .pagination import invalidate_counts
+
+HORIZON_KEY = 'book_management:archive:horizon'
+
+ARCHIVE_FIELDS = ('id', 'book_id', 'borrower_id', 'borrow_date', 'due_date', 'return_date')
+
+
+def get_horizon_timeout():
+    """
+    Return the seconds a process may keep using a cached archive horizon.
+    """
+    return getattr(settings, 'ARCHIVE_HORIZON_CACHE_TIMEOUT', 60)
+
+
+def get_archive_horizon():
+    """
+    Return the date before which returned borrowings may be in the archive, or None if
+    nothing was ever archived. Cached for get_horizon_timeout() seconds.
+    """
+    # Cached in a list, so that "no horizon" is cached too.
+    cached = cache.get(HORIZON_KEY)
+    if cached is None:
+        cached = [BorrowingArchive.objects.filter(pk=1).values_list('horizon', flat=True).first()]
+        cache.set(HORIZON_KEY, cached, get_horizon_timeout())
+    return cached[0]
+
+
+def needs_archive(since=None):
+    """
+    Return whether borrowings borrowed on or after since (or at any time, when since is
+    None) may be in the archive.
+    """
+    horizon = get_archive_horizon()
+    return horizon is not None and (since is None or since < horizon)
+
+
+def set_archive_horizon(horizon):
+    """
+    Record that returned borrowings borrowed before horizon may be archived. The horizon
+    only moves forward, as archived rows are never moved back.
+
+    Returns:
+        bool: Whether the recorded horizon moved.
+    """
+    with transaction.atomic():
+        archive, created = BorrowingArchive.objects.select_for_update().get_or_create(pk=1)
+        moved = archive.horizon is None or archive.horizon < horizon
+        if moved:
+            archive.horizon = horizon
+        archive.archived_at = timezone.now()
+        archive.save()
+    # Other processes drop their copy when it times out.
+    cache.delete(HORIZON_KEY)
+    return moved
+
+
+def export_rows(path, rows):
+    """
+    Append rows to a gzipped JSON Lines file, one object per row with ISO dates.
+
+    Each call writes a complete gzip member, so the file stays readable (by gzip, zcat or
+    gzip.open) if a later chunk never makes it.
+    """
+    with gzip.open(path, 'at', encoding='utf-8') as export_file:
+        for row in rows:
+            export_file.write(json.dumps(row, default=lambda value: value.isoformat(), sort_keys=True) + '\n')
+
+
+def archive_borrowings(horizon, batch_size=5000, max_batches=None, export=None, log=None):
+    """
+    Move the returned borrowings borrowed before horizon to the archive.
+
+    Each chunk is copied to ArchivedBorrowing and deleted from Borrowing in one
+    transaction, together with any stale OverdueLoan rows. The delete bypasses the
+    Borrowing signals: an archived loan still counts towards its book's total_loans.
+    A run that moves the horizon first waits for the cached horizons to expire.
+
+    Args:
+        horizon: Borrowings borrowed before this date are moved.
+        batch_size: Rows moved per transaction.
+        max_batches: Stop after this many chunks; run again to carry on.
+        export: Path of a .jsonl.gz file the moved rows are appended to.
+        log: Callable receiving progress messages.
+
+    Returns:
+        int: The number of borrowings moved.
+    """
+    log = log or (lambda message: None)
+    # Recorded first, and given time to reach every process's cache, so history lists
+    # look in the archive before any row arrives there.
+    timeout = get_horizon_timeout()
+    if set_archive_horizon(horizon) and timeout:
+        log(f'Waiting {timeout}s for the new horizon to reach every process.')
+        time.sleep(timeout)
+    eligible = Borrowing.objects.filter(return_date__isnull=False, borrow_date__lt=horizon)
+    moved = batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            rows = list(eligible.filter(id__gt=last_id).order_by('id').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            # A row already archived by an interrupted run that failed to commit its delete is kept.
+            ArchivedBorrowing.objects.bulk_create(
+                [ArchivedBorrowing(**row) for row in rows], ignore_conflicts=True,
+            )
+            OverdueLoan.objects.filter(borrowing_id__in=ids).delete()
+            chunk = Borrowing.objects.filter(id__in=ids)
+            chunk._raw_delete(chunk.db)
+            if export:
+                # Written before the commit: a row may be exported twice, but never missed.
+                export_rows(export, rows)
+        last_id = ids[-1]
+        moved += len(rows)
+        batches += 1
+        log(f'Archived {moved} borrowings.')
+    if moved:
+        invalidate_counts()
+    return moved
+
+
+def union_keys(queryset, archive, ascending):
+    """
+    Return (id, keyset_value, archived) rows of the keyset-annotated Borrowing queryset and
+    ArchivedBorrowing archive together, ordered in SQL by (keyset_value, id).
+    """
+    columns = ('id', 'keyset_value', 'archived')
+    queryset = queryset.annotate(archived=Value(False)).order_by().values_list(*columns)
+    archive = archive.annotate(archived=Value(True)).order_by().values_list(*columns)
+    ordering = ('keyset_value', 'id') if ascending else ('-keyset_value', '-id')
+    return queryset.union(archive, all=True).order_by(*ordering)
+
+
+def fetch_keyed_rows(keys, queryset, archive):
+    """
+    Return the objects for rows of union_keys(), in order, each read from its own table.
+    Rows that disappeared in between are left out.
+    """
+    live_ids = [pk for pk, value, archived in keys if not archived]
+    archived_ids = [pk for pk, value, archived in keys if archived]
+    live = queryset.order_by().in_bulk(live_ids) if live_ids else {}
+    stored = archive.order_by().in_bulk(archived_ids) if archived_ids else {}
+    rows = []
+    for pk, value, archived in keys:
+        row = (stored if archived else live).get(pk)
+        if row is not None:
+            rows.append(row)
+    return rows
+
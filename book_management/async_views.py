@@ -0,0 +1,210 @@
+"""
+Async views for library_management application.
+
+Native async versions of the read-heavy list views, for deployments served over ASGI.
+They reuse the sync views' filtering, templates and access rules, but check access and
+paginate with the async cache and ORM (acount() and async iteration), so a request does
+not hold a worker thread while it waits on the database. Set ASYNC_LIST_VIEWS to route
+the list URLs to them.
+
+Under ASGI, sync views all run in one shared thread, so logins would hash their passwords
+one at a time. CustomLoginAsyncView checks the credentials in a pool of LOGIN_HASH_WORKERS
+threads instead; hashlib releases the GIL while it hashes, so they run on separate cores.
+Set ASYNC_LOGIN_VIEW to route the login URL to it.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import InvalidPage
+from django.db import close_old_connections
+from django.http import Http404
+
+from .page_cache import CachedPageMixin
+from .pagination import KeysetPaginationMixin
+from .views import (
+    ArchivedHistoryMixin,
+    AvailableBooks,
+    AvailableBooksAnoymous,
+    BookListView,
+    BorrowingHistoryView,
+    CustomLoginView,
+    LibrarianRequiredMixin,
+)
+
+
+class AsyncListMixin:
+    """
+    Serve a ListView's GET natively under ASGI.
+
+    Mixed in ahead of a sync ListView subclass: access is checked like the view's sync
+    mixins (login, staff, permissions), then the page is fetched with the async ORM and
+    the context is built by the view's own get_context_data().
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Check access, then call the async handler for the request method.
+        """
+        denied = await self.acheck_access(request)
+        if denied is not None:
+            return denied
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+        else:
+            handler = self.http_method_not_allowed
+        return await handler(request, *args, **kwargs)
+
+    async def acheck_access(self, request):
+        """
+        Return the response for a request the sync view would refuse, or None.
+        """
+        # Loads the session and user in a thread; afterwards request.user is in memory.
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        if isinstance(self, LibrarianRequiredMixin) and not request.user.is_staff:
+            return redirect_to_login(request.get_full_path())
+        if isinstance(self, PermissionRequiredMixin) and not await sync_to_async(self.has_permission)():
+            return self.handle_no_permission()
+        return None
+
+    def get_paginate_by(self, queryset):
+        # The page is fetched by get(), so get_context_data() must not paginate again.
+        if getattr(self, 'page_fetched', False):
+            return None
+        return super().get_paginate_by(queryset)
+
+    async def apaginate_page(self, queryset, page_size):
+        """
+        Async version of ListView.paginate_queryset(), by keyset or by page number.
+        History ranges that reach back into the archive are paged in a thread.
+        """
+        if isinstance(self, ArchivedHistoryMixin) and await sync_to_async(self.needs_archive)():
+            return await sync_to_async(self.paginate_queryset)(queryset, page_size)
+        if isinstance(self, KeysetPaginationMixin) and self.is_cursor_mode():
+            queryset, forward, pk = self.get_keyset_slice(queryset, page_size)
+            return self.build_keyset_page([obj async for obj in queryset], page_size, forward, pk)
+
+        paginator = self.get_paginator(
+            queryset, page_size, orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        page_kwarg = self.page_kwarg
+        page = self.kwargs.get(page_kwarg) or self.request.GET.get(page_kwarg) or 1
+        try:
+            page_number = int(page)
+        except ValueError:
+            if page != 'last':
+                raise Http404('Page is not “last”, nor can it be converted to an int.')
+            await paginator.acount()
+            page_number = paginator.num_pages
+        try:
+            page = await paginator.apage(page_number)
+        except InvalidPage as e:
+            raise Http404(f'Invalid page ({page_number}): {e}')
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """
+        Return (paginator, page, object_list, is_paginated), from the page cache if the
+        view has one.
+        """
+        if isinstance(self, CachedPageMixin):
+            return await self.apaginate_cached(queryset, page_size, self.apaginate_page)
+        return await self.apaginate_page(queryset, page_size)
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Fetch the requested page and render the view's template with it.
+        """
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        paginator, page, rows, is_paginated = await self.apaginate_queryset(self.object_list, page_size)
+        self.page_fetched = True
+        context = self.get_context_data(
+            object_list=rows,
+            paginator=paginator,
+            page_obj=page,
+            is_paginated=is_paginated,
+        )
+        # The template is rendered by the handler, in a thread.
+        return self.render_to_response(context)
+
+
+class AvailableBooksAsync(AsyncListMixin, AvailableBooks):
+    """
+    Async version of AvailableBooks.
+    """
+
+
+class AvailableBooksAnoymousAsync(AsyncListMixin, AvailableBooksAnoymous):
+    """
+    Async version of AvailableBooksAnoymous.
+    """
+
+
+class BookListAsyncView(AsyncListMixin, BookListView):
+    """
+    Async version of BookListView.
+    """
+
+
+class BorrowingHistoryAsyncView(AsyncListMixin, BorrowingHistoryView):
+    """
+    Async version of BorrowingHistoryView.
+    """
+
+
+@lru_cache(maxsize=None)
+def get_login_executor():
+    """
+    Return the process's thread pool for checking login credentials, with
+    LOGIN_HASH_WORKERS threads (default: one per CPU).
+    """
+    workers = getattr(settings, 'LOGIN_HASH_WORKERS', None) or os.cpu_count() or 1
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login')
+
+
+def run_in_login_executor(func):
+    """
+    Run func in the login thread pool and return an awaitable of its result.
+
+    The pool's threads keep their own database connections, which are checked before and
+    after each call as a request's would be.
+    """
+    def run():
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=get_login_executor())()
+
+
+class CustomLoginAsyncView(CustomLoginView):
+    """
+    Async version of CustomLoginView: the form is validated, and so the password hashed,
+    in the login thread pool.
+    """
+    async def get(self, request, *args, **kwargs):
+        """
+        Show the login form; it is rendered by the handler, in a thread.
+        """
+        return self.render_to_response(self.get_context_data())
+
+    async def post(self, request, *args, **kwargs):
+        """
+        Check the credentials in the login thread pool, then log the user in.
+        """
+        form = self.get_form()
+        if await run_in_login_executor(form.is_valid):
+            return await sync_to_async(self.form_valid)(form)
+        return self.form_invalid(form)
+
+    async def put(self, *args, **kwargs):
+        return await self.post(*args, **kwargs)
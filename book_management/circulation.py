@@ -0,0 +1,161 @@
+"""
+Circulation service for library_management application.
+
+Borrowing and returning are done with conditional UPDATEs inside a transaction, so a
+book can never be lent twice and each operation costs two queries. Borrowing also keeps
+the Book.total_loans counter up to date with an F() expression in the same UPDATE;
+reconcile_counters() recomputes it from the borrowings. A borrower's open loans are not
+stored but counted from the borrowings (BorrowerQuerySet.with_open_loans()).
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ArchivedBorrowing, Book, Borrowing, due_date_for
+from .page_cache import invalidate_catalogue
+from .pagination import invalidate_counts
+
+
+def to_pk(value, message):
+    """
+    Return value as an integer primary key, or raise ValidationError(message) like a
+    missing row would.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(message)
+
+
+def borrow(book_id, borrower):
+    """
+    Lend a book to a borrower.
+
+    The book is claimed with a single UPDATE that only matches while it is available,
+    so concurrent requests for the same book cannot both succeed.
+
+    Args:
+        book_id: The primary key of the book to lend.
+        borrower: The Borrower instance (or its primary key) borrowing the book.
+
+    Returns:
+        Borrowing: The created borrowing record.
+
+    Raises:
+        ValidationError: If the book does not exist or is already lent.
+    """
+    book_id = to_pk(book_id, "Book is not available.")
+    with transaction.atomic():
+        claimed = Book.objects.filter(pk=book_id, availability_status=True).update(
+            availability_status=False,
+            total_loans=F('total_loans') + 1,
+        )
+        if not claimed:
+            raise ValidationError("Book is not available.")
+        borrower_id = getattr(borrower, 'pk', borrower)
+        today = timezone.localdate()
+        borrowing = Borrowing.objects.create(
+            borrower_id=borrower_id,
+            book_id=book_id,
+            borrow_date=today,
+            due_date=due_date_for(today),
+        )
+        invalidate_catalogue()
+        return borrowing
+
+
+def return_(borrowing_id):
+    """
+    Close a borrowing and make its book available again.
+
+    Args:
+        borrowing_id: The primary key of the borrowing to close.
+
+    Returns:
+        The primary key of the closed borrowing.
+
+    Raises:
+        ValidationError: If the borrowing does not exist or has already been returned.
+    """
+    borrowing_id = to_pk(borrowing_id, "Book is not borrowed.")
+    with transaction.atomic():
+        closed = Borrowing.objects.filter(pk=borrowing_id, return_date__isnull=True).update(return_date=timezone.localdate())
+        if not closed:
+            raise ValidationError("Book is not borrowed.")
+        Book.objects.filter(borrowing__pk=borrowing_id).update(availability_status=True)
+        invalidate_catalogue()
+    # The UPDATEs send no signals, so drop the cached list counts here.
+    invalidate_counts()
+    return borrowing_id
+
+
+def borrow_many(book_ids, borrower):
+    """
+    Lend several books to a borrower in one transaction.
+
+    Each book is borrowed in its own savepoint, so a book that cannot be lent is reported
+    without undoing the others.
+
+    Args:
+        book_ids: The primary keys of the books to lend.
+        borrower: The Borrower instance (or its primary key) borrowing the books.
+
+    Returns:
+        list: One dict per book id, in order, with 'ok' and either 'borrowing_id' or 'errors'.
+    """
+    results = []
+    with transaction.atomic():
+        for book_id in book_ids:
+            try:
+                borrowing = borrow(book_id, borrower)
+            except ValidationError as e:
+                results.append({'book_id': book_id, 'ok': False, 'errors': e.messages})
+            else:
+                results.append({'book_id': book_id, 'ok': True, 'borrowing_id': borrowing.pk})
+    return results
+
+
+def return_many(borrowing_ids):
+    """
+    Close several borrowings in one transaction, reporting each one like borrow_many().
+
+    Args:
+        borrowing_ids: The primary keys of the borrowings to close.
+
+    Returns:
+        list: One dict per borrowing id, in order, with 'ok' and, on failure, 'errors'.
+    """
+    results = []
+    with transaction.atomic():
+        for borrowing_id in borrowing_ids:
+            try:
+                return_(borrowing_id)
+            except ValidationError as e:
+                results.append({'borrowing_id': borrowing_id, 'ok': False, 'errors': e.messages})
+            else:
+                results.append({'borrowing_id': borrowing_id, 'ok': True})
+    return results
+
+
+def count_of(queryset, field):
+    """
+    Return a subquery counting the rows of queryset whose field matches the outer row.
+    """
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def reconcile_counters():
+    """
+    Recompute Book.total_loans from the borrowings in one UPDATE that only touches the
+    rows that have drifted. Archived borrowings count towards total_loans.
+
+    Returns:
+        dict: The number of books that were corrected.
+    """
+    total_loans = count_of(Borrowing.objects.all(), 'book') + count_of(ArchivedBorrowing.objects.all(), 'book')
+    with transaction.atomic():
+        books = Book.objects.exclude(total_loans=total_loans).update(total_loans=total_loans)
+    return {'books': books}
@@ -0,0 +1,150 @@
+"""
+Exports for library_management application.
+
+Borrowing history is read with values_list(...).iterator(chunk_size=...) and written one
+row at a time, so memory stays flat however many rows are exported. When the borrow date
+range reaches back past the archive horizon, archived borrowings are merged in by the
+database.
+"""
+import csv
+import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from .archive import needs_archive
+from .models import ArchivedBorrowing, Borrowing
+
+EXPORT_COLUMNS = (
+    ('id', 'Borrow ID'),
+    ('book__title', 'Book Title'),
+    ('book__author', 'Book Author'),
+    ('book__ISBN', 'Book ISBN'),
+    ('borrower__name', 'Borrower Name'),
+    ('borrower__user__username', 'Borrower Username'),
+    ('borrow_date', 'Borrow Date'),
+    ('return_date', 'Return Date'),
+)
+
+HISTORY_ORDERINGS = ('borrow_date', 'return_date', 'book__title', 'borrower__name', 'id')
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def parse_history_range(since=None, until=None):
+    """
+    Parse the 'since' and 'until' borrow date parameters (YYYY-MM-DD).
+
+    Returns:
+        tuple: (since, until) as dates; a missing or invalid one is None.
+    """
+    dates = []
+    for value in (since, until):
+        try:
+            dates.append(parse_date(value) if value else None)
+        except ValueError:
+            dates.append(None)
+    return tuple(dates)
+
+
+def filter_borrow_dates(queryset, since=None, until=None):
+    """
+    Keep the borrowings borrowed from since to until, both inclusive and both optional.
+    """
+    if since is not None:
+        queryset = queryset.filter(borrow_date__gte=since)
+    if until is not None:
+        queryset = queryset.filter(borrow_date__lte=until)
+    return queryset
+
+
+def filter_history(queryset, query=None, order_by='borrow_date', dir='asc', since=None, until=None):
+    """
+    Apply the borrowing history search and ordering parameters to a Borrowing queryset.
+
+    Args:
+        queryset: The Borrowing (or ArchivedBorrowing) queryset to filter.
+        query: Matches borrower name or book title.
+        order_by: One of HISTORY_ORDERINGS; anything else falls back to borrow_date.
+        dir: 'asc' or 'desc'.
+        since: Earliest borrow date, or None.
+        until: Latest borrow date, or None.
+
+    Returns:
+        QuerySet: The returned borrowings matching the parameters.
+    """
+    queryset = filter_borrow_dates(queryset.filter(return_date__isnull=False), since, until)
+
+    if query:
+        queryset = queryset.filter(
+            Q(borrower__name__icontains=query) |
+            Q(book__title__icontains=query)
+        )
+
+    if order_by not in HISTORY_ORDERINGS:
+        order_by = 'borrow_date'
+    if dir == 'desc':
+        return queryset.order_by(f'-{order_by}', '-id')
+    return queryset.order_by(order_by, 'id')
+
+
+def history_rows(query=None, order_by='borrow_date', dir='asc', chunk_size=DEFAULT_CHUNK_SIZE, since=None, until=None):
+    """
+    Yield the header and then one tuple per returned borrowing, joined with book and borrower.
+    Archived borrowings are included when the range starts before the archive horizon.
+    """
+    yield tuple(label for field, label in EXPORT_COLUMNS)
+    fields = [field for field, label in EXPORT_COLUMNS]
+    queryset = filter_history(Borrowing.objects.all(), query, order_by, dir, since, until)
+    rows = queryset.values_list(*fields)
+    if needs_archive(since):
+        archive = filter_history(ArchivedBorrowing.objects.all(), query, order_by, dir, since, until)
+        rows = rows.order_by().union(archive.values_list(*fields).order_by(), all=True).order_by(*queryset.query.order_by)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield tuple(format_value(value) for value in row)
+
+
+def format_value(value):
+    """
+    Format a value for a CSV cell.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class Echo:
+    """
+    File-like object that returns what is written, so csv.writer can feed a streaming response.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """
+    Yield each row encoded as a CSV line.
+    """
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, file):
+    """
+    Write rows to an XLSX file with openpyxl's write-only workbook, which flushes rows to
+    disk as they are appended instead of keeping the sheet in memory.
+
+    Args:
+        rows: Iterable of row tuples, the first being the header.
+        file: A path or binary file object to save the workbook to.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Borrowing History')
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(file)
@@ -4,11 +4,35 @@ Forms for library_management application.
 from django import forms
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.hashers import make_password
 from .validators import CustomPasswordValidator
 from .models import Book, Borrower
 
+# The case-insensitive unique index on auth_user.email (see migration 0012).
+USER_EMAIL_INDEX = 'auth_user_email_ci_uniq'
+
+
+def taken_field(error):
+    """
+    Return the auth_user field, 'email' or 'username', whose unique index rejected an
+    INSERT, or None if it was another constraint.
+
+    :param error: IntegrityError - The error raised by the INSERT.
+    :return: str or None - The field name.
+    """
+    # PostgreSQL names the violated constraint; its message may mention "username" either way.
+    diag = getattr(error.__cause__, 'diag', None)
+    constraint = getattr(diag, 'constraint_name', None)
+    text = constraint if constraint is not None else str(error)
+    if USER_EMAIL_INDEX in text:
+        return 'email'
+    if 'username' in text:
+        return 'username'
+    return None
+
+
 class BookForm(forms.ModelForm):
     """
     Form for creating and updating books.
@@ -45,6 +69,16 @@ class BorrowerForm(forms.ModelForm):
         return user
 
 
+class ProvisionBorrowersForm(forms.Form):
+    """
+    Form for uploading a CSV of borrowers to provision.
+    """
+    csv_file = forms.FileField(
+        label='CSV file',
+        help_text='Columns: username, name, phone_number, and optionally email and password.',
+    )
+
+
 class CustomSignupForm(forms.Form):
     """
     Form for signing up new users.
@@ -57,7 +91,8 @@ class CustomSignupForm(forms.Form):
     def clean_username(self):
         """
         Clean the username field by adding custom validations for username length and allowed characters.
-        Raise a ValidationError if the username is too long, contains invalid characters, or is already in use.
+        Raise a ValidationError if the username is too long or contains invalid characters.
+        Whether it is already in use is checked by the database, in save().
         Return the cleaned username.
         """
         username = self.cleaned_data['username']
@@ -68,19 +103,7 @@ class CustomSignupForm(forms.Form):
         if not username.isalnum() and '@' not in username and '.' not in username and '+' not in username and '-' not in username and '_' not in username:
             raise forms.ValidationError('Username can only contain letters, digits, and @/./+/-/_ characters.')
 
-        if User.objects.filter(username=username).exists():
-            raise forms.ValidationError('This username is already in use.')
-
         return username
-    
-    def clean_email(self):
-        """
-        Clean the email field by checking if it's already in use, and return the cleaned email.
-        """
-        email = self.cleaned_data['email']
-        if User.objects.filter(email=email).exists():
-            raise forms.ValidationError('This email is already in use.')
-        return email
 
     def clean(self):
         """
@@ -102,59 +125,70 @@ class CustomSignupForm(forms.Form):
 
     def save(self, commit=False):
         """
-        Save the user data into the database.
+        Save the user data into the database with a single INSERT.
+
+        Taken usernames and emails are not looked up first: the unique indexes on auth_user
+        reject them, even when two signups race, and the error is added to the form.
 
         :param commit: bool - Whether to save the data to the database immediately.
-        :return: User - The user object created and saved in the database.
+        :return: User - The user object created and saved in the database, or None if the
+            username or email is already in use.
         """
         password = make_password(self.cleaned_data['password'])
         email = self.cleaned_data['email']
-        user = User.objects.create(username=self.cleaned_data['username'], password=password, email=email)
+        user = User(username=self.cleaned_data['username'], password=password, email=email)
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+        except IntegrityError as error:
+            field = taken_field(error)
+            if field is None:
+                raise
+            self.add_error(field, f'This {field} is already in use.')
+            return None
         return user
 
 
 class CustomLoginForm(forms.Form):
     """
     Form for logging in users.
+
+    The credentials are checked once, in clean(), and the authenticated user is kept on
+    the form, so a login hashes the password a single time.
     """
     username = forms.CharField(max_length=150, help_text='Enter your username')
     password = forms.CharField(widget=forms.PasswordInput, help_text='Enter your password')
 
+    error_messages = {
+        'invalid_login': "Invalid username or password.",
+    }
+
+    def __init__(self, *args, request=None, **kwargs):
+        self.request = request
+        self.user_cache = None
+        super().__init__(*args, **kwargs)
 
     def clean(self):
         """
-        Clean the form data by checking the username and password. 
+        Authenticate the username and password.
         Return the cleaned data after validation.
         """
         cleaned_data = super().clean()
         username = cleaned_data.get('username')
         password = cleaned_data.get('password')
-        user = User.objects.filter(username=username).exists()
-        if not user:
-            self.add_error('username', "Invalid username.")
-            return cleaned_data
-
-        user = authenticate(username=username, password=password)
-        
-        if user is None:
-            self.add_error('password', "Authentication failed. Invalid password.")
+        if username is not None and password:
+            # An unknown username costs a hash too, so both failures take as long.
+            self.user_cache = authenticate(self.request, username=username, password=password)
+            if self.user_cache is None:
+                raise ValidationError(self.error_messages['invalid_login'], code='invalid_login')
 
         return cleaned_data
 
     def save(self):
         """
-        Authenticate the user and return the authenticated user.
+        Return the user authenticated by clean().
 
         Returns:
-            user: The authenticated user if successful.
+            user: The authenticated user.
         """
-        username = self.cleaned_data['username']
-        password = self.cleaned_data['password']
-
-        # Authenticate user
-        user = authenticate(username=username, password=password)
-
-        if user is None:
-            raise forms.ValidationError("Invalid username or password.")
-
-        return user
+        return self.user_cache
@@ -0,0 +1,153 @@
+"""
+Identity snapshots for library_management application.
+
+What a request needs to know about its user besides the User row (the borrower profile
+id, the staff flag and the permission set) is loaded once and cached per user as an
+Identity. IdentityBackend answers permission checks (PermissionRequiredMixin, has_perm,
+the templates' perms) from it, and IdentityMiddleware exposes it as request.borrower,
+loaded on first use. The signals drop a user's snapshot when their borrower profile,
+staff flag, groups or permissions change.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject
+
+from .models import Borrower
+
+
+class Identity:
+    """
+    A user's borrower profile id, staff flag and permissions, as of when it was loaded.
+    """
+    def __init__(self, user_id=None, borrower_id=None, is_staff=False, permissions=frozenset()):
+        self.user_id = user_id
+        self.borrower_id = borrower_id
+        self.is_staff = is_staff
+        self.permissions = frozenset(permissions)
+
+    def __repr__(self):
+        return f'<Identity user={self.user_id} borrower={self.borrower_id} staff={self.is_staff}>'
+
+    @property
+    def is_borrower(self):
+        """
+        Whether the user has a borrower profile.
+        """
+        return self.borrower_id is not None
+
+    def has_perm(self, perm):
+        """
+        Return whether the user has the permission, as 'app_label.codename'.
+        """
+        return perm in self.permissions
+
+    def has_perms(self, perms):
+        """
+        Return whether the user has every one of the permissions.
+        """
+        return all(perm in self.permissions for perm in perms)
+
+
+ANONYMOUS = Identity()
+
+
+def get_identity_key(user_id):
+    """
+    Return the cache key of a user's identity snapshot.
+    """
+    return f'book_management:identity:{user_id}'
+
+
+def load_identity(user):
+    """
+    Read a user's identity from the database, in two queries.
+    """
+    if user.is_superuser:
+        permissions = Permission.objects.all()
+    else:
+        permissions = Permission.objects.filter(Q(user=user) | Q(group__user=user))
+    permissions = permissions.values_list('content_type__app_label', 'codename').distinct()
+    return Identity(
+        user_id=user.pk,
+        borrower_id=Borrower.objects.filter(user_id=user.pk).values_list('id', flat=True).first(),
+        is_staff=user.is_staff,
+        permissions={f'{app_label}.{codename}' for app_label, codename in permissions},
+    )
+
+
+def get_identity(user):
+    """
+    Return the identity of a user: from the user object if it was already looked up, else
+    from the cache, else from the database. Anonymous and inactive users get an empty one.
+    """
+    if not user.is_authenticated or not user.is_active:
+        return ANONYMOUS
+    identity = user.__dict__.get('_identity')
+    if identity is None:
+        key = get_identity_key(user.pk)
+        identity = cache.get(key)
+        if identity is None:
+            identity = load_identity(user)
+            cache.set(key, identity, getattr(settings, 'IDENTITY_CACHE_TIMEOUT', 300))
+        user._identity = identity
+    return identity
+
+
+def delete_identities(*user_ids):
+    """
+    Drop the cached identities of the given users.
+    """
+    cache.delete_many([get_identity_key(user_id) for user_id in user_ids])
+
+
+def invalidate_identities(*user_ids):
+    """
+    Drop the cached identities of the given users now and again when the current transaction
+    commits, so a snapshot loaded from the old rows before the commit does not outlive it.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if user_ids:
+        delete_identities(*user_ids)
+        transaction.on_commit(lambda: delete_identities(*user_ids))
+
+
+def get_member_ids(*group_ids):
+    """
+    Return the ids of the users in any of the given groups.
+    """
+    return list(User.groups.through.objects.filter(group_id__in=group_ids).values_list('user_id', flat=True))
+
+
+class IdentityBackend(ModelBackend):
+    """
+    ModelBackend that reads permissions from the cached identity snapshot.
+    """
+    def get_all_permissions(self, user_obj, obj=None):
+        if obj is not None:
+            return set()
+        return set(get_identity(user_obj).permissions)
+
+
+class IdentityMiddleware:
+    """
+    Set request.borrower to the user's identity, loaded when it is first used.
+
+    Must come after AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.borrower = SimpleLazyObject(lambda: get_identity(request.user))
+        # Under ASGI this returns the view's coroutine, which the caller awaits.
+        return self.get_response(request)
@@ -0,0 +1,55 @@
+"""
+Management command to move old returned borrowings to the archive table.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from book_management.archive import archive_borrowings
+
+
+class Command(BaseCommand):
+    """
+    Move the returned borrowings borrowed before the horizon to ArchivedBorrowing in chunks
+    of one transaction each, optionally appending them to a gzipped JSON Lines file.
+    Interrupted runs are resumed by running the command again.
+    """
+    help = 'Move returned borrowings older than a horizon to the archive table.'
+
+    def add_arguments(self, parser):
+        horizon = parser.add_mutually_exclusive_group()
+        horizon.add_argument('--before', type=datetime.date.fromisoformat, help='Archive borrowings borrowed before this date (YYYY-MM-DD).')
+        horizon.add_argument('--older-than-days', type=int, help='Archive borrowings borrowed more than this many days ago (default: ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows moved per transaction (default: 5000).')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches; run again to carry on.')
+        parser.add_argument('--export', help='Append the archived rows to this gzipped JSON Lines file (e.g. archive.jsonl.gz).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['max_batches'] is not None and options['max_batches'] < 1:
+            raise CommandError('--max-batches must be at least 1.')
+        horizon = options['before']
+        if horizon is None:
+            days = options['older_than_days']
+            if days is None:
+                days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 730)
+            if days < 0:
+                raise CommandError('--older-than-days must not be negative.')
+            horizon = timezone.localdate() - datetime.timedelta(days=days)
+
+        started = time.monotonic()
+        moved = archive_borrowings(
+            horizon,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            export=options['export'],
+            log=self.stdout.write,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} borrowings borrowed before {horizon.isoformat()} in {elapsed:.1f}s.'
+        ))
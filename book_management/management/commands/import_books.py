@@ -0,0 +1,191 @@
+"""
+Management command to bulk import books from CSV or XLSX files.
+"""
+import csv
+import datetime
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from book_management.models import Book
+from book_management.page_cache import invalidate_catalogue
+from book_management.pagination import invalidate_counts
+from book_management.validators import normalize_isbn
+
+REQUIRED_COLUMNS = ('title', 'author', 'isbn', 'publication_date')
+UPDATE_FIELDS = ['title', 'author', 'publication_date']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'available'}
+
+
+def read_csv(path):
+    """
+    Yield the header and then each row of a CSV file, one at a time.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        yield from csv.reader(csv_file)
+
+
+def read_xlsx(path):
+    """
+    Yield the header and then each row of the first worksheet of an XLSX file, one at a time.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+READERS = {
+    'csv': read_csv,
+    'xlsx': read_xlsx,
+}
+
+
+def clean_row(row):
+    """
+    Validate and normalise one row mapped by lower-cased column name.
+
+    Returns:
+        Book: An unsaved Book built from the row.
+
+    Raises:
+        ValidationError: If a value is missing or invalid.
+    """
+    values = {column: row.get(column) for column in REQUIRED_COLUMNS}
+    missing = [column for column, value in values.items() if value in (None, '')]
+    if missing:
+        raise ValidationError(f"Missing {', '.join(missing)}.")
+
+    title = str(values['title']).strip()
+    author = str(values['author']).strip()
+    if len(title) > 255 or len(author) > 255:
+        raise ValidationError("Title and author must be 255 characters or fewer.")
+
+    publication_date = values['publication_date']
+    if isinstance(publication_date, datetime.datetime):
+        publication_date = publication_date.date()
+    elif not isinstance(publication_date, datetime.date):
+        try:
+            publication_date = parse_date(str(publication_date).strip())
+        except ValueError:
+            publication_date = None
+        if publication_date is None:
+            raise ValidationError(f"Invalid publication_date '{values['publication_date']}'.")
+
+    isbn = values['isbn']
+    if isinstance(isbn, float) and isbn.is_integer():
+        # Spreadsheets often store ISBN-13s as numbers.
+        isbn = int(isbn)
+
+    availability_status = row.get('availability_status')
+    if availability_status in (None, ''):
+        availability_status = True
+    elif not isinstance(availability_status, bool):
+        availability_status = str(availability_status).strip().lower() in TRUE_VALUES
+
+    return Book(
+        title=title,
+        author=author,
+        ISBN=normalize_isbn(isbn),
+        publication_date=publication_date,
+        availability_status=availability_status,
+    )
+
+
+class Command(BaseCommand):
+    """
+    Stream books from a CSV or XLSX file into the catalogue, inserting new ISBNs and
+    updating title, author and publication date of existing ones.
+    """
+    help = 'Bulk import books from a CSV or XLSX file, upserting on ISBN.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file with title, author, ISBN and publication_date columns.')
+        parser.add_argument('--format', choices=sorted(READERS), help='File format. Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per bulk upsert (default: 1000).')
+        parser.add_argument('--progress-every', type=int, default=100000, help='Report progress every N rows (default: 100000).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unsupported format '{file_format}'. Use --format csv or --format xlsx.")
+        if not os.path.exists(path):
+            raise CommandError(f"File '{path}' does not exist.")
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        progress_every = options['progress_every']
+        if progress_every < 1:
+            raise CommandError('--progress-every must be at least 1.')
+
+        rows = READERS[file_format](path)
+        header = next(rows, None)
+        if header is None:
+            raise CommandError('The file is empty.')
+        columns = [str(column or '').strip().lower() for column in header]
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise CommandError(f"Missing required columns: {', '.join(missing)}.")
+
+        started = time.monotonic()
+        processed = imported = skipped = 0
+        # Keyed by ISBN so a repeated ISBN within one batch is written once (last row wins).
+        batch = {}
+        for line_number, values in enumerate(rows, start=2):
+            if not any(value not in (None, '') for value in values):
+                continue
+            processed += 1
+            if processed % progress_every == 0:
+                self.report(processed, started)
+            try:
+                book = clean_row(dict(zip(columns, values)))
+            except ValidationError as error:
+                skipped += 1
+                self.stderr.write(f"Line {line_number}: {' '.join(error.messages)}")
+                continue
+
+            batch[book.ISBN] = book
+            if len(batch) >= batch_size:
+                imported += self.write_batch(batch)
+
+        imported += self.write_batch(batch)
+        # bulk_create sends no signals, so drop the cached counts and pages here.
+        invalidate_counts()
+        invalidate_catalogue()
+        self.report(processed, started)
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} books, skipped {skipped} invalid rows.'))
+
+    def write_batch(self, batch):
+        """
+        Upsert the batched books on ISBN and empty the batch.
+
+        Returns:
+            int: The number of books written.
+        """
+        if not batch:
+            return 0
+        with transaction.atomic():
+            Book.objects.bulk_create(
+                batch.values(),
+                update_conflicts=True,
+                unique_fields=['ISBN'],
+                update_fields=UPDATE_FIELDS,
+            )
+        written = len(batch)
+        batch.clear()
+        return written
+
+    def report(self, processed, started):
+        """
+        Write the rows processed so far and the throughput.
+        """
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f'{processed} rows in {elapsed:.1f}s ({processed / elapsed:.0f} rows/s)')
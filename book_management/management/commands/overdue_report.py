@@ -0,0 +1,34 @@
+"""
+Management command to refresh and print the overdue-loans report.
+"""
+from django.core.management.base import BaseCommand
+
+from book_management.models import OverdueLoan
+from book_management.overdue import refresh_overdue_report
+
+
+class Command(BaseCommand):
+    """
+    Refresh the overdue-loans summary incrementally and list the overdue loans.
+    """
+    help = 'Refresh the overdue-loans summary with the loans that changed since the last run, then list the overdue loans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild the summary from every open loan.')
+        parser.add_argument('--quiet', action='store_true', help='Only refresh the summary; do not list the loans.')
+
+    def handle(self, *args, **options):
+        result = refresh_overdue_report(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {result['added']} and removed {result['removed']} overdue loans as of {result['as_of']}."
+        ))
+        if options['quiet']:
+            return
+        loans = OverdueLoan.objects.select_related('borrowing__book', 'borrowing__borrower').only(
+            'due_date', 'borrowing__book__title', 'borrowing__borrower__name',
+        ).order_by('due_date', 'borrowing_id')
+        for loan in loans.iterator():
+            book = loan.borrowing.book.title if loan.borrowing.book else '(removed)'
+            borrower = loan.borrowing.borrower.name if loan.borrowing.borrower else '(removed)'
+            days = (result['as_of'] - loan.due_date).days
+            self.stdout.write(f'{loan.due_date}  {days:>4} days  {book}  ({borrower})')
@@ -0,0 +1,327 @@
+"""
+Request metrics for library_management application.
+
+MetricsMiddleware times every request and counts the SQL queries it runs, per resolved
+URL name and status code. The figures are kept in memory by each process and written to
+a file of its own in METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, so the metrics
+endpoint can add up every worker process without any locking between them. The endpoint
+serves them in the Prometheus text format to staff users, or to a scraper presenting
+METRICS_TOKEN as a bearer token. The files of processes that are no longer running are
+deleted when the metrics are collected.
+"""
+import contextvars
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.generic import View
+
+# Prometheus' default latency buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger(__name__)
+
+current_queries = contextvars.ContextVar('current_queries', default=None)
+
+
+class QueryTimer:
+    """
+    The number of SQL queries a request ran and the seconds they took.
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each query to the current request's QueryTimer.
+    """
+    timer = current_queries.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.count += 1
+        timer.seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """
+    Time the queries of every new database connection. The timer is found through a
+    context variable, so it also sees queries run for async views in worker threads.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def empty_series():
+    """
+    Return the figures of a (view, status) pair that has not been seen yet.
+    """
+    return {'count': 0, 'seconds': 0.0, 'buckets': [0] * len(BUCKETS), 'queries': 0, 'sql_seconds': 0.0}
+
+
+def merge_series(total, series):
+    """
+    Add series into total.
+    """
+    total['count'] += series['count']
+    total['seconds'] += series['seconds']
+    total['buckets'] = [a + b for a, b in zip(total['buckets'], series['buckets'])]
+    total['queries'] += series['queries']
+    total['sql_seconds'] += series['sql_seconds']
+
+
+def is_running(pid):
+    """
+    Return whether a process with the given pid is running on this host.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, under another user.
+        pass
+    return True
+
+
+class MetricsRegistry:
+    """
+    Per-process request metrics, shared with the other processes through METRICS_DIR.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """
+        Start empty, as a new process.
+        """
+        self.pid = os.getpid()
+        self.series = {}
+        self.flushed_at = time.monotonic()
+        # The start time keeps a reused pid from overwriting an earlier process' file.
+        self.filename = f'{self.pid}-{time.time_ns()}.json'
+
+    def get_directory(self):
+        """
+        Return the directory the processes share their metrics through.
+        """
+        return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'library_management_metrics')
+
+    def observe(self, view, status, seconds, queries, sql_seconds):
+        """
+        Record one request.
+
+        Args:
+            view: The resolved URL name.
+            status: The response status code.
+            seconds: The time taken to produce the response.
+            queries: The number of SQL queries run.
+            sql_seconds: The time spent in those queries.
+        """
+        with self.lock:
+            if os.getpid() != self.pid:
+                # A forked worker does not report its parent's requests.
+                self.start()
+            series = self.series.setdefault((view, str(status)), empty_series())
+            series['count'] += 1
+            series['seconds'] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+            series['queries'] += queries
+            series['sql_seconds'] += sql_seconds
+            # Checked and reset together, so only one thread flushes per interval.
+            due = time.monotonic() - self.flushed_at >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+            if due:
+                self.flushed_at = time.monotonic()
+        if due:
+            try:
+                self.flush()
+            except OSError:
+                # Metrics never fail the request they measure.
+                logger.exception('Could not write the request metrics.')
+
+    def flush(self):
+        """
+        Write this process' metrics to its file in the shared directory.
+        """
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            rows = [[view, status, series] for (view, status), series in self.series.items()]
+            filename = self.filename
+        directory = self.get_directory()
+        os.makedirs(directory, exist_ok=True)
+        # A temporary file of its own, so concurrent flushes never share one.
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'{filename}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as metrics_file:
+                json.dump(rows, metrics_file)
+            os.replace(temp_path, os.path.join(directory, filename))
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def prune(self, directory, name):
+        """
+        Delete the metrics file name if the process that wrote it is no longer running.
+
+        Returns:
+            bool: Whether the file was deleted.
+        """
+        pid = name.split('-', 1)[0]
+        if not pid.isdigit() or int(pid) == self.pid or is_running(int(pid)):
+            return False
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def collect(self):
+        """
+        Return the metrics of every process, added up per (view, status).
+        """
+        self.flush()
+        totals = {}
+        directory = self.get_directory()
+        for name in os.listdir(directory):
+            if not name.endswith('.json') or self.prune(directory, name):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as metrics_file:
+                    rows = json.load(metrics_file)
+            except (OSError, ValueError):
+                continue
+            for view, status, series in rows:
+                merge_series(totals.setdefault((view, status), empty_series()), series)
+        return totals
+
+    def reset(self):
+        """
+        Forget this process' metrics and delete every process' file.
+        """
+        with self.lock:
+            self.start()
+        directory = self.get_directory()
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+
+
+registry = MetricsRegistry()
+
+
+def escape_label(value):
+    """
+    Escape a label value for the Prometheus text format.
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(totals):
+    """
+    Return totals in the Prometheus text exposition format.
+    """
+    lines = [
+        '# HELP library_http_request_duration_seconds Time taken to produce a response, by URL name and status.',
+        '# TYPE library_http_request_duration_seconds histogram',
+    ]
+    items = sorted(totals.items())
+    for (view, status), series in items:
+        labels = f'view="{escape_label(view)}",status="{status}"'
+        for bound, count in zip(BUCKETS, series['buckets']):
+            lines.append(f'library_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'library_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+        lines.append(f'library_http_request_duration_seconds_sum{{{labels}}} {series["seconds"]}')
+        lines.append(f'library_http_request_duration_seconds_count{{{labels}}} {series["count"]}')
+    for name, key, help_text in (
+        ('library_db_queries_total', 'queries', 'SQL queries run while handling requests, by URL name and status.'),
+        ('library_db_query_seconds_total', 'sql_seconds', 'Time spent in SQL queries while handling requests, by URL name and status.'),
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (view, status), series in items:
+            lines.append(f'{name}{{view="{escape_label(view)}",status="{status}"}} {series[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, query count and SQL time of every request. It should come first
+    in MIDDLEWARE, so the other middleware's work is included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer, started = QueryTimer(), time.perf_counter()
+        token = current_queries.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.observe(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer, started = QueryTimer(), time.perf_counter()
+        token = current_queries.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.observe(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def observe(self, request, response, seconds, timer):
+        """
+        Record the request under its URL name, or 'unresolved' if it matched none.
+        """
+        match = request.resolver_match
+        registry.observe(match.view_name if match else 'unresolved', response.status_code, seconds, timer.count, timer.seconds)
+
+
+class MetricsView(View):
+    """
+    Serve the request metrics of every process in the Prometheus text format, to staff
+    users or to a request with the header 'Authorization: Bearer <METRICS_TOKEN>'.
+    """
+    def has_token(self, request):
+        """
+        Check the request's bearer token against METRICS_TOKEN, if one is set.
+        """
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        header = request.headers.get('Authorization', '')
+        return bool(token) and header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], token)
+
+    def get(self, request, *args, **kwargs):
+        if not (request.user.is_authenticated and request.user.is_staff) and not self.has_token(request):
+            return HttpResponseForbidden('Staff only.')
+        return HttpResponse(render_metrics(registry.collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,83 @@
+"""
+Search indexes for the book catalogue.
+
+Postgres gets pg_trgm GIN indexes on UPPER(title) and UPPER(author), which the
+``icontains`` lookups used by ``book_management.search`` can use directly.
+SQLite gets an external-content FTS5 table with the trigram tokenizer, kept in
+sync with ``book_management_book`` by triggers.
+"""
+
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS book_title_trgm_idx '
+    'ON book_management_book USING gin (UPPER(title) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS book_author_trgm_idx '
+    'ON book_management_book USING gin (UPPER(author) gin_trgm_ops)',
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS book_title_trgm_idx',
+    'DROP INDEX IF EXISTS book_author_trgm_idx',
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_management_book_fts USING fts5("
+    "title, author, content='book_management_book', content_rowid='id', "
+    "tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS book_management_book_fts_ai "
+    "AFTER INSERT ON book_management_book BEGIN "
+    "INSERT INTO book_management_book_fts(rowid, title, author) "
+    "VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_management_book_fts_ad "
+    "AFTER DELETE ON book_management_book BEGIN "
+    "INSERT INTO book_management_book_fts(book_management_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_management_book_fts_au "
+    "AFTER UPDATE OF title, author ON book_management_book BEGIN "
+    "INSERT INTO book_management_book_fts(book_management_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO book_management_book_fts(rowid, title, author) "
+    "VALUES (new.id, new.title, new.author); END",
+    "INSERT INTO book_management_book_fts(book_management_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS book_management_book_fts_ai',
+    'DROP TRIGGER IF EXISTS book_management_book_fts_ad',
+    'DROP TRIGGER IF EXISTS book_management_book_fts_au',
+    'DROP TABLE IF EXISTS book_management_book_fts',
+]
+
+
+def run_for_vendor(postgres_statements, sqlite_statements):
+    """
+    Build a RunPython callable that executes the statements for the current database vendor.
+    """
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            statements = postgres_statements
+        elif vendor == 'sqlite':
+            statements = sqlite_statements
+        else:
+            statements = []
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_management', '0006_alter_borrowing_book_alter_borrowing_borrower'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_REVERSE, SQLITE_REVERSE),
+        ),
+    ]
@@ -0,0 +1,87 @@
+"""
+Move borrower rights from per-user permissions to the "Borrower" group.
+"""
+
+from django.contrib.auth.management import create_permissions
+from django.db import migrations
+
+BORROWER_GROUP = 'Borrower'
+BORROWER_PERMISSIONS = ('can_borrow', 'can_return')
+
+
+def get_borrower_permissions(apps):
+    """
+    Return the borrower permissions, creating them first on a fresh database where
+    post_migrate has not run yet.
+    """
+    app_config = apps.get_app_config('book_management')
+    app_config.models_module = True
+    create_permissions(app_config, apps=apps, verbosity=0)
+    app_config.models_module = None
+
+    Permission = apps.get_model('auth', 'Permission')
+    return list(Permission.objects.filter(
+        content_type__app_label='book_management',
+        codename__in=BORROWER_PERMISSIONS,
+    ))
+
+
+def move_grants_to_group(apps, schema_editor):
+    """
+    Create the Borrower group, add every borrower and every user holding a per-user
+    borrower permission to it, and delete the per-user grants.
+    """
+    Group = apps.get_model('auth', 'Group')
+    User = apps.get_model('auth', 'User')
+    Borrower = apps.get_model('book_management', 'Borrower')
+    permissions = get_borrower_permissions(apps)
+
+    group, created = Group.objects.get_or_create(name=BORROWER_GROUP)
+    group.permissions.add(*permissions)
+
+    UserPermission = User.user_permissions.through
+    grants = UserPermission.objects.filter(permission__in=permissions)
+    user_ids = set(grants.values_list('user_id', flat=True))
+    user_ids.update(Borrower.objects.values_list('user_id', flat=True))
+
+    UserGroup = User.groups.through
+    UserGroup.objects.bulk_create(
+        [UserGroup(user_id=user_id, group_id=group.pk) for user_id in user_ids],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+    grants.delete()
+
+
+def move_grants_to_users(apps, schema_editor):
+    """
+    Give every member of the Borrower group per-user borrower permissions and delete the group.
+    """
+    Group = apps.get_model('auth', 'Group')
+    User = apps.get_model('auth', 'User')
+    group = Group.objects.filter(name=BORROWER_GROUP).first()
+    if group is None:
+        return
+
+    permissions = get_borrower_permissions(apps)
+    UserPermission = User.user_permissions.through
+    user_ids = User.groups.through.objects.filter(group=group).values_list('user_id', flat=True)
+    UserPermission.objects.bulk_create(
+        [UserPermission(user_id=user_id, permission_id=permission.pk) for user_id in user_ids for permission in permissions],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+    group.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('book_management', '0007_book_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_grants_to_group, move_grants_to_users),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-17 06:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_management', '0008_borrower_group'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='borrowing',
+            name='book',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='book_management.book'),
+        ),
+        migrations.AlterField(
+            model_name='borrowing',
+            name='borrower',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='book_management.borrower'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('availability_status', True)), fields=['title'], name='book_available_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['borrow_date', 'id'], name='borrowing_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['borrower', 'return_date', 'borrow_date'], name='borrowing_borrower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['book', 'return_date'], name='borrowing_book_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-17 06:41
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# Adding a column makes SQLite rebuild book_management_book, which drops the triggers
+# that keep the search table in sync; put them back on either side of the rebuild.
+search_indexes = import_module('book_management.migrations.0007_book_search_indexes')
+restore_search_triggers = search_indexes.run_for_vendor([], search_indexes.SQLITE_FORWARD)
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Compute the initial loan counts from the existing borrowings in one UPDATE.
+    """
+    Book = apps.get_model('book_management', 'Book')
+    Borrowing = apps.get_model('book_management', 'Borrowing')
+
+    def count_of(queryset, field):
+        counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Book.objects.update(total_loans=count_of(Borrowing.objects.all(), 'book'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_management', '0009_circulation_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='book',
+            name='total_loans',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['total_loans'], name='book_total_loans_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2 on 2026-10-17 07:01
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F
+import django.db.models.deletion
+
+
+def fill_due_dates(apps, schema_editor):
+    """
+    Give existing borrowings a due date LOAN_PERIOD_DAYS after they were borrowed, in one UPDATE.
+    """
+    Borrowing = apps.get_model('book_management', 'Borrowing')
+    loan_period = timedelta(days=getattr(settings, 'LOAN_PERIOD_DAYS', 14))
+    Borrowing.objects.update(due_date=ExpressionWrapper(F('borrow_date') + loan_period, output_field=models.DateField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_management', '0010_circulation_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueLoan',
+            fields=[
+                ('borrowing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='book_management.borrowing')),
+                ('due_date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OverdueReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField(null=True)),
+                ('refreshed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='borrowing',
+            name='due_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_due_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='borrowing',
+            name='due_date',
+            field=models.DateField(blank=True),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['due_date', 'id'], name='borrowing_open_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='overdueloan',
+            name='borrower',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='book_management.borrower'),
+        ),
+        migrations.AddIndex(
+            model_name='overdueloan',
+            index=models.Index(fields=['due_date', 'borrowing'], name='overdue_due_idx'),
+        ),
+    ]
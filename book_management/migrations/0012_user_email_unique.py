@@ -0,0 +1,27 @@
+"""
+Make user email addresses unique, ignoring case, with a unique index on auth_user.
+
+Users without an email address (such as superusers made from the command line) are left
+out of the index. The migration fails if two users already share an address; merge or
+change them first.
+"""
+
+from django.db import migrations
+
+EMAIL_INDEX = 'auth_user_email_ci_uniq'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('book_management', '0011_borrowing_due_date_overdue'),
+    ]
+
+    operations = [
+        # The same statement works on PostgreSQL and SQLite.
+        migrations.RunSQL(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {EMAIL_INDEX} ON auth_user (LOWER(email)) WHERE email <> ''",
+            f'DROP INDEX IF EXISTS {EMAIL_INDEX}',
+        ),
+    ]
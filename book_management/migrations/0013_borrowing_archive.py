@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-17 07:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_management', '0012_user_email_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowingArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horizon', models.DateField(null=True)),
+                ('archived_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedBorrowing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrow_date', models.DateField()),
+                ('due_date', models.DateField()),
+                ('return_date', models.DateField()),
+                ('book', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_borrowings', to='book_management.book')),
+                ('borrower', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_borrowings', to='book_management.borrower')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedborrowing',
+            index=models.Index(fields=['borrow_date', 'id'], name='archive_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedborrowing',
+            index=models.Index(fields=['borrower', 'borrow_date'], name='archive_borrower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedborrowing',
+            index=models.Index(fields=['book', 'borrow_date'], name='archive_book_idx'),
+        ),
+    ]
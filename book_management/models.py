@@ -1,12 +1,58 @@
 """
 Models for library_management application.
 """
+from datetime import timedelta
 
+from django.conf import settings
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User, AbstractUser
 from django.core.exceptions import ValidationError
 
-class Book(models.Model):
+def due_date_for(borrow_date):
+    """
+    Return the date a loan starting on borrow_date is due back, LOAN_PERIOD_DAYS later.
+    """
+    return borrow_date + timedelta(days=getattr(settings, 'LOAN_PERIOD_DAYS', 14))
+
+
+class BookQuerySet(models.QuerySet):
+    """
+    QuerySet for books with named projections for the views.
+    """
+    def for_listing(self):
+        """
+        Load only the columns the book listings display.
+        """
+        return self.only('title', 'author', 'availability_status', 'total_loans')
+
+    def for_detail(self):
+        """
+        Load only the columns the book detail page displays.
+        """
+        return self.only('title', 'author', 'ISBN', 'publication_date', 'availability_status')
+
+
+class CounterFieldsMixin:
+    """
+    Model mixin for denormalised counters that are only written with F() expressions.
+    A plain save() of an existing row leaves counter_fields out of the UPDATE, so editing
+    a record cannot overwrite a concurrent increment with a stale value.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields and field.attname not in deferred
+            ]
+        return super().save(*args, **kwargs)
+
+
+class Book(CounterFieldsMixin, models.Model):
     """
     Model for books.
     """
@@ -15,6 +61,24 @@ class Book(models.Model):
     ISBN = models.CharField(max_length=13, unique=True)
     publication_date = models.DateField()
     availability_status = models.BooleanField(default=True)
+    # Number of borrowings of this book, kept up to date by the circulation service.
+    total_loans = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BookQuerySet.as_manager()
+    counter_fields = ('total_loans',)
+
+    class Meta:
+        """
+        Meta class for the Book model.
+        """
+        indexes = [
+            # Available-books listings filter on availability and sort by title. A partial
+            # index rather than (availability_status, title): the filter is compiled to a bare
+            # boolean column, which SQLite can only match against an index condition.
+            models.Index(fields=['title'], condition=models.Q(availability_status=True), name='book_available_title_idx'),
+            # Most-borrowed titles.
+            models.Index(fields=['total_loans'], name='book_total_loans_idx'),
+        ]
     
     def has_pending_returns(self):
         """
@@ -38,6 +102,21 @@ class Book(models.Model):
         return super().delete(*args, **kwargs)
 
 
+class BorrowerQuerySet(models.QuerySet):
+    """
+    QuerySet for borrowers.
+    """
+    def with_open_loans(self):
+        """
+        Annotate each borrower with open_loans, the number of their borrowings not yet
+        returned, counted from the open-loan range of the borrowing_borrower_idx index.
+        """
+        open_loans = Borrowing.objects.filter(
+            borrower=OuterRef('pk'), return_date__isnull=True,
+        ).order_by().values('borrower').annotate(count=Count('pk')).values('count')
+        return self.annotate(open_loans=Coalesce(Subquery(open_loans, output_field=IntegerField()), Value(0)))
+
+
 class Borrower(models.Model):
     """
     Model for borrowers.
@@ -46,6 +125,8 @@ class Borrower(models.Model):
     name = models.CharField(max_length=255)
     phone_number = models.CharField(max_length=15)
 
+    objects = BorrowerQuerySet.as_manager()
+
     def has_pending_returns(self):
         """
         Check if the borrower has any pending returns
@@ -67,15 +148,51 @@ class Borrower(models.Model):
             raise ValidationError("Cannot delete borrower with pending returns.")
         return super().delete(*args, **kwargs)
 
+class BorrowingQuerySet(models.QuerySet):
+    """
+    QuerySet for borrowings with named projections for the views. Each projection joins
+    the related rows its template reads, so a page costs one query rather than 1 + 2N.
+    """
+    def for_listing(self):
+        """
+        Join the book and borrower, loading only the columns the borrowing lists display.
+        """
+        return self.select_related('book', 'borrower').only(
+            'borrow_date', 'due_date', 'return_date', 'book', 'borrower',
+            'book__title', 'book__author', 'borrower__name',
+        )
+
+    def for_detail(self):
+        """
+        Join the book, borrower and user, loading only the columns the borrowing detail page displays.
+        """
+        return self.select_related('book', 'borrower__user').only(
+            'borrow_date', 'due_date', 'return_date', 'book', 'borrower',
+            'book__title', 'book__author', 'book__ISBN', 'book__publication_date',
+            'borrower__name', 'borrower__phone_number', 'borrower__user',
+            'borrower__user__username', 'borrower__user__email',
+        )
+
+
 class Borrowing(models.Model):
     """
     Model for borrowing books.
     """
-    borrower = models.ForeignKey(Borrower, on_delete=models.SET_NULL, null=True)
-    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True)
+    # The single-column foreign key indexes are covered by the composite indexes below.
+    borrower = models.ForeignKey(Borrower, on_delete=models.SET_NULL, null=True, db_index=False)
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, db_index=False)
     borrow_date = models.DateField()
+    # Left blank, it is filled in from the borrow date and LOAN_PERIOD_DAYS on save.
+    due_date = models.DateField(blank=True)
     return_date = models.DateField(null=True, blank=True)
-    
+
+    objects = BorrowingQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self.due_date is None and self.borrow_date is not None:
+            self.due_date = due_date_for(self._meta.get_field('borrow_date').to_python(self.borrow_date))
+        return super().save(*args, **kwargs)
+
     class Meta:
         """
         Meta class for the Borrowing model.
@@ -84,3 +201,79 @@ class Borrowing(models.Model):
             ("can_borrow", "Can borrow books"),
             ("can_return", "Can return books"),           
             ]
+        indexes = [
+            # Pending lists: open loans in borrow date order.
+            models.Index(fields=['borrow_date', 'id'], condition=models.Q(return_date__isnull=True), name='borrowing_open_idx'),
+            # Open loans by due date: the overdue report's range scan of loans that fell due.
+            models.Index(fields=['due_date', 'id'], condition=models.Q(return_date__isnull=True), name='borrowing_open_due_idx'),
+            # Borrower-scoped pending and history lists, and Borrower.has_pending_returns().
+            models.Index(fields=['borrower', 'return_date', 'borrow_date'], name='borrowing_borrower_idx'),
+            # Book.has_pending_returns() and the book's loan history.
+            models.Index(fields=['book', 'return_date'], name='borrowing_book_idx'),
+        ]
+
+
+class ArchivedBorrowing(models.Model):
+    """
+    Returned borrowings moved out of the Borrowing table by
+    book_management.archive.archive_borrowings(). Rows keep the id they had as borrowings,
+    so links to them still resolve.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    borrower = models.ForeignKey(Borrower, on_delete=models.SET_NULL, null=True, db_index=False, related_name='archived_borrowings')
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, db_index=False, related_name='archived_borrowings')
+    borrow_date = models.DateField()
+    due_date = models.DateField()
+    return_date = models.DateField()
+
+    objects = BorrowingQuerySet.as_manager()
+
+    class Meta:
+        """
+        Meta class for the ArchivedBorrowing model.
+        """
+        indexes = [
+            # History pages in borrow date order, and the archive's borrow date range.
+            models.Index(fields=['borrow_date', 'id'], name='archive_date_idx'),
+            # Borrower-scoped history lists.
+            models.Index(fields=['borrower', 'borrow_date'], name='archive_borrower_idx'),
+            # Book.total_loans reconciliation, and clearing the book when it is deleted.
+            models.Index(fields=['book', 'borrow_date'], name='archive_book_idx'),
+        ]
+
+
+class BorrowingArchive(models.Model):
+    """
+    Bookkeeping for the borrowing archive: a single row recording the horizon before which
+    returned borrowings may have been moved to ArchivedBorrowing.
+    """
+    horizon = models.DateField(null=True)
+    archived_at = models.DateTimeField(null=True)
+
+
+class OverdueReport(models.Model):
+    """
+    Bookkeeping for the overdue-loans summary: a single row recording the day it was last
+    refreshed for, so the report can tell when it is stale.
+    """
+    as_of = models.DateField(null=True)
+    refreshed_at = models.DateTimeField(null=True)
+
+
+class OverdueLoan(models.Model):
+    """
+    Summary table of the open loans that are past their due date, refreshed incrementally
+    by book_management.overdue.refresh_overdue_report().
+    """
+    borrowing = models.OneToOneField(Borrowing, on_delete=models.CASCADE, primary_key=True)
+    borrower = models.ForeignKey(Borrower, on_delete=models.SET_NULL, null=True)
+    due_date = models.DateField()
+
+    class Meta:
+        """
+        Meta class for the OverdueLoan model.
+        """
+        indexes = [
+            # The report lists the longest-overdue loans first.
+            models.Index(fields=['due_date', 'borrowing'], name='overdue_due_idx'),
+        ]
@@ -0,0 +1,91 @@
+"""
+Overdue-loans report for library_management application.
+
+The report reads the OverdueLoan summary table rather than the borrowings, so it never
+scans the loan history. refresh_overdue_report() brings the summary up to date without
+rereading the closed loans: it drops the listed loans that have since been returned or had
+their due date moved, and adds the open overdue loans not listed yet, found with a range
+scan of the open-loans-by-due-date index. Loans backdated or given an earlier due date
+since the previous refresh are therefore picked up too.
+
+Views that find the summary stale queue a refresh through claim_refresh(), so that at
+most one is queued every REFRESH_LOCK_TIMEOUT seconds however often the report is read.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Borrowing, OverdueLoan, OverdueReport
+
+BATCH_SIZE = 1000
+
+REFRESH_LOCK_KEY = 'book_management:overdue:refresh'
+REFRESH_LOCK_TIMEOUT = 300
+
+
+def get_overdue_report():
+    """
+    Return the OverdueReport bookkeeping row, creating it on first use.
+    """
+    report, created = OverdueReport.objects.get_or_create(pk=1)
+    return report
+
+
+def claim_refresh():
+    """
+    Return whether the caller should queue a refresh of the summary: True for the first
+    caller, then False for everyone until REFRESH_LOCK_TIMEOUT seconds have passed.
+    """
+    return cache.add(REFRESH_LOCK_KEY, 1, REFRESH_LOCK_TIMEOUT)
+
+
+def add_overdue(queryset):
+    """
+    Insert the borrowings of queryset into the summary, skipping those already listed.
+
+    Returns:
+        int: The number of borrowings read.
+    """
+    rows = [
+        OverdueLoan(borrowing_id=pk, borrower_id=borrower_id, due_date=due_date)
+        for pk, borrower_id, due_date in queryset.values_list('pk', 'borrower_id', 'due_date').iterator(chunk_size=BATCH_SIZE)
+    ]
+    OverdueLoan.objects.bulk_create(rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(rows)
+
+
+def refresh_overdue_report(today=None, full=False):
+    """
+    Bring the overdue-loans summary up to date for today.
+
+    Args:
+        today: The day to refresh for; defaults to the current local date.
+        full: Rebuild the summary from every open loan instead of refreshing it incrementally.
+
+    Returns:
+        dict: The number of loans 'added' and 'removed', and the 'as_of' date.
+    """
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        get_overdue_report()
+        # Serialise concurrent refreshes on the bookkeeping row.
+        report = OverdueReport.objects.select_for_update().get(pk=1)
+        if full:
+            OverdueLoan.objects.all().delete()
+
+        # Listed loans that were returned or whose due date was moved since they were listed.
+        changed = list(OverdueLoan.objects.filter(
+            Q(borrowing__return_date__isnull=False) | ~Q(borrowing__due_date=F('due_date'))
+        ).values_list('pk', flat=True))
+        OverdueLoan.objects.filter(pk__in=changed).delete()
+
+        # Loans that fell due, were backdated or changed since the last refresh, and are overdue.
+        added = add_overdue(Borrowing.objects.filter(
+            return_date__isnull=True, due_date__lt=today, overdueloan__isnull=True,
+        ))
+
+        report.as_of = today
+        report.refreshed_at = timezone.now()
+        report.save()
+    return {'added': added, 'removed': len(changed), 'as_of': today}
@@ -0,0 +1,198 @@
+"""
+Page cache for library_management application.
+
+The available-books lists are the busiest pages and show the same rows to everyone, so
+each page of results is cached under the view, the normalised search, sort and page
+number, and a catalogue version. Saving or deleting a book, borrowing and returning bump
+the version, which retires every cached page at once. The rendered HTML is not cached,
+since it carries the visitor's name and CSRF token.
+"""
+import asyncio
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .pagination import EstimatedPage
+
+CATALOGUE_VERSION_KEY = 'book_management:catalogue-version'
+
+
+def get_catalogue_version():
+    """
+    Return the current catalogue version.
+    """
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, 1, None)
+
+
+async def aget_catalogue_version():
+    """
+    Async version of get_catalogue_version().
+    """
+    return await cache.aget_or_set(CATALOGUE_VERSION_KEY, 1, None)
+
+
+def bump_catalogue_version():
+    """
+    Start a new catalogue version, so every cached page is ignored.
+    """
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 1, None)
+
+
+def invalidate_catalogue():
+    """
+    Bump the catalogue version now and again when the current transaction commits, so a
+    page cached from the old rows before the commit does not outlive it.
+    """
+    bump_catalogue_version()
+    transaction.on_commit(bump_catalogue_version)
+
+
+def get_or_compute(key, compute, timeout, lock_timeout=10, poll_interval=0.05):
+    """
+    Return the cached value for key, computing and caching it on a miss.
+
+    Only one process computes a missing key at a time: the others wait for its result
+    for up to lock_timeout seconds instead of all querying the database at once, and
+    compute it themselves (without caching) if it does not arrive.
+
+    Args:
+        key: The cache key.
+        compute: Callable returning the value to cache.
+        timeout: Seconds to keep the value.
+        lock_timeout: Seconds a computing process holds the lock, and others wait for it.
+        poll_interval: Seconds between checks while waiting.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
+
+
+async def aget_or_compute(key, compute, timeout, lock_timeout=10, poll_interval=0.05):
+    """
+    Async version of get_or_compute(); compute is a coroutine function.
+    """
+    value = await cache.aget(key)
+    if value is not None:
+        return value
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, lock_timeout):
+        try:
+            value = await compute()
+            await cache.aset(key, value, timeout)
+        finally:
+            await cache.adelete(lock_key)
+        return value
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+        value = await cache.aget(key)
+        if value is not None:
+            return value
+    return await compute()
+
+
+class CachedPageMixin:
+    """
+    ListView mixin that caches each page of results, keyed by the catalogue version and
+    the request's page_cache_params. The page's rows and the paginator's count are cached;
+    the template is still rendered per request.
+    """
+    page_cache_params = ('q', 'order_by', 'dir', 'page')
+
+    def get_page_cache_params(self):
+        """
+        Return the normalised request parameters the cached page depends on.
+        """
+        params = {}
+        for name in self.page_cache_params:
+            value = self.request.GET.get(name, '').strip()
+            # Searches are case-insensitive, so 'Tolkien' and 'tolkien' share a page.
+            params[name] = value.lower() if name == 'q' else value
+        return hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def get_page_cache_key(self, version=None):
+        """
+        Return the cache key for the current request's page.
+        """
+        if version is None:
+            version = get_catalogue_version()
+        return f'book_management:page:{type(self).__name__}:{version}:{self.get_page_cache_params()}'
+
+    def snapshot_page(self, paginator, page):
+        """
+        Return the picklable parts of a page: its rows and the paginator's count.
+        """
+        return {
+            'rows': list(page.object_list),
+            'count': paginator.count,
+            'is_estimate': getattr(paginator, 'is_estimate', False),
+            'number': page.number,
+            'has_next': page.has_next(),
+        }
+
+    def restore_page(self, queryset, page_size, cached):
+        """
+        Rebuild (paginator, page, object_list, is_paginated) from snapshot_page() output.
+        """
+        paginator = self.get_paginator(
+            queryset, page_size, orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        # The count is known, so the paginator never runs it.
+        paginator.__dict__['count'] = cached['count']
+        paginator.is_estimate = cached['is_estimate']
+        if cached['is_estimate']:
+            page = EstimatedPage(cached['rows'], cached['number'], paginator, cached['has_next'])
+        else:
+            page = paginator._get_page(cached['rows'], cached['number'], paginator)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Return the page from the cache, paginating the queryset on a miss.
+        """
+        def compute():
+            paginator, page, object_list, is_paginated = super(CachedPageMixin, self).paginate_queryset(queryset, page_size)
+            return self.snapshot_page(paginator, page)
+
+        timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+        cached = get_or_compute(self.get_page_cache_key(), compute, timeout)
+        return self.restore_page(queryset, page_size, cached)
+
+    async def apaginate_cached(self, queryset, page_size, paginate):
+        """
+        Async version of paginate_queryset(); paginate is the coroutine function that
+        paginates the queryset on a miss.
+        """
+        async def compute():
+            paginator, page, object_list, is_paginated = await paginate(queryset, page_size)
+            return self.snapshot_page(paginator, page)
+
+        timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+        key = self.get_page_cache_key(await aget_catalogue_version())
+        cached = await aget_or_compute(key, compute, timeout)
+        return self.restore_page(queryset, page_size, cached)
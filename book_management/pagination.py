@@ -0,0 +1,416 @@
+"""
+Pagination for library_management application.
+"""
+import datetime
+import hashlib
+from functools import cached_property
+
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import CharField, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404
+
+CURSOR_SALT = 'book_management.pagination.cursor'
+
+
+class CursorPage:
+    """
+    A page of results fetched by keyset, with opaque tokens for the neighbouring pages.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def encode_cursor(direction, value, pk):
+    """
+    Encode a keyset position as an opaque, signed token.
+
+    Args:
+        direction: 'n' to fetch rows after the position, 'p' to fetch rows before it.
+        value: The sort column value of the row at the position.
+        pk: The primary key of the row at the position.
+
+    Returns:
+        str: The cursor token.
+    """
+    if isinstance(value, datetime.date):
+        value = value.isoformat()
+    return signing.dumps([direction, value, pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor token produced by encode_cursor.
+
+    Raises:
+        Http404: If the token is malformed or has been tampered with.
+    """
+    try:
+        direction, value, pk = signing.loads(token, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise Http404('Invalid cursor.')
+    if direction not in ('n', 'p'):
+        raise Http404('Invalid cursor.')
+    return direction, value, pk
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that pages by keyset on (sort column, id) instead of OFFSET/LIMIT.
+
+    The sort column comes from the 'order_by' and 'dir' request parameters and must be
+    one of keyset_fields; anything else falls back to the view's default ordering.
+    A page costs one query regardless of its depth and no COUNT(*) is run.
+    Set pagination_mode = 'offset' (or the BORROWING_PAGINATION_MODE setting) to get
+    ListView's numbered pages back.
+    """
+    pagination_mode = None
+    keyset_fields = ('borrow_date',)
+    text_keyset_fields = ('book__title', 'book__author', 'borrower__name')
+    cursor_param = 'cursor'
+
+    def get_pagination_mode(self):
+        """
+        Return 'cursor' or 'offset'.
+        """
+        return self.pagination_mode or getattr(settings, 'BORROWING_PAGINATION_MODE', 'cursor')
+
+    def get_keyset_ordering(self):
+        """
+        Return the validated (sort field, descending) pair for the current request.
+        """
+        default = self.ordering[0] if self.ordering else 'id'
+        field = self.request.GET.get('order_by', default)
+        if field not in self.keyset_fields:
+            field = default
+        return field, self.request.GET.get('dir', 'asc') == 'desc'
+
+    def is_cursor_mode(self):
+        """
+        Return whether the list is paged by keyset.
+        """
+        return self.get_pagination_mode() == 'cursor'
+
+    def annotate_keyset(self, queryset):
+        """
+        Annotate the queryset with the requested sort column as keyset_value.
+        """
+        field, descending = self.get_keyset_ordering()
+        if field in self.text_keyset_fields:
+            key = Coalesce(F(field), Value(''), output_field=CharField())
+        else:
+            key = F(field)
+        return queryset.annotate(keyset_value=key)
+
+    def filter_keyset(self, queryset):
+        """
+        Annotate the queryset with keyset_value and keep the rows past the requested cursor.
+
+        Returns:
+            tuple: (queryset, ascending, forward, pk) where ascending is the order to read
+            the rows in, forward is False when walking backwards and pk is None on the
+            first page.
+        """
+        field, descending = self.get_keyset_ordering()
+        queryset = self.annotate_keyset(queryset)
+
+        token = self.request.GET.get(self.cursor_param)
+        direction, value, pk = decode_cursor(token) if token else ('n', None, None)
+        # Walking backwards reads the reversed ordering and flips the rows afterwards.
+        forward = direction == 'n'
+        ascending = forward != descending
+        if pk is not None:
+            lookup = 'gt' if ascending else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'keyset_value__{lookup}': value}) |
+                Q(keyset_value=value, **{f'id__{lookup}': pk})
+            )
+        return queryset, ascending, forward, pk
+
+    def get_keyset_slice(self, queryset, page_size):
+        """
+        Return the queryset for the requested keyset page, with one extra row to tell
+        whether more follow, and the cursor it was built from.
+
+        Returns:
+            tuple: (queryset, forward, pk) where forward is False when walking backwards
+            and pk is None on the first page.
+        """
+        queryset, ascending, forward, pk = self.filter_keyset(queryset)
+        if ascending:
+            queryset = queryset.order_by('keyset_value', 'id')
+        else:
+            queryset = queryset.order_by('-keyset_value', '-id')
+        return queryset[:page_size + 1], forward, pk
+
+    def build_keyset_page(self, rows, page_size, forward, pk):
+        """
+        Turn the rows fetched by get_keyset_slice() into a page.
+
+        Returns:
+            tuple: (paginator, page, object_list, is_paginated) as expected by ListView.
+        """
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            first, last = rows[0], rows[-1]
+            if has_more or not forward:
+                next_cursor = encode_cursor('n', last.keyset_value, last.pk)
+            if (has_more and not forward) or (forward and pk is not None):
+                previous_cursor = encode_cursor('p', first.keyset_value, first.pk)
+
+        page = CursorPage(rows, next_cursor, previous_cursor)
+        return None, page, rows, page.has_other_pages()
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Paginate the queryset by keyset when cursor mode is enabled.
+
+        Returns:
+            tuple: (paginator, page, object_list, is_paginated) as expected by ListView.
+        """
+        if not self.is_cursor_mode():
+            return super().paginate_queryset(queryset, page_size)
+        queryset, forward, pk = self.get_keyset_slice(queryset, page_size)
+        return self.build_keyset_page(list(queryset), page_size, forward, pk)
+
+COUNT_VERSION_KEY = 'book_management:pagination:count-version'
+
+
+def get_count_version():
+    """
+    Return the current generation of cached list counts.
+    """
+    return cache.get_or_set(COUNT_VERSION_KEY, 1, None)
+
+
+async def aget_count_version():
+    """
+    Async version of get_count_version().
+    """
+    return await cache.aget_or_set(COUNT_VERSION_KEY, 1, None)
+
+
+def invalidate_counts():
+    """
+    Start a new generation of cached list counts, so every cached count is ignored.
+    Called whenever books, borrowers or borrowings are written.
+    """
+    try:
+        cache.incr(COUNT_VERSION_KEY)
+    except ValueError:
+        cache.set(COUNT_VERSION_KEY, 1, None)
+
+
+def estimate_table_rows(model, using='default'):
+    """
+    Return the PostgreSQL planner's row estimate for model's table, or None on other
+    databases or when the table has never been analysed.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedPage(Page):
+    """
+    A page of a paginator whose count is an estimate. Whether a next page exists is
+    decided by the extra row fetched with the page, not by the estimate.
+    """
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that caches the COUNT(*) of its queryset.
+
+    Counts are stored under cache_key for PAGINATION_COUNT_TIMEOUT seconds (default 300)
+    and dropped by invalidate_counts(). An unfiltered queryset over a table the planner
+    estimates at PAGINATION_ESTIMATE_THRESHOLD rows or more (default 100000) is not
+    counted at all: the estimate is used and is_estimate is set, so templates can show
+    "page N of ~M". The estimate is cached like a count, so a cached page runs neither.
+    """
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, cache_key=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.cache_key = cache_key
+        self.is_estimate = False
+
+    def estimate(self):
+        """
+        Return the planner's row estimate when it may stand in for the exact count, else None.
+        """
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where or query.distinct:
+            return None
+        estimate = estimate_table_rows(self.object_list.model, self.object_list.db)
+        threshold = getattr(settings, 'PAGINATION_ESTIMATE_THRESHOLD', 100000)
+        if estimate is None or estimate < threshold:
+            return None
+        return estimate
+
+    def measure(self):
+        """
+        Return (count, is_estimate): the planner's estimate when it may stand in for the
+        exact count, else the exact count.
+        """
+        estimate = self.estimate()
+        if estimate is not None:
+            return estimate, True
+        return super().count, False
+
+    async def ameasure(self):
+        """
+        Async version of measure().
+        """
+        estimate = await sync_to_async(self.estimate)()
+        if estimate is not None:
+            return estimate, True
+        return await self.object_list.acount(), False
+
+    @cached_property
+    def count(self):
+        """
+        Return the cached, estimated or freshly counted number of objects.
+        """
+        if self.cache_key is None:
+            count, self.is_estimate = self.measure()
+            return count
+        key = f'{self.cache_key}:{get_count_version()}'
+        measured = cache.get(key)
+        if measured is None:
+            measured = self.measure()
+            cache.set(key, measured, getattr(settings, 'PAGINATION_COUNT_TIMEOUT', 300))
+        count, self.is_estimate = measured
+        return count
+
+    async def acount(self):
+        """
+        Async version of count, using the async cache and ORM. The result is kept, so
+        count, num_pages and validate_number() need no further queries.
+        """
+        if 'count' in self.__dict__:
+            return self.__dict__['count']
+        if self.cache_key is None:
+            measured = await self.ameasure()
+        else:
+            key = f'{self.cache_key}:{await aget_count_version()}'
+            measured = await cache.aget(key)
+            if measured is None:
+                measured = await self.ameasure()
+                await cache.aset(key, measured, getattr(settings, 'PAGINATION_COUNT_TIMEOUT', 300))
+        count, self.is_estimate = measured
+        self.__dict__['count'] = count
+        return count
+
+    def validate_number(self, number):
+        """
+        Validate the page number. Pages past an estimated last page are allowed, since the
+        estimate may be low.
+        """
+        self.count  # Decides is_estimate.
+        if not self.is_estimate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        """
+        Return the given page. With an estimated count, one extra row is fetched to tell
+        whether there is a next page.
+        """
+        number = self.validate_number(number)
+        if not self.is_estimate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        return EstimatedPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+
+    async def apage(self, number):
+        """
+        Async version of page(), fetching the rows with async iteration.
+        """
+        await self.acount()
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        if self.is_estimate:
+            rows = [obj async for obj in self.object_list[bottom:bottom + self.per_page + 1]]
+            return EstimatedPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        rows = [obj async for obj in self.object_list[bottom:top]]
+        return self._get_page(rows, number, self)
+
+
+class CachedCountMixin:
+    """
+    ListView mixin that paginates with CachedCountPaginator, keying the cached count by
+    the view and the SQL of its unordered queryset, which covers the filters, the search
+    and the user a list is scoped to.
+    """
+    paginator_class = CachedCountPaginator
+
+    def get_count_cache_key(self, queryset):
+        """
+        Return the cache key for the count of queryset, or None if it cannot be cached.
+        """
+        try:
+            sql, params = queryset.order_by().query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        digest = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+        return f'book_management:pagination:count:{type(self).__name__}:{digest}'
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        """
+        Return a CachedCountPaginator for queryset.
+        """
+        return super().get_paginator(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            cache_key=self.get_count_cache_key(queryset), **kwargs
+        )
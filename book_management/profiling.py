@@ -0,0 +1,223 @@
+"""
+On-demand request profiling for library_management application.
+
+A staff user adds '_profile' to the query string, or sends an 'X-Profile' header, to run
+that one request under a profiler:
+
+    ?_profile=collapsed  (the default) samples the request thread's stack every
+                         PROFILING_INTERVAL seconds and writes collapsed stacks, the
+                         input format of flamegraph.pl, speedscope and similar tools.
+    ?_profile=pstats     runs cProfile and writes a pstats file, for snakeviz or
+                         python -m pstats.
+
+Profiles are written to PROFILING_DIR and listed for librarians at /profiles/. Requests
+without the flag only pay for two dictionary lookups.
+"""
+import cProfile
+import os
+import re
+import sys
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import FileResponse, Http404
+from django.utils import timezone
+from django.views.generic import TemplateView, View
+
+from .views import LibrarianRequiredMixin
+
+FLAG = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+MODES = {'collapsed': '.txt', 'pstats': '.prof'}
+PROFILE_NAME = re.compile(r'^[\w.-]+\.(txt|prof)$')
+
+
+def get_profiling_dir():
+    """
+    Return the directory profiles are written to.
+    """
+    return getattr(settings, 'PROFILING_DIR', None) or os.path.join(tempfile.gettempdir(), 'library_management_profiles')
+
+
+def frame_label(frame):
+    """
+    Return a frame's function as 'name (path:line)', without the ';' that separates
+    frames in collapsed stacks.
+    """
+    code = frame.f_code
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """
+    Sample one thread's call stack from a background thread and count each distinct stack.
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        """
+        Write the samples as collapsed stacks: one 'frame;frame;frame count' line per stack.
+        """
+        with open(path, 'w') as profile_file:
+            for stack, count in self.stacks.most_common():
+                profile_file.write(f'{stack} {count}\n')
+
+
+class Profiler:
+    """
+    Profile a stretch of code in the current thread in one of MODES.
+    """
+    def __init__(self, mode):
+        self.mode = mode
+        if mode == 'pstats':
+            self.profile = cProfile.Profile()
+        else:
+            self.profile = StackSampler(threading.get_ident(), getattr(settings, 'PROFILING_INTERVAL', 0.005))
+
+    def __enter__(self):
+        if self.mode == 'pstats':
+            self.profile.enable()
+        else:
+            self.profile.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.mode == 'pstats':
+            self.profile.disable()
+        else:
+            self.profile.stop()
+
+    def save(self, label):
+        """
+        Write the profile to PROFILING_DIR and return its file name.
+        """
+        directory = get_profiling_dir()
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^\w-]+', '-', label).strip('-') or 'request'
+        name = f"{timezone.now():%Y%m%dT%H%M%S}-{slug}-{uuid.uuid4().hex[:8]}{MODES[self.mode]}"
+        if self.mode == 'pstats':
+            self.profile.dump_stats(os.path.join(directory, name))
+        else:
+            self.profile.write(os.path.join(directory, name))
+        return name
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests from staff users that ask for it. It must come after
+    AuthenticationMiddleware. Only the request thread is profiled: for async views that is
+    the event loop, not the threads their queries run in. Streamed content is produced
+    after the profile ends.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_mode(self, request):
+        """
+        Return the profiling mode the request asks for, or None to run it normally.
+        """
+        if HEADER not in request.META and FLAG not in request.META.get('QUERY_STRING', ''):
+            return None
+        mode = request.META.get(HEADER) or request.GET.get(FLAG)
+        if mode is None:
+            return None
+        mode = mode if mode in MODES else 'collapsed'
+        user = getattr(request, 'user', None)
+        return mode if user is not None and user.is_authenticated and user.is_staff else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.get_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        with Profiler(mode) as profiler:
+            response = self.get_response(request)
+        return self.finish(request, response, profiler)
+
+    async def __acall__(self, request):
+        mode = self.get_mode(request)
+        if mode is None:
+            return await self.get_response(request)
+        with Profiler(mode) as profiler:
+            response = await self.get_response(request)
+        return self.finish(request, response, profiler)
+
+    def finish(self, request, response, profiler):
+        """
+        Save the profile and name its file in the 'X-Profile-Name' response header.
+        """
+        match = request.resolver_match
+        response['X-Profile-Name'] = profiler.save(match.view_name if match else request.path)
+        return response
+
+
+class ProfileListView(LibrarianRequiredMixin, TemplateView):
+    """
+    View listing the captured profiles, newest first.
+    """
+    template_name = 'profile_list.html'
+
+    def get_context_data(self, **kwargs):
+        """
+        Get the context data including 'profiles': name, size and time of each profile file.
+        """
+        context = super().get_context_data(**kwargs)
+        directory = get_profiling_dir()
+        profiles = []
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if PROFILE_NAME.match(entry.name):
+                    stat = entry.stat()
+                    profiles.append({
+                        'name': entry.name,
+                        'size': stat.st_size,
+                        'modified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.get_current_timezone()),
+                        'format': 'pstats' if entry.name.endswith('.prof') else 'collapsed stacks',
+                    })
+        context['profiles'] = sorted(profiles, key=lambda profile: profile['modified'], reverse=True)
+        context['profiling_dir'] = directory
+        return context
+
+
+class ProfileDownloadView(LibrarianRequiredMixin, View):
+    """
+    View downloading one captured profile.
+    """
+    def get(self, request, name, *args, **kwargs):
+        path = os.path.join(get_profiling_dir(), name)
+        if not PROFILE_NAME.match(name) or not os.path.isfile(path):
+            raise Http404('No such profile.')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
@@ -0,0 +1,241 @@
+"""
+Bulk borrower provisioning for library_management application.
+
+Creates users with borrower profiles from CSV rows (username, name, phone_number and
+optionally email and password), for onboarding many students at once. Rows are read one
+at a time and written in batches: passwords are hashed across a process pool, users and
+borrowers are inserted with bulk_create, and borrower rights are granted in one
+set-based insert, which is what the Borrower signals and role task would have done row
+by row. Rows without a password get an unusable one, to be set by a password reset.
+"""
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .models import Borrower
+from .pagination import invalidate_counts
+from .roles import grant_borrower_role
+from .validators import CustomPasswordValidator
+
+REQUIRED_COLUMNS = ('username', 'name', 'phone_number')
+OPTIONAL_COLUMNS = ('email', 'password')
+
+
+def clean_row(row):
+    """
+    Validate and normalise one row mapped by lower-cased column name.
+
+    Returns:
+        dict: The username, email, password, name and phone_number of the row; the
+        password is None when the row has none.
+
+    Raises:
+        ValidationError: If a value is missing or invalid.
+    """
+    values = {column: (row.get(column) or '').strip() for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+    missing = [column for column in REQUIRED_COLUMNS if not values[column]]
+    if missing:
+        raise ValidationError(f"Missing {', '.join(missing)}.")
+
+    if len(values['username']) > 150:
+        raise ValidationError('Username must be 150 characters or fewer.')
+    UnicodeUsernameValidator()(values['username'])
+    if values['email']:
+        if len(values['email']) > 254:
+            raise ValidationError('Email must be 254 characters or fewer.')
+        validate_email(values['email'])
+    if len(values['name']) > 255:
+        raise ValidationError('Name must be 255 characters or fewer.')
+    if len(values['phone_number']) > 15:
+        raise ValidationError('Phone number must be 15 characters or fewer.')
+    if values['password']:
+        CustomPasswordValidator().validate(values['password'])
+    else:
+        values['password'] = None
+    return values
+
+
+def read_csv(csv_file):
+    """
+    Yield each row of an open CSV file as a dict keyed by lower-cased column name.
+
+    Raises:
+        ValidationError: If the file is empty or lacks a required column.
+    """
+    rows = csv.reader(csv_file)
+    header = next(rows, None)
+    if header is None:
+        raise ValidationError('The file is empty.')
+    columns = [column.strip().lower() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValidationError(f"Missing required columns: {', '.join(missing)}.")
+    for values in rows:
+        yield dict(zip(columns, values))
+
+
+class BorrowerProvisioner:
+    """
+    Create users and borrower profiles from rows, in batches.
+
+    Args:
+        batch_size: Rows hashed and inserted together.
+        workers: Processes hashing passwords (default: PROVISIONING_WORKERS, or one per
+            CPU). With one, passwords are hashed in this process.
+        log: Callable receiving progress messages.
+        error: Callable receiving one message per skipped row.
+    """
+    def __init__(self, batch_size=1000, workers=None, log=None, error=None):
+        self.batch_size = batch_size
+        self.workers = workers or getattr(settings, 'PROVISIONING_WORKERS', None) or os.cpu_count() or 1
+        self.log = log or (lambda message: None)
+        self.error = error or (lambda message: None)
+        self.pool = None
+        self.created = self.skipped = 0
+        self.seen_usernames = set()
+        self.seen_emails = set()
+
+    def run(self, rows):
+        """
+        Provision a borrower for every valid row, skipping invalid and taken ones.
+
+        Args:
+            rows: Dicts keyed by lower-cased column name, e.g. from read_csv(); the first
+                is counted as line 2.
+
+        Returns:
+            dict: The number of borrowers created and rows skipped.
+        """
+        if self.workers > 1:
+            # The workers only hash, but make_password needs the settings.
+            self.pool = ProcessPoolExecutor(self.workers, initializer=django.setup)
+        try:
+            batch = []
+            for line_number, row in enumerate(rows, start=2):
+                if not any(row.values()):
+                    continue
+                try:
+                    values = clean_row(row)
+                except ValidationError as error:
+                    self.skip(line_number, ' '.join(error.messages))
+                    continue
+                email = values['email'].lower()
+                if values['username'] in self.seen_usernames or (email and email in self.seen_emails):
+                    self.skip(line_number, 'Repeats the username or email of an earlier row.')
+                    continue
+                self.seen_usernames.add(values['username'])
+                if email:
+                    self.seen_emails.add(email)
+                batch.append((line_number, values))
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch)
+            self.write_batch(batch)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+        # bulk_create sends no signals, so drop the cached counts here.
+        invalidate_counts()
+        return {'created': self.created, 'skipped': self.skipped}
+
+    def skip(self, line_number, message):
+        """
+        Report a skipped row.
+        """
+        self.skipped += 1
+        self.error(f'Line {line_number}: {message}')
+
+    def hash_passwords(self, passwords):
+        """
+        Return the hashes of the passwords, in order, hashing across the process pool;
+        None gets an unusable password.
+        """
+        if self.pool is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.pool.map(make_password, passwords, chunksize=chunksize))
+
+    def drop_taken(self, batch):
+        """
+        Return the rows of the batch whose username and email are not in use, skipping
+        the others. Emails are compared without regard to case, like the unique index.
+        """
+        usernames = set(User.objects.filter(
+            username__in=[values['username'] for line_number, values in batch],
+        ).values_list('username', flat=True))
+        emails = {values['email'].lower() for line_number, values in batch if values['email']}
+        emails = set(User.objects.annotate(email_lower=Lower('email')).filter(
+            email_lower__in=emails,
+        ).values_list('email_lower', flat=True)) if emails else set()
+        free = []
+        for line_number, values in batch:
+            if values['username'] in usernames:
+                self.skip(line_number, f"The username '{values['username']}' is already in use.")
+            elif values['email'].lower() in emails:
+                self.skip(line_number, f"The email '{values['email']}' is already in use.")
+            else:
+                free.append((line_number, values))
+        return free
+
+    def write_batch(self, batch):
+        """
+        Insert the batch's users and borrowers, grant them borrower rights, and empty the
+        batch.
+        """
+        rows = self.drop_taken(batch)
+        batch.clear()
+        if not rows:
+            return
+        # Hashing takes far longer than the inserts, so it happens outside the transaction.
+        passwords = self.hash_passwords([values['password'] for line_number, values in rows])
+        try:
+            self.insert([values for line_number, values in rows], passwords)
+        except IntegrityError:
+            # A signup took a username or email since drop_taken() looked: insert the
+            # rows one at a time, so only the ones now taken are skipped.
+            for (line_number, values), password in zip(rows, passwords):
+                try:
+                    self.insert([values], [password])
+                except IntegrityError:
+                    # drop_taken() reports the row; if it no longer sees it taken, report it here.
+                    if self.drop_taken([(line_number, values)]):
+                        self.skip(line_number, 'The username or email is already in use.')
+        self.log(f'Created {self.created} borrowers.')
+
+    def insert(self, rows, passwords):
+        """
+        Insert users and borrowers for the rows, with the given password hashes, and grant
+        them borrower rights, in one transaction.
+
+        Raises:
+            IntegrityError: If a username or email is taken; nothing is inserted.
+        """
+        users = [
+            User(username=values['username'], email=values['email'], password=password)
+            for values, password in zip(rows, passwords)
+        ]
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            if users[0].pk is None:
+                # No RETURNING on this backend: look the ids up by username.
+                ids = dict(User.objects.filter(
+                    username__in=[user.username for user in users],
+                ).values_list('username', 'id'))
+                for user in users:
+                    user.pk = ids[user.username]
+            Borrower.objects.bulk_create([
+                Borrower(user_id=user.pk, name=values['name'], phone_number=values['phone_number'])
+                for user, values in zip(users, rows)
+            ])
+            grant_borrower_role(*(user.pk for user in users))
+        self.created += len(users)
@@ -0,0 +1,73 @@
+"""
+Borrower role for library_management application.
+
+Borrowers get their can_borrow/can_return rights through membership of the "Borrower"
+group. The group id is resolved once per process, and membership rows are written
+directly on the users/groups through table, so each change costs a single query. Since
+that bypasses the m2m signals, the users' cached identities are dropped here.
+"""
+from functools import lru_cache
+
+from django.contrib.auth.models import Group, Permission, User
+
+from .identity import invalidate_identities
+from .models import Borrower
+
+BORROWER_GROUP = 'Borrower'
+BORROWER_PERMISSIONS = ('can_borrow', 'can_return')
+
+
+@lru_cache(maxsize=None)
+def get_borrower_group_id():
+    """
+    Return the id of the "Borrower" group, creating it with the borrower permissions if needed.
+    The result is cached for the lifetime of the process.
+    """
+    group, created = Group.objects.get_or_create(name=BORROWER_GROUP)
+    if created:
+        group.permissions.set(Permission.objects.filter(
+            content_type__app_label='book_management',
+            codename__in=BORROWER_PERMISSIONS,
+        ))
+    return group.pk
+
+
+def grant_borrower_role(*user_ids):
+    """
+    Add the given users to the "Borrower" group in one INSERT, ignoring existing memberships.
+    """
+    group_id = get_borrower_group_id()
+    User.groups.through.objects.bulk_create(
+        [User.groups.through(user_id=user_id, group_id=group_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    invalidate_identities(*user_ids)
+
+
+def revoke_borrower_role(*user_ids):
+    """
+    Remove the given users from the "Borrower" group in one DELETE.
+    """
+    User.groups.through.objects.filter(user_id__in=user_ids, group_id=get_borrower_group_id()).delete()
+    invalidate_identities(*user_ids)
+
+
+def sync_borrower_roles(*user_ids):
+    """
+    Put the given users in the "Borrower" group if they have a borrower profile, and take
+    them out of it otherwise.
+
+    The result depends only on the current rows, not on what changed, so it can run late,
+    twice or out of order with other updates for the same users.
+
+    Returns:
+        tuple: The ids granted the role and the ids it was revoked from.
+    """
+    borrowers = set(Borrower.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    granted = [user_id for user_id in user_ids if user_id in borrowers]
+    revoked = [user_id for user_id in user_ids if user_id not in borrowers]
+    if granted:
+        grant_borrower_role(*granted)
+    if revoked:
+        revoke_borrower_role(*revoked)
+    return granted, revoked
@@ -0,0 +1,112 @@
+"""
+Search for library_management application.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+BOOK_TABLE = 'book_management_book'
+BOOK_FTS_TABLE = 'book_management_book_fts'
+
+# The SQLite trigram tokenizer and the Postgres trigram index both need at
+# least three characters to narrow the scan; shorter terms use a plain filter.
+MIN_INDEXED_LENGTH = 3
+
+STATUS_TERMS = {
+    'true': True,
+    'available': True,
+    'false': False,
+    'not available': False,
+}
+
+
+def _fts_phrase(query):
+    """
+    Quote the query as a single FTS5 phrase so it matches as a substring.
+    """
+    return '"%s"' % query.replace('"', '""')
+
+
+def _search_postgresql(queryset, query, ranked=True):
+    """
+    Filter with icontains lookups backed by the pg_trgm GIN indexes on
+    UPPER(title) and UPPER(author), ranked by trigram word similarity.
+    """
+    from django.contrib.postgres.search import TrigramWordSimilarity
+    from django.db.models.functions import Greatest
+
+    results = queryset.filter(Q(title__icontains=query) | Q(author__icontains=query))
+    if not ranked:
+        return results
+    return results.annotate(
+        search_rank=Greatest(
+            TrigramWordSimilarity(query, 'title'),
+            TrigramWordSimilarity(query, 'author'),
+        )
+    )
+
+
+def _search_sqlite(queryset, query, ranked=True):
+    """
+    Filter through the FTS5 trigram table, ranked by bm25.
+    """
+    phrase = _fts_phrase(query)
+    matches = RawSQL(
+        f'SELECT rowid FROM {BOOK_FTS_TABLE} WHERE {BOOK_FTS_TABLE} MATCH %s',
+        (phrase,),
+    )
+    if not ranked:
+        return queryset.filter(pk__in=matches)
+    rank = RawSQL(
+        f'SELECT -bm25({BOOK_FTS_TABLE}) FROM {BOOK_FTS_TABLE} '
+        f'WHERE {BOOK_FTS_TABLE} MATCH %s AND rowid = {BOOK_TABLE}.id',
+        (phrase,),
+    )
+    return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+def _search_fallback(queryset, query, status=None):
+    """
+    Unindexed substring search used for short terms, availability words and
+    other backends.
+    """
+    condition = Q(title__icontains=query) | Q(author__icontains=query)
+    if status is not None:
+        condition |= Q(availability_status=status)
+    return queryset.filter(condition)
+
+
+def search_books(queryset, query, match_status=False, ranked=True):
+    """
+    Shared search entry point for the book list views.
+
+    Args:
+        queryset: The Book queryset to search.
+        query: The search string typed by the user.
+        match_status: Also match availability words such as 'available' or
+            'true' against availability_status.
+        ranked: Rank and order the results by relevance; callers that impose
+            their own order pass False to skip computing the rank.
+
+    Returns:
+        QuerySet: The filtered queryset. Results are ordered by relevance
+        (``-search_rank``) where the backend supports ranking; callers can
+        override this with their own ``order_by``.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+
+    status = STATUS_TERMS.get(query.lower()) if match_status else None
+    if status is not None or len(query) < MIN_INDEXED_LENGTH:
+        results = _search_fallback(queryset, query, status)
+    elif connection.vendor == 'postgresql':
+        results = _search_postgresql(queryset, query, ranked)
+    elif connection.vendor == 'sqlite':
+        results = _search_sqlite(queryset, query, ranked)
+    else:
+        results = _search_fallback(queryset, query)
+
+    if 'search_rank' in results.query.annotations:
+        results = results.order_by('-search_rank', 'title')
+    return results
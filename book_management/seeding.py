@@ -0,0 +1,222 @@
+"""
+Synthetic data generation for library_management application.
+
+Produces a reproducible library of books, borrowers and borrowing history with skewed
+book popularity and reader activity, open and returned loans, and borrow dates spread
+over several years. Everything is written with bulk_create, so the per-row Borrower
+signals are bypassed and borrower rights are granted in one set-based insert instead.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .circulation import reconcile_counters
+from .models import Book, Borrower, Borrowing, due_date_for
+from .overdue import refresh_overdue_report
+from .page_cache import invalidate_catalogue
+from .pagination import invalidate_counts
+from .roles import grant_borrower_role
+
+FIRST_NAMES = ('Aarav', 'Maya', 'Liam', 'Sofia', 'Noah', 'Isha', 'Omar', 'Elena', 'Kenji', 'Zara', 'Lucas', 'Priya')
+LAST_NAMES = ('Shah', 'Patel', 'Garcia', 'Smith', 'Chen', 'Khan', 'Rossi', 'Nguyen', 'Okafor', 'Muller', 'Silva', 'Kim')
+TITLE_WORDS = ('Silent', 'River', 'Garden', 'Empire', 'Shadow', 'Light', 'Winter', 'Stone', 'Ocean', 'Secret', 'Journey', 'Code', 'History', 'Dream', 'Fire', 'City')
+
+
+def isbn13(number):
+    """
+    Return a valid ISBN-13 in the 979 prefix for the given sequence number.
+    """
+    digits = f'979{number:09d}'
+    check = (10 - sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(digits)) % 10) % 10
+    return f'{digits}{check}'
+
+
+def zipf_weights(count, skew):
+    """
+    Return Zipf-like cumulative weights for count ranks, so rank 1 is the most popular.
+    """
+    total = 0.0
+    cumulative = []
+    for rank in range(1, count + 1):
+        total += 1.0 / rank ** skew
+        cumulative.append(total)
+    return cumulative
+
+
+class LibrarySeeder:
+    """
+    Generate and bulk insert a synthetic library.
+
+    Args:
+        books: Number of books to create.
+        borrowers: Number of users, each with a borrower profile.
+        borrowings: Number of borrowings to create.
+        seed: Random seed; the same seed and sizes produce the same data.
+        years: How many years back the borrowing history reaches.
+        open_ratio: Probability that a book's most recent loan is still open.
+        skew: Zipf exponent for book popularity and reader activity.
+        batch_size: Rows per bulk insert.
+        prefix: Prefix for generated usernames.
+        password: Password given to every generated user (hashed once).
+        end_date: Last day of the generated history; defaults to today. Fix it to make
+            repeated runs produce identical dates.
+        log: Optional callable receiving progress messages.
+    """
+    def __init__(self, books, borrowers, borrowings, seed=0, years=5, open_ratio=0.05, skew=0.8,
+                 batch_size=5000, prefix='reader', password='Readerpass001', end_date=None, log=None):
+        self.book_count = books
+        self.borrower_count = borrowers
+        self.borrowing_count = borrowings
+        self.rng = random.Random(seed)
+        self.years = years
+        self.open_ratio = open_ratio
+        self.skew = skew
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.password = password
+        self.end_date = end_date or timezone.localdate()
+        self.log = log or (lambda message: None)
+
+    def run(self):
+        """
+        Create the books, borrowers and borrowings.
+
+        Returns:
+            dict: The number of rows created per model.
+        """
+        with transaction.atomic():
+            book_ids = self.create_books()
+            borrower_ids = self.create_borrowers()
+            loans = self.create_borrowings(book_ids, borrower_ids)
+            # bulk_create bypasses the circulation service, so fill the counters in one pass
+            # and rebuild the overdue summary, which may predate loans due in the past.
+            reconcile_counters()
+            refresh_overdue_report(full=True)
+        invalidate_counts()
+        invalidate_catalogue()
+        return {'books': len(book_ids), 'borrowers': len(borrower_ids), 'borrowings': loans}
+
+    def insert(self, model, objs, lookup_field):
+        """
+        Bulk insert objs in batches and return their ids in order.
+
+        Ids come back from the INSERT on backends that support RETURNING; elsewhere they
+        are looked up by lookup_field, a unique field of the generated rows.
+        """
+        ids = []
+        for i in range(0, len(objs), self.batch_size):
+            batch = model.objects.bulk_create(objs[i:i + self.batch_size])
+            if batch and batch[0].pk is None:
+                values = [getattr(obj, lookup_field) for obj in batch]
+                found = dict(model.objects.filter(**{f'{lookup_field}__in': values}).values_list(lookup_field, 'id'))
+                ids.extend(found[value] for value in values)
+            else:
+                ids.extend(obj.pk for obj in batch)
+        return ids
+
+    def create_books(self):
+        """
+        Bulk insert the books and return their ids.
+        """
+        first = Book.objects.count()
+        books = []
+        for i in range(first, first + self.book_count):
+            books.append(Book(
+                title=' '.join(self.rng.sample(TITLE_WORDS, self.rng.randint(2, 4))),
+                author=f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                ISBN=isbn13(i),
+                publication_date=self.end_date - timedelta(days=self.rng.randrange(365 * 80)),
+            ))
+        ids = self.insert(Book, books, 'ISBN')
+        self.log(f'Created {len(ids)} books.')
+        return ids
+
+    def create_borrowers(self):
+        """
+        Bulk insert users and borrower profiles, grant borrower rights in one insert, and
+        return the borrower ids.
+        """
+        password = make_password(self.password)
+        users = [
+            User(username=f'{self.prefix}{i}', password=password, email=f'{self.prefix}{i}@example.com')
+            for i in range(self.borrower_count)
+        ]
+        user_ids = self.insert(User, users, 'username')
+        borrowers = [
+            Borrower(
+                user_id=user_id,
+                name=f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                phone_number=f'9{self.rng.randrange(10 ** 9):09d}',
+            )
+            for user_id in user_ids
+        ]
+        borrower_ids = self.insert(Borrower, borrowers, 'user_id')
+        grant_borrower_role(*user_ids)
+        self.log(f'Created {len(borrower_ids)} borrowers.')
+        return borrower_ids
+
+    def create_borrowings(self, book_ids, borrower_ids):
+        """
+        Bulk insert the borrowing history and mark books with an open loan unavailable.
+
+        Loans per book follow a Zipf distribution; each book's loans are laid out one after
+        another over the history window, and its latest loan may still be open.
+
+        Returns:
+            int: The number of borrowings created.
+        """
+        if not book_ids or not borrower_ids:
+            return 0
+        book_weights = zipf_weights(len(book_ids), self.skew)
+        reader_weights = zipf_weights(len(borrower_ids), self.skew)
+        # Shuffle which books and readers are popular so it does not follow id order.
+        books = self.rng.sample(book_ids, len(book_ids))
+        readers = self.rng.sample(borrower_ids, len(borrower_ids))
+
+        loans_per_book = {}
+        for book_id in self.rng.choices(books, cum_weights=book_weights, k=self.borrowing_count):
+            loans_per_book[book_id] = loans_per_book.get(book_id, 0) + 1
+
+        today = self.end_date
+        window = 365 * self.years
+        start = today - timedelta(days=window)
+        batch, created, unavailable = [], 0, []
+        for book_id in book_ids:
+            count = loans_per_book.get(book_id, 0)
+            if not count:
+                continue
+            slot = window / count
+            is_open = self.rng.random() < self.open_ratio
+            for i in range(count):
+                borrow_date = start + timedelta(days=int(i * slot + self.rng.random() * slot / 2))
+                if is_open and i == count - 1:
+                    # Open loans are recent, but never start before the previous loan.
+                    borrow_date = max(borrow_date, today - timedelta(days=self.rng.randrange(60)))
+                    return_date = None
+                    unavailable.append(book_id)
+                else:
+                    length = min(self.rng.randint(1, 30), int(slot / 2))
+                    return_date = min(borrow_date + timedelta(days=length), today)
+                batch.append(Borrowing(
+                    book_id=book_id,
+                    borrower_id=self.rng.choices(readers, cum_weights=reader_weights)[0],
+                    borrow_date=borrow_date,
+                    due_date=due_date_for(borrow_date),
+                    return_date=return_date,
+                ))
+                if len(batch) >= self.batch_size:
+                    Borrowing.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+                    self.log(f'Created {created} borrowings.')
+        Borrowing.objects.bulk_create(batch)
+        created += len(batch)
+
+        for i in range(0, len(unavailable), self.batch_size):
+            Book.objects.filter(pk__in=unavailable[i:i + self.batch_size]).update(availability_status=False)
+        self.log(f'Created {created} borrowings, {len(unavailable)} still open.')
+        return created
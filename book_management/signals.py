@@ -1,32 +1,64 @@
 """
 Signals for library_management application.
+
+Borrowers get their can_borrow/can_return rights through membership of the "Borrower"
+group (see roles.py). Creating, deleting or re-pointing a borrower only queues a
+sync_borrower_roles task for after the commit, so the group membership is written
+outside the request.
+
+Each user's cached identity snapshot (see identity.py) is dropped when their user row,
+groups or permissions change. Borrower profile changes reach it through the role task,
+which drops the snapshot when it has updated the group membership.
 """
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.contrib.auth.models import Group, User
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete, post_migrate, pre_save
 from django.dispatch import receiver
-from django.contrib.auth.models import Permission, User
-from .models import Borrower
+from .identity import get_member_ids, invalidate_identities
+from .models import Book, Borrower, Borrowing
+from .page_cache import invalidate_catalogue
+from .pagination import invalidate_counts
+from .roles import get_borrower_group_id
+from .tasks import delay_on_commit, sync_borrower_roles
+
+_UNKNOWN = object()
+
+
+@receiver(post_migrate)
+def reset_borrower_group_cache(sender, **kwargs):
+    """
+    Forget the cached group id after migrate or flush, which may have recreated the group.
+    """
+    get_borrower_group_id.cache_clear()
+
+
+@receiver(post_init, sender=Borrower)
+def remember_borrower_user(sender, instance, **kwargs):
+    """
+    Remember the user a Borrower was loaded with, so a later save can tell whether it changed
+    without reading the old row back.
+    """
+    instance._loaded_user_id = instance.__dict__.get('user_id', _UNKNOWN)
+
 
 @receiver(post_save, sender=Borrower)
 def add_borrower_permissions(sender, instance, **kwargs):
     """
-    Triggered after a Borrower instance is saved. Adds borrower permissions to the associated user if the borrower instance is created.
-    
+    Triggered after a Borrower instance is saved. Queues adding the associated user to the Borrower group if the borrower instance is created.
+
     Args:
         sender: The sender of the signal.
         instance: The instance of the saved Borrower.
         **kwargs: Arbitrary keyword arguments.
     """
     if kwargs['created']:
-        borrower_user = instance.user
-        borrower_user.user_permissions.add(
-            Permission.objects.get(codename='can_borrow'),
-            Permission.objects.get(codename='can_return'),
-        )
+        delay_on_commit(sync_borrower_roles, instance.user_id, using=kwargs['using'])
+    instance._loaded_user_id = instance.__dict__.get('user_id', _UNKNOWN)
 
 @receiver(post_delete, sender=Borrower)
 def remove_borrower_permissions(sender, instance, **kwargs):
     """
-    Remove borrower permissions when a Borrower instance is deleted.
+    Queue removing the associated user from the Borrower group when a Borrower instance is deleted.
     Args:
         sender: The sender of the signal.
         instance: The instance being deleted.
@@ -34,16 +66,12 @@ def remove_borrower_permissions(sender, instance, **kwargs):
     Returns:
         None
     """
-    borrower_user = instance.user
-    borrower_user.user_permissions.remove(
-        Permission.objects.get(codename='can_borrow'),
-        Permission.objects.get(codename='can_return'),
-    )
+    delay_on_commit(sync_borrower_roles, instance.user_id, using=kwargs['using'])
 
 @receiver(pre_save, sender=Borrower)
 def update_borrower_permissions(sender, instance, **kwargs):
     """
-    Update borrower permissions before saving the instance.
+    Queue moving the Borrower group membership to the new user, if the instance's user has changed.
 
     Args:
         sender: The sender of the signal.
@@ -53,20 +81,90 @@ def update_borrower_permissions(sender, instance, **kwargs):
     Returns:
         None
     """
-    if instance.pk:
-        # If the instance has a primary key, it means it's being updated
-        old_borrower = Borrower.objects.get(pk=instance.pk)
-        old_user = old_borrower.user
-
-        # Remove permissions from the old user
-        old_user.user_permissions.remove(
-            Permission.objects.get(codename='can_borrow'),
-            Permission.objects.get(codename='can_return'),
-        )
-
-        # Add permissions to the new user
-        new_user = instance.user
-        new_user.user_permissions.add(
-            Permission.objects.get(codename='can_borrow'),
-            Permission.objects.get(codename='can_return'),
-        )
+    if instance.pk is None or instance._state.adding:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'user' not in update_fields and 'user_id' not in update_fields:
+        return
+    new_user_id = instance.__dict__.get('user_id', _UNKNOWN)
+    if new_user_id is _UNKNOWN:
+        # The user field is deferred and untouched, so it will not be written.
+        return
+
+    old_user_id = getattr(instance, '_loaded_user_id', _UNKNOWN)
+    if old_user_id is _UNKNOWN:
+        old_user_id = Borrower.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+    if old_user_id == new_user_id:
+        return
+
+    user_ids = [new_user_id] if old_user_id is None else [old_user_id, new_user_id]
+    delay_on_commit(sync_borrower_roles, *user_ids, using=kwargs['using'])
+
+
+@receiver(post_delete, sender=Borrowing)
+def release_borrowing_counters(sender, instance, **kwargs):
+    """
+    Take a deleted borrowing off its book's loan count. Runs inside the delete's transaction.
+    """
+    if instance.book_id is not None:
+        Book.objects.filter(pk=instance.book_id, total_loans__gt=0).update(total_loans=F('total_loans') - 1)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Borrower)
+@receiver(post_delete, sender=Borrower)
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_list_counts(sender, **kwargs):
+    """
+    Drop the cached list counts whenever a book, borrower or borrowing is written.
+    """
+    invalidate_counts()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_pages(sender, **kwargs):
+    """
+    Retire the cached available-books pages whenever a book is written.
+    """
+    invalidate_catalogue()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_identity(sender, instance, **kwargs):
+    """
+    Drop a user's identity when the user row is written, which may change the staff,
+    active or superuser flags.
+    """
+    invalidate_identities(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_permission_identities(sender, instance, action, model, pk_set, **kwargs):
+    """
+    Drop the identities of the users whose groups or permissions were changed through the
+    ORM. Clearing is handled before it happens, while the affected rows still exist.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, User):
+        user_ids = [instance.pk]
+    elif model is User and pk_set:
+        user_ids = pk_set
+    elif isinstance(instance, Group):
+        # The group's permissions changed, or its members were cleared.
+        user_ids = get_member_ids(instance.pk)
+    elif model is Group and pk_set:
+        # A permission was added to or removed from some groups.
+        user_ids = get_member_ids(*pk_set)
+    else:
+        # A permission was taken from all its users or groups.
+        user_ids = User.objects.filter(
+            Q(user_permissions=instance) | Q(groups__permissions=instance)
+        ).values_list('id', flat=True)
+    invalidate_identities(*user_ids)
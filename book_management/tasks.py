@@ -0,0 +1,50 @@
+"""
+Celery tasks for library_management application.
+
+Work that does not have to finish before the response is sent runs here, queued with
+delay_on_commit() so a worker only sees rows that were committed. Without a broker, and
+in tests, CELERY_TASK_ALWAYS_EAGER runs each task in the process when it is queued.
+"""
+from celery import shared_task
+from django.db import transaction
+
+from . import circulation, overdue, roles
+
+
+def delay_on_commit(task, *args, using=None):
+    """
+    Queue task with args once the current transaction commits, or at once outside one.
+    Nothing is queued if the transaction rolls back.
+
+    Args:
+        task: The Celery task to queue.
+        *args: JSON-serialisable arguments for the task.
+        using: The database alias whose transaction to wait for.
+    """
+    transaction.on_commit(lambda: task.delay(*args), using=using)
+
+
+@shared_task(ignore_result=True)
+def sync_borrower_roles(*user_ids):
+    """
+    Bring the "Borrower" group membership of the given users in line with their borrower
+    profiles.
+    """
+    roles.sync_borrower_roles(*user_ids)
+
+
+@shared_task
+def reconcile_counters():
+    """
+    Recompute the loan counters from the borrowings; returns the rows corrected.
+    """
+    return circulation.reconcile_counters()
+
+
+@shared_task
+def refresh_overdue_report():
+    """
+    Bring the overdue-loans summary up to date; returns the loans added and removed.
+    """
+    result = overdue.refresh_overdue_report()
+    return {'added': result['added'], 'removed': result['removed'], 'as_of': result['as_of'].isoformat()}
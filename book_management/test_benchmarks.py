@@ -0,0 +1,337 @@
+"""
+Query-count and latency benchmarks for library_management application.
+
+Every named route in book_management/urls.py is requested as a librarian, a borrower and
+an anonymous user against a seeded dataset. The number of queries each request runs is
+compared with the budget checked in to query_budgets.json for the database backend in
+use, so N+1 regressions fail the suite. Query counts do not depend on the dataset size;
+BENCHMARK_SCALE multiplies it for more realistic latency figures.
+
+The benchmarks are left out of a plain `manage.py test` (see
+library_management.test_runner). Run them, with the measurements logged, with:
+    python manage.py test --tag benchmark -v 2
+
+Rewrite the current backend's budgets after an intentional change with:
+    BENCHMARK_UPDATE_BUDGETS=1 python manage.py test --tag benchmark
+
+AsyncThroughputBenchmarkTests compares the sync and async list views under concurrent
+load, dispatching them as the ASGI handler does; BENCHMARK_CONCURRENCY sets how many
+requests are in flight at once.
+
+LoginThroughputBenchmarkTests measures logins per second, and per core, for the former
+login check (a username lookup and two authentications), the current one, and under ASGI
+with the shared sync thread and with the login thread pool.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.contrib.auth import authenticate
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import async_views, views
+from .forms import CustomLoginForm
+from .models import Book, Borrowing
+from .seeding import LibrarySeeder
+from .urls import urlpatterns
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+logger = logging.getLogger('book_management.benchmarks')
+SCALE = int(os.environ.get('BENCHMARK_SCALE', '1'))
+CONCURRENCY = int(os.environ.get('BENCHMARK_CONCURRENCY', '20'))
+ROLES = ('librarian', 'borrower', 'anonymous')
+
+PK_ROUTES = {
+    'book_detail': 'book',
+    'book_update': 'book',
+    'book_delete': 'book',
+    'borrower_detail': 'borrower',
+    'borrower_update': 'borrower',
+    'borrower_delete': 'borrower',
+    'borrowing_detail': 'borrowing',
+    'api_book_detail': 'book',
+    'api_borrower_detail': 'borrower',
+    'api_borrowing_detail': 'borrowing',
+}
+
+
+@tag('benchmark')
+class RouteBenchmarkTests(TestCase):
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Seed books, borrowers and a history of borrowings with bulk inserts.
+        """
+        LibrarySeeder(
+            books=500 * SCALE,
+            borrowers=50 * SCALE,
+            borrowings=2000 * SCALE,
+            open_ratio=0.2,
+            end_date=date(2024, 1, 31),
+        ).run()
+        cls.librarian = User.objects.create_user(username='librarian', is_staff=True)
+        # A borrower with an open loan, and a book left available to borrow.
+        cls.open_borrowing = Borrowing.objects.filter(return_date__isnull=True).select_related('borrower__user').order_by('id').first()
+        cls.borrower = cls.open_borrowing.borrower
+        cls.book = Book.objects.filter(availability_status=True).order_by('id').first()
+        # A captured profile to download.
+        profiling_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(profiling_dir.cleanup)
+        profiling_settings = override_settings(PROFILING_DIR=profiling_dir.name)
+        profiling_settings.enable()
+        cls.addClassCleanup(profiling_settings.disable)
+        cls.profile_name = 'benchmark.txt'
+        with open(os.path.join(profiling_dir.name, cls.profile_name), 'w') as profile_file:
+            profile_file.write('main (manage.py:1) 1\n')
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Log the collected measurements.
+        """
+        if cls.results:
+            lines = ['{:<28} {:<10} {:>6} {:>8} {:>10} {:>10}'.format('route', 'role', 'status', 'queries', 'sql ms', 'total ms')]
+            for result in cls.results:
+                lines.append('{route:<28} {role:<10} {status:>6} {queries:>8} {sql_ms:>10.2f} {total_ms:>10.2f}'.format(**result))
+            logger.info('\n'.join(lines))
+        super().tearDownClass()
+
+    def login(self, role):
+        """
+        Log the test client in for the given role.
+        """
+        self.client.logout()
+        if role == 'librarian':
+            self.client.force_login(self.librarian)
+        elif role == 'borrower':
+            self.client.force_login(self.borrower.user)
+
+    def request(self, name):
+        """
+        Request a route and return (status code, captured queries, wall-clock seconds).
+        """
+        model = PK_ROUTES.get(name)
+        if model == 'borrowing':
+            url = reverse(name, args=[self.open_borrowing.pk])
+        elif model:
+            url = reverse(name, args=[getattr(self, model).pk])
+        elif name == 'profile_download':
+            url = reverse(name, args=[self.profile_name])
+        else:
+            url = reverse(name)
+
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            if name == 'borrow_book':
+                response = self.client.post(url, {'book_id': self.book.pk})
+            elif name == 'return_book':
+                response = self.client.post(url, {'borrowing_id': self.open_borrowing.pk})
+            elif name == 'api_borrow':
+                response = self.client.post(url, {'book_ids': [self.book.pk]}, content_type='application/json')
+            elif name == 'api_return':
+                response = self.client.post(url, {'borrowing_ids': [self.open_borrowing.pk]}, content_type='application/json')
+            else:
+                response = self.client.get(url)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return response.status_code, captured.captured_queries, elapsed
+
+    def measure(self):
+        """
+        Request every named route as every role and return the query counts.
+        """
+        counts = {}
+        names = [pattern.name for pattern in urlpatterns if pattern.name]
+        # Logging out ends the session, so it goes last.
+        names.sort(key=lambda name: name == 'logout')
+        for role in ROLES:
+            for name in names:
+                self.login(role)
+                status, queries, elapsed = self.request(name)
+                statements = [query for query in queries if 'SAVEPOINT' not in query['sql']]
+                counts.setdefault(name, {})[role] = len(statements)
+                self.results.append({
+                    'route': name,
+                    'role': role,
+                    'status': status,
+                    'queries': len(statements),
+                    'sql_ms': sum(float(query['time']) for query in statements) * 1000,
+                    'total_ms': elapsed * 1000,
+                })
+        return counts
+
+    def test_routes_within_query_budget(self):
+        """
+        Test that no route runs more queries than its checked-in budget for this database backend.
+        """
+        with open(BUDGET_FILE) as budget_file:
+            all_budgets = json.load(budget_file)
+        vendor = connection.vendor
+        if vendor not in all_budgets and not os.environ.get('BENCHMARK_UPDATE_BUDGETS'):
+            self.skipTest(f'No query budgets recorded for {vendor}; record them with BENCHMARK_UPDATE_BUDGETS=1.')
+        counts = self.measure()
+
+        if os.environ.get('BENCHMARK_UPDATE_BUDGETS'):
+            all_budgets[vendor] = counts
+            with open(BUDGET_FILE, 'w') as budget_file:
+                json.dump(all_budgets, budget_file, indent=2, sort_keys=True)
+                budget_file.write('\n')
+            return
+
+        budgets = all_budgets[vendor]
+        for name, by_role in counts.items():
+            for role, count in by_role.items():
+                with self.subTest(route=name, role=role):
+                    self.assertIn(name, budgets, f'No query budget for route {name}.')
+                    self.assertLessEqual(count, budgets[name][role], f'{name} as {role} ran {count} queries.')
+
+
+@tag('benchmark')
+class AsyncThroughputBenchmarkTests(TestCase):
+    VIEWS = (
+        ('available_books_anonymous', views.AvailableBooksAnoymous, async_views.AvailableBooksAnoymousAsync),
+        ('book_list', views.BookListView, async_views.BookListAsyncView),
+        ('borrowing_history', views.BorrowingHistoryView, async_views.BorrowingHistoryAsyncView),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Seed books, borrowers and a history of borrowings.
+        """
+        LibrarySeeder(
+            books=500 * SCALE,
+            borrowers=50 * SCALE,
+            borrowings=2000 * SCALE,
+            open_ratio=0.2,
+            end_date=date(2024, 1, 31),
+        ).run()
+        cls.librarian = User.objects.create_user(username='librarian', is_staff=True)
+
+    async def call(self, view, page):
+        """
+        Dispatch one request for a page of the first ten to view as the ASGI handler would
+        and return its status code. Sync views run in the handler's shared thread; async
+        views run on the event loop.
+        """
+        request = RequestFactory().get('/', {'page': page % 10 + 1})
+        request.user = self.librarian
+        if view.view_class.view_is_async:
+            response = await view(request)
+        else:
+            response = await sync_to_async(view)(request)
+        await sync_to_async(response.render)()
+        return response.status_code
+
+    async def throughput(self, view, requests):
+        """
+        Run requests concurrently, at most CONCURRENCY at a time, and return requests per second.
+        """
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def limited(page):
+            async with semaphore:
+                return await self.call(view, page)
+
+        await sync_to_async(cache.clear)()
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(limited(page) for page in range(1, requests + 1)))
+        elapsed = time.perf_counter() - started
+        self.assertEqual(set(statuses), {200})
+        return requests / elapsed
+
+    async def test_sync_and_async_throughput(self):
+        """
+        Measure sync and async list views under concurrent load and log requests per second.
+        """
+        requests = 40 * SCALE
+        lines = [f'{"view":<28} {"sync req/s":>12} {"async req/s":>12}   ({requests} requests, concurrency {CONCURRENCY})']
+        for name, sync_class, async_class in self.VIEWS:
+            sync_rate = await self.throughput(sync_class.as_view(), requests)
+            async_rate = await self.throughput(async_class.as_view(), requests)
+            lines.append(f'{name:<28} {sync_rate:>12.1f} {async_rate:>12.1f}')
+        logger.info('\n'.join(lines))
+
+
+@tag('benchmark')
+class LoginThroughputBenchmarkTests(TransactionTestCase):
+    # The login thread pool has its own database connections, which must see the user.
+    CREDENTIALS = {'username': 'reader', 'password': 'Readerpass001'}
+
+    def setUp(self):
+        """
+        Create the user to log in as.
+        """
+        User.objects.create_user(**self.CREDENTIALS)
+
+    def login_before(self):
+        """
+        The login check as it was: a username lookup, then authenticate() in clean() and
+        again in save().
+        """
+        User.objects.filter(username=self.CREDENTIALS['username']).exists()
+        authenticate(**self.CREDENTIALS)
+        return authenticate(**self.CREDENTIALS) is not None
+
+    def login_after(self):
+        """
+        The current login check: one authenticate() in the form's clean().
+        """
+        return CustomLoginForm(self.CREDENTIALS).is_valid()
+
+    def sequential(self, login, logins):
+        """
+        Run logins one after another and return logins per second.
+        """
+        started = time.perf_counter()
+        for _ in range(logins):
+            self.assertTrue(login())
+        return logins / (time.perf_counter() - started)
+
+    async def concurrent(self, run, logins):
+        """
+        Run logins concurrently, at most CONCURRENCY at a time, with run() dispatching each
+        check, and return logins per second.
+        """
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def limited():
+            async with semaphore:
+                return await run(self.login_after)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(limited() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        self.assertTrue(all(results))
+        return logins / elapsed
+
+    async def test_login_throughput(self):
+        """
+        Measure login checks per second and log them with the rate per core used.
+        """
+        logins = 8 * SCALE
+        workers = async_views.get_login_executor()._max_workers
+        cores = min(workers, os.cpu_count() or 1)
+        rows = [
+            ('before (sequential)', await sync_to_async(self.sequential)(self.login_before, logins), 1),
+            ('after (sequential)', await sync_to_async(self.sequential)(self.login_after, logins), 1),
+            ('after, ASGI shared thread', await self.concurrent(lambda login: sync_to_async(login)(), logins), 1),
+            ('after, ASGI login pool', await self.concurrent(async_views.run_in_login_executor, logins), cores),
+        ]
+        lines = [f'{"login check":<28} {"logins/s":>10} {"per core":>10}   ({logins} logins, {workers} pool threads, {os.cpu_count()} CPUs)']
+        for name, rate, used in rows:
+            lines.append(f'{name:<28} {rate:>10.2f} {rate / used:>10.2f}')
+        logger.info('\n'.join(lines))
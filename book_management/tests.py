@@ -1,10 +1,50 @@
 """
 Tests for library_management application.
 """
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from openpyxl import Workbook, load_workbook
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, models, transaction
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.contrib.auth.models import User
-from .models import Book, Borrower, Borrowing
+from django.utils import timezone
+from django.contrib.auth.models import AnonymousUser, Group, Permission, User
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.cache import SessionStore
+from library_management.db import ConnectionStatsMixin, stats as connection_stats
+from . import archive, async_views, circulation, forms, metrics, overdue, page_cache, profiling, tasks
+from .identity import get_identity, get_identity_key
+from .models import ArchivedBorrowing, Book, Borrower, Borrowing, OverdueLoan
+from .search import search_books
+from .seeding import LibrarySeeder
+from .provisioning import BorrowerProvisioner
+from .roles import BORROWER_GROUP
+from .views import (
+    AvailableBooksAnoymous,
+    BookListView,
+    BorrowerBorrowingHistoryView,
+    BorrowerListView,
+    BorrowerPendingBrrowingListView,
+    BorrowingHistoryView,
+    PendingBorrowing,
+)
 
 class LibraryAuthTests(TestCase):
     def setUp(self):
@@ -13,7 +53,8 @@ class LibraryAuthTests(TestCase):
         """
         self.book = Book.objects.create(title='Test Book', author='Test Author', ISBN='1234567890', publication_date='2022-01-01', availability_status=True)
         self.user = User.objects.create_user(username='testuser', password='testpass')
-        self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
 
     def test_sign_up_view(self):
         """
@@ -25,6 +66,55 @@ class LibraryAuthTests(TestCase):
         self.assertEqual(response.status_code, 302)  # Redirect after successful signup
         self.assertTrue(User.objects.filter(username='newuser').exists())
 
+    def test_sign_up_is_a_single_insert(self):
+        """
+        Test that signing up runs one INSERT, without looking the username and email up first.
+        """
+        data = {'username': 'newuser', 'email': 'newuser@example.com', 'password': 'Userpass001', 'confirm_password': 'Userpass001'}
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('signup'), data)
+        self.assertEqual(response.status_code, 302)
+        statements = [query['sql'] for query in captured.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT INTO "auth_user"'))
+
+    def test_sign_up_rejects_taken_username_and_email(self):
+        """
+        Test that the unique indexes' errors come back as form errors, and that emails are
+        compared without regard to case.
+        """
+        User.objects.create_user(username='takenuser', password='Userpass001', email='Taken@Example.com')
+        cases = (
+            ('takenuser', 'other@example.com', 'username', 'This username is already in use.'),
+            ('newuser', 'taken@example.com', 'email', 'This email is already in use.'),
+        )
+        for username, email, field, message in cases:
+            with self.subTest(field=field):
+                data = {'username': username, 'email': email, 'password': 'Userpass001', 'confirm_password': 'Userpass001'}
+                response = self.client.post(reverse('signup'), data)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['form'].errors[field], [message])
+        self.assertEqual(User.objects.filter(email__iexact='taken@example.com').count(), 1)
+
+    def test_taken_field_prefers_constraint_name(self):
+        """
+        Test that a PostgreSQL error is mapped by its constraint name, even when its message
+        mentions the username, and that other errors fall back to the message.
+        """
+        def integrity_error(message, constraint_name=None):
+            error = IntegrityError(message)
+            if constraint_name is not None:
+                # Like psycopg's errors, which Django's IntegrityError wraps.
+                error.__cause__ = Exception(message)
+                error.__cause__.diag = mock.Mock(constraint_name=constraint_name)
+            return error
+
+        detail = 'duplicate key value violates unique constraint\nDETAIL:  Key (upper(email))=(USERNAME@EXAMPLE.COM) already exists.'
+        self.assertEqual(forms.taken_field(integrity_error(detail, forms.USER_EMAIL_INDEX)), 'email')
+        self.assertEqual(forms.taken_field(integrity_error(detail, 'auth_user_username_key')), 'username')
+        self.assertIsNone(forms.taken_field(integrity_error('username', 'auth_user_pkey')))
+        self.assertEqual(forms.taken_field(integrity_error('UNIQUE constraint failed: auth_user.username')), 'username')
+
     def test_login_view(self):
         """
         Test the login view by creating a test user, logging in, and checking the response.
@@ -56,6 +146,70 @@ class LibraryAuthTests(TestCase):
         self.assertEqual(response.status_code, 302)  # Redirect after successful logout
         self.assertFalse(self.client.session.get('_auth_user_id'))
         
+class LoginTests(TestCase):
+    def setUp(self):
+        """
+        Set up a user to log in as.
+        """
+        self.user = User.objects.create_user(username='testuser', password='Userpass001')
+
+    def test_login_authenticates_once(self):
+        """
+        Test that a successful login checks the password a single time.
+        """
+        with mock.patch.object(forms, 'authenticate', wraps=forms.authenticate) as authenticate:
+            response = self.client.post(reverse('login'), {'username': 'testuser', 'password': 'Userpass001'})
+        self.assertRedirects(response, reverse('available_books_anonymous'), fetch_redirect_response=False)
+        self.assertEqual(authenticate.call_count, 1)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+    def test_failed_logins_share_one_error(self):
+        """
+        Test that an unknown username and a wrong password get the same error.
+        """
+        for username, password in (('nobody', 'Userpass001'), ('testuser', 'Wrongpass001')):
+            with self.subTest(username=username):
+                response = self.client.post(reverse('login'), {'username': username, 'password': password})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['form'].non_field_errors(), ['Invalid username or password.'])
+                self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class AsyncLoginViewTests(TransactionTestCase):
+    async def post(self, data):
+        """
+        Post data to CustomLoginAsyncView and return the request and the response.
+        """
+        request = AsyncRequestFactory().post(reverse('login'), data)
+        request.session = SessionStore()
+        request.user = AnonymousUser()
+        request._messages = default_storage(request)
+        return request, await async_views.CustomLoginAsyncView.as_view()(request)
+
+    async def test_login_checks_password_in_executor(self):
+        """
+        Test that the async view authenticates in the login thread pool and logs the user in.
+        """
+        user = await sync_to_async(User.objects.create_user)(username='testuser', password='Userpass001')
+        threads = []
+        original = forms.authenticate
+
+        def authenticate(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return original(*args, **kwargs)
+
+        with mock.patch.object(forms, 'authenticate', authenticate):
+            request, response = await self.post({'username': 'testuser', 'password': 'Userpass001'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('login'))
+        self.assertEqual(int(request.session['_auth_user_id']), user.pk)
+
+        request, response = await self.post({'username': 'testuser', 'password': 'Wrongpass001'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', request.session)
+
+
 class BorrowerViewTests(TestCase):
     def setUp(self):
         """
@@ -64,7 +218,8 @@ class BorrowerViewTests(TestCase):
         self.book = Book.objects.create(title='Test Book', author='Test Author', ISBN='1234567890', publication_date='2022-01-01', availability_status=True)
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.login(username='testuser', password='testpass')
-        self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
 
     def borrow_book(self, id, username):
         """
@@ -170,7 +325,8 @@ class LibrarianViewTests(TestCase):
         self.user2 = User.objects.create_user(username='testuser2', password='testpass2')
         self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
         self.client.login(username='adminuser', password='adminpass')
-        self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
     
     def borrow_book(self, id):
         """
@@ -319,3 +475,1599 @@ class LibrarianViewTests(TestCase):
         self.assertContains(response, 'History of Borrowed Books')
         self.assertContains(response, 'Test Book')
         self.assertContains(response, 'Test Borrower')
+
+class BookSearchTests(TestCase):
+    def setUp(self):
+        """
+        Set up a small catalogue and log in as a librarian.
+        """
+        self.book = Book.objects.create(title='Test Book', author='Test Author', ISBN='1234567890', publication_date='2022-01-01', availability_status=True)
+        self.other_book = Book.objects.create(title='Gardening Basics', author='Jane Smith', ISBN='1234567891', publication_date='2021-05-01', availability_status=False)
+        self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.client.login(username='adminuser', password='adminpass')
+
+    def test_search_matches_title_and_author_substrings(self):
+        """
+        Test that search_books matches case-insensitive substrings of title and author.
+        """
+        self.assertQuerySetEqual(search_books(Book.objects.all(), 'rdeni'), [self.other_book])
+        self.assertQuerySetEqual(search_books(Book.objects.all(), 'JANE'), [self.other_book])
+        self.assertQuerySetEqual(search_books(Book.objects.all(), 'th'), [self.book, self.other_book], ordered=False)
+
+    def test_search_is_ranked(self):
+        """
+        Test that search results carry a relevance rank and are ordered by it.
+        """
+        Book.objects.create(title='Test Test Test', author='Someone', ISBN='1234567892', publication_date='2020-01-01')
+        results = search_books(Book.objects.all(), 'test')
+        self.assertEqual(results.query.order_by, ('-search_rank', 'title'))
+        self.assertEqual(results.count(), 2)
+
+    def test_search_index_follows_updates_and_deletes(self):
+        """
+        Test that the search index reflects edited and deleted books.
+        """
+        self.book.title = 'Renamed Volume'
+        self.book.save()
+        self.assertQuerySetEqual(search_books(Book.objects.all(), 'volume'), [self.book])
+        self.assertFalse(search_books(Book.objects.all(), 'test book').exists())
+        self.other_book.delete()
+        self.assertFalse(search_books(Book.objects.all(), 'gardening').exists())
+
+    def test_book_list_matches_availability(self):
+        """
+        Test that the librarian book list still matches availability words.
+        """
+        response = self.client.get(reverse('book_list'), {'q': 'available'})
+        self.assertQuerySetEqual(response.context['object_list'], [self.book])
+        response = self.client.get(reverse('book_list'), {'q': 'jane'})
+        self.assertQuerySetEqual(response.context['object_list'], [self.other_book])
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        """
+        Set up twelve returned borrowings, several sharing a borrow date, and log in as a librarian.
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.client.login(username='adminuser', password='adminpass')
+        self.borrowings = []
+        for i in range(12):
+            book = Book.objects.create(title=f'Book {i:02d}', author='Test Author', ISBN=f'12345678{i:02d}', publication_date='2022-01-01')
+            self.borrowings.append(Borrowing.objects.create(
+                borrower=self.borrower, book=book,
+                borrow_date=f'2023-01-{1 + i // 3:02d}', return_date='2023-02-01',
+            ))
+
+    def walk(self, params, cursor_attr='next_cursor'):
+        """
+        Follow cursors from the first page and return every page's ids.
+        """
+        pages = []
+        response = self.client.get(reverse('borrowing_history'), params)
+        while True:
+            page = response.context['page_obj']
+            pages.append([borrowing.id for borrowing in page])
+            cursor = getattr(page, cursor_attr)
+            if cursor is None:
+                return pages, response
+            response = self.client.get(reverse('borrowing_history'), dict(params, cursor=cursor))
+
+    def test_pages_cover_every_row_once(self):
+        """
+        Test that following next cursors returns every row exactly once in (borrow_date, id) order.
+        """
+        pages, response = self.walk({})
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), [borrowing.id for borrowing in self.borrowings])
+
+    def test_previous_cursor_walks_back(self):
+        """
+        Test that the previous cursor of a later page returns to the earlier page.
+        """
+        params = {'order_by': 'book__title', 'dir': 'desc'}
+        forward, response = self.walk(params)
+        previous_cursor = response.context['page_obj'].previous_cursor
+        response = self.client.get(reverse('borrowing_history'), dict(params, cursor=previous_cursor))
+        self.assertEqual([borrowing.id for borrowing in response.context['page_obj']], forward[1])
+        self.assertEqual(forward[0][0], self.borrowings[-1].id)
+
+    def test_page_does_not_count(self):
+        """
+        Test that a cursor page is fetched in a single query without COUNT(*).
+        """
+        response = self.client.get(reverse('borrowing_history'))
+        request = RequestFactory().get(reverse('borrowing_history'), {'cursor': response.context['page_obj'].next_cursor})
+        request.user = self.admin_user
+        view = BorrowingHistoryView()
+        view.setup(request)
+        view.object_list = view.get_queryset()
+        with self.assertNumQueries(1) as captured:
+            view.get_context_data()
+        self.assertNotIn('COUNT', captured.captured_queries[0]['sql'])
+
+    def test_tampered_cursor_is_rejected(self):
+        """
+        Test that an invalid cursor returns 404.
+        """
+        response = self.client.get(reverse('borrowing_history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+class CirculationTests(TestCase):
+    def setUp(self):
+        """
+        Set up a book and a borrower.
+        """
+        self.book = Book.objects.create(title='Test Book', author='Test Author', ISBN='1234567890', publication_date='2022-01-01', availability_status=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+
+    def assertNumStatements(self, num, func, *args):
+        """
+        Assert that func runs num SQL statements, not counting transaction savepoints.
+        """
+        with CaptureQueriesContext(connection) as captured:
+            result = func(*args)
+        statements = [q['sql'] for q in captured.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), num, statements)
+        return result
+
+    def open_loans(self):
+        """
+        Return the borrower's open loans as the borrower list counts them.
+        """
+        return Borrower.objects.with_open_loans().get(pk=self.borrower.pk).open_loans
+
+    def test_borrow_and_return_cost_two_queries(self):
+        """
+        Test that borrow and return each run two statements and update availability, the loan counter and the open loans.
+        """
+        borrowing = self.assertNumStatements(2, circulation.borrow, self.book.id, self.borrower)
+        self.book.refresh_from_db()
+        self.assertFalse(self.book.availability_status)
+        self.assertIsNone(borrowing.return_date)
+        self.assertEqual(self.book.total_loans, 1)
+        self.assertEqual(self.open_loans(), 1)
+
+        self.assertNumStatements(2, circulation.return_, borrowing.id)
+        self.book.refresh_from_db()
+        borrowing.refresh_from_db()
+        self.assertTrue(self.book.availability_status)
+        self.assertIsNotNone(borrowing.return_date)
+        self.assertEqual(self.book.total_loans, 1)
+        self.assertEqual(self.open_loans(), 0)
+
+    def test_deleting_borrowing_releases_counters(self):
+        """
+        Test that deleting an open borrowing takes it off the book's counter and the borrower's open loans.
+        """
+        borrowing = circulation.borrow(self.book.id, self.borrower)
+        borrowing.delete()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.total_loans, 0)
+        self.assertEqual(self.open_loans(), 0)
+
+    def test_saving_does_not_overwrite_counters(self):
+        """
+        Test that saving a stale instance keeps counters incremented in the meantime.
+        """
+        stale = Book.objects.get(pk=self.book.pk)
+        circulation.borrow(self.book.id, self.borrower)
+        stale.title = 'New Title'
+        stale.save()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.title, self.book.total_loans), ('New Title', 1))
+
+    def test_reconcile_counters_command(self):
+        """
+        Test that reconcile_counters fixes drifted counters and leaves correct rows alone.
+        """
+        circulation.borrow(self.book.id, self.borrower)
+        other = Book.objects.create(title='Other Book', author='Test Author', ISBN='0987654321', publication_date='2022-01-01')
+        Borrowing.objects.create(book=other, borrower=self.borrower, borrow_date='2023-01-01', return_date='2023-01-02')
+
+        stdout = StringIO()
+        call_command('reconcile_counters', stdout=stdout)
+        self.assertIn('Corrected 1 books.', stdout.getvalue())
+        self.assertEqual(dict(Book.objects.values_list('ISBN', 'total_loans')), {'1234567890': 1, '0987654321': 1})
+
+    def test_book_list_sorts_by_total_loans(self):
+        """
+        Test that the book list can be sorted by the number of loans.
+        """
+        Book.objects.create(title='Popular Book', author='Test Author', ISBN='0987654321', publication_date='2022-01-01')
+        Book.objects.filter(ISBN='0987654321').update(total_loans=7)
+        User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.client.login(username='adminuser', password='adminpass')
+        response = self.client.get(reverse('book_list'), {'order_by': 'total_loans', 'dir': 'desc'})
+        self.assertEqual([book.title for book in response.context['object_list']], ['Popular Book', 'Test Book'])
+
+    def test_borrower_list_sorts_by_open_loans(self):
+        """
+        Test that the borrower list and API show the open loans counted from the borrowings, and sort by them.
+        """
+        other = User.objects.create_user(username='otheruser', password='otherpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            Borrower.objects.create(name='Another Borrower', user=other, phone_number='0987654321')
+        circulation.borrow(self.book.id, self.borrower)
+        User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.client.login(username='adminuser', password='adminpass')
+        response = self.client.get(reverse('borrower_list'), {'order_by': 'open_loans', 'dir': 'desc'})
+        self.assertEqual(
+            [(borrower.name, borrower.open_loans) for borrower in response.context['object_list']],
+            [('Test Borrower', 1), ('Another Borrower', 0)],
+        )
+        response = self.client.get(reverse('api_borrower_detail', args=[self.borrower.pk]))
+        self.assertEqual(response.json()['open_loans'], 1)
+
+    def test_book_is_never_lent_twice(self):
+        """
+        Test that a lent book cannot be borrowed again and a returned borrowing cannot be returned again.
+        """
+        borrowing = circulation.borrow(self.book.id, self.borrower)
+        with self.assertRaises(ValidationError):
+            circulation.borrow(self.book.id, self.borrower)
+        self.assertEqual(Borrowing.objects.filter(book=self.book).count(), 1)
+        circulation.return_(borrowing.id)
+        with self.assertRaises(ValidationError):
+            circulation.return_(borrowing.id)
+
+    def test_borrow_view_reports_unavailable_book(self):
+        """
+        Test that the borrow view shows an error instead of creating a second borrowing.
+        """
+        self.client.login(username='testuser', password='testpass')
+        circulation.borrow(self.book.id, self.borrower)
+        response = self.client.post(reverse('borrow_book'), {'book_id': self.book.id}, follow=True)
+        self.assertContains(response, 'Book is not available.')
+        self.assertEqual(Borrowing.objects.filter(book=self.book).count(), 1)
+
+    def test_views_report_malformed_ids(self):
+        """
+        Test that a missing or non-numeric id is reported like a missing book or borrowing.
+        """
+        self.client.login(username='testuser', password='testpass')
+        for book_id in ('abc', ''):
+            with self.subTest(book_id=book_id):
+                response = self.client.post(reverse('borrow_book'), {'book_id': book_id}, follow=True)
+                self.assertRedirects(response, reverse('available_books'))
+                self.assertContains(response, 'Book is not available.')
+        with self.assertRaisesMessage(ValidationError, 'Book is not borrowed.'):
+            circulation.return_('abc')
+        self.assertFalse(Borrowing.objects.exists())
+
+class ImportBooksCommandTests(TestCase):
+    def setUp(self):
+        """
+        Set up an existing book whose ISBN appears in the import files.
+        """
+        self.book = Book.objects.create(title='Old Title', author='Old Author', ISBN='0306406152', publication_date='2000-01-01', availability_status=False)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def run_import(self, filename, *args):
+        """
+        Run import_books on a file in the temporary directory and return its output.
+        """
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', os.path.join(self.directory.name, filename), *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv_import_upserts_on_isbn(self):
+        """
+        Test that CSV rows are normalised, inserted or updated by ISBN, and invalid rows are skipped.
+        """
+        with open(os.path.join(self.directory.name, 'books.csv'), 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['Title', 'Author', 'ISBN', 'Publication_Date'])
+            writer.writerow(['New Title', 'New Author', '0-306-40615-2', '2001-02-03'])
+            writer.writerow(['Second Book', 'Someone', '978 0 306 40615 7', '2010-05-06'])
+            writer.writerow(['Bad Checksum', 'Someone', '1234567890', '2010-05-06'])
+            writer.writerow(['Bad Date', 'Someone', '080442957X', 'yesterday'])
+        stdout, stderr = self.run_import('books.csv', '--batch-size', '1')
+
+        self.assertIn('Imported 2 books, skipped 2 invalid rows.', stdout)
+        self.assertIn('rows/s', stdout)
+        self.assertIn('Line 4:', stderr)
+        self.assertIn('Line 5:', stderr)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.title, self.book.author, str(self.book.publication_date)), ('New Title', 'New Author', '2001-02-03'))
+        self.assertFalse(self.book.availability_status)
+        self.assertTrue(Book.objects.filter(ISBN='9780306406157', title='Second Book').exists())
+
+    def test_xlsx_import(self):
+        """
+        Test that XLSX rows, including numeric ISBNs and date cells, are imported.
+        """
+        workbook = Workbook()
+        worksheet = workbook.active
+        worksheet.append(['title', 'author', 'isbn', 'publication_date', 'availability_status'])
+        worksheet.append(['Sheet Book', 'Sheet Author', 9780306406157, datetime.date(2015, 3, 4), 'no'])
+        workbook.save(os.path.join(self.directory.name, 'books.xlsx'))
+        stdout, stderr = self.run_import('books.xlsx')
+
+        self.assertIn('Imported 1 books', stdout)
+        book = Book.objects.get(ISBN='9780306406157')
+        self.assertEqual(book.publication_date, datetime.date(2015, 3, 4))
+        self.assertFalse(book.availability_status)
+
+    def test_batch_and_progress_sizes_must_be_positive(self):
+        """
+        Test that a --batch-size or --progress-every below 1 is rejected before any row is read.
+        """
+        with open(os.path.join(self.directory.name, 'books.csv'), 'w', newline='') as csv_file:
+            csv.writer(csv_file).writerow(['title', 'author', 'isbn', 'publication_date'])
+        for option in ('--batch-size', '--progress-every'):
+            with self.subTest(option=option), self.assertRaisesMessage(CommandError, f'{option} must be at least 1.'):
+                self.run_import('books.csv', option, '0')
+
+class ProvisionBorrowersTests(TestCase):
+    def setUp(self):
+        """
+        Set up a user whose username and email the CSV repeats, and the CSV file.
+        """
+        User.objects.create_user(username='taken', password='Userpass001', email='Taken@Example.com')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'borrowers.csv')
+        with open(self.path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['Username', 'Name', 'Phone_Number', 'Email', 'Password'])
+            writer.writerow(['student1', 'First Student', '5550001', 'student1@example.com', 'Student001'])
+            writer.writerow(['student2', 'Second Student', '5550002', '', ''])
+            writer.writerow(['student3', 'Bad Password', '5550003', '', 'short'])
+            writer.writerow(['student1', 'Repeated', '5550004', '', ''])
+            writer.writerow(['taken', 'Taken Username', '5550005', '', ''])
+            writer.writerow(['student6', 'Taken Email', '5550006', 'taken@example.com', ''])
+
+    def assert_provisioned(self):
+        """
+        Check that the valid rows became borrowers, as the Borrower signals would make them.
+        """
+        self.assertEqual(Borrower.objects.count(), 2)
+        student1 = User.objects.get(username='student1')
+        self.assertTrue(student1.check_password('Student001'))
+        self.assertFalse(User.objects.get(username='student2').has_usable_password())
+        self.assertEqual(student1.borrower.name, 'First Student')
+        for username in ('student1', 'student2'):
+            user = User.objects.get(username=username)
+            self.assertEqual(list(user.groups.values_list('name', flat=True)), [BORROWER_GROUP])
+            self.assertTrue(user.has_perms(('book_management.can_borrow', 'book_management.can_return')))
+        self.assertFalse(User.objects.filter(username__in=['student3', 'student6']).exists())
+
+    def test_command_provisions_borrowers_in_bulk(self):
+        """
+        Test that valid rows are created in bulk, without per-row role tasks, and the others reported.
+        """
+        stdout, stderr = StringIO(), StringIO()
+        with mock.patch.object(tasks.sync_borrower_roles, 'delay') as delay:
+            call_command('provision_borrowers', self.path, '--workers', '1', stdout=stdout, stderr=stderr)
+        delay.assert_not_called()
+        self.assertIn('Created 2 borrowers, skipped 4 rows', stdout.getvalue())
+        for line in (4, 5, 6, 7):
+            self.assertIn(f'Line {line}:', stderr.getvalue())
+        self.assert_provisioned()
+
+    def test_names_taken_during_the_run_are_skipped(self):
+        """
+        Test that a username taken after the batch was checked is reported and skipped, and the rest of the batch is created.
+        """
+        drop_taken = BorrowerProvisioner.drop_taken
+
+        def taken_meanwhile(provisioner, batch):
+            # A signup takes student2 between the check and the insert.
+            free = drop_taken(provisioner, batch)
+            if any(values['username'] == 'student2' for line_number, values in free) and not User.objects.filter(username='student2').exists():
+                User.objects.create_user(username='student2')
+            return free
+
+        stderr = StringIO()
+        with mock.patch.object(BorrowerProvisioner, 'drop_taken', taken_meanwhile):
+            call_command('provision_borrowers', self.path, '--workers', '1', stdout=StringIO(), stderr=stderr)
+        self.assertIn("Line 3: The username 'student2' is already in use.", stderr.getvalue())
+        self.assertTrue(Borrower.objects.filter(user__username='student1').exists())
+        self.assertFalse(Borrower.objects.filter(user__username='student2').exists())
+
+    def test_passwords_are_hashed_in_a_process_pool(self):
+        """
+        Test that hashing across worker processes gives usable password hashes.
+        """
+        call_command('provision_borrowers', self.path, '--workers', '2', '--batch-size', '1', stdout=StringIO(), stderr=StringIO())
+        self.assert_provisioned()
+
+    def test_admin_upload_provisions_borrowers(self):
+        """
+        Test that an admin can provision borrowers by uploading the CSV file.
+        """
+        User.objects.create_superuser(username='admin', password='Adminpass001', email='admin@example.com')
+        self.client.login(username='admin', password='Adminpass001')
+        url = reverse('admin:book_management_borrower_provision')
+        self.assertContains(self.client.get(reverse('admin:book_management_borrower_changelist')), url)
+        with override_settings(PROVISIONING_WORKERS=1), open(self.path, 'rb') as csv_file:
+            response = self.client.post(url, {'csv_file': csv_file}, follow=True)
+        self.assertContains(response, 'Created 2 borrowers, skipped 4 rows.')
+        self.assert_provisioned()
+
+
+class BorrowingExportTests(TestCase):
+    def setUp(self):
+        """
+        Set up two returned borrowings and one open borrowing, and log in as a librarian.
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.client.login(username='adminuser', password='adminpass')
+        for i, title in enumerate(['Alpha', 'Beta', 'Gamma']):
+            book = Book.objects.create(title=title, author='Test Author', ISBN=f'123456789{i}', publication_date='2022-01-01')
+            Borrowing.objects.create(borrower=self.borrower, book=book, borrow_date=f'2023-01-0{i + 1}', return_date=None if title == 'Gamma' else '2023-02-01')
+
+    def test_csv_export_streams_filtered_history(self):
+        """
+        Test that the CSV export streams returned borrowings honouring q, order_by and dir.
+        """
+        response = self.client.get(reverse('borrowing_history_export'), {'order_by': 'book__title', 'dir': 'desc'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][1], 'Book Title')
+        self.assertEqual([row[1] for row in rows[1:]], ['Beta', 'Alpha'])
+        self.assertEqual(rows[1][5:], ['testuser', '2023-01-02', '2023-02-01'])
+
+        response = self.client.get(reverse('borrowing_history_export'), {'q': 'alp'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row[1] for row in rows[1:]], ['Alpha'])
+
+    def test_xlsx_export(self):
+        """
+        Test that the XLSX export contains the header and the returned borrowings.
+        """
+        response = self.client.get(reverse('borrowing_history_export'), {'format': 'xlsx'})
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][1], 'Alpha')
+
+    def test_export_requires_librarian(self):
+        """
+        Test that borrowers cannot export the history.
+        """
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('borrowing_history_export'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_command(self):
+        """
+        Test that export_borrowings writes the same rows to stdout.
+        """
+        stdout = StringIO()
+        call_command('export_borrowings', '--dir', 'desc', stdout=stdout)
+        rows = list(csv.reader(stdout.getvalue().splitlines()))
+        self.assertEqual([row[1] for row in rows[1:]], ['Beta', 'Alpha'])
+
+@override_settings(ARCHIVE_HORIZON_CACHE_TIMEOUT=0)
+class BorrowingArchiveTests(TestCase):
+    def setUp(self):
+        """
+        Set up returned borrowings from 2022 and 2024, an open one from 2022, and log in as a librarian.
+        """
+        # Another test may have cached the horizon of its own, rolled back, database.
+        cache.delete(archive.HORIZON_KEY)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.client.login(username='adminuser', password='adminpass')
+        self.old, self.recent = [], []
+        for i, borrow_date in enumerate(['2022-03-01', '2024-01-01', '2022-01-01', '2024-02-01', '2022-02-01', '2024-03-01']):
+            book = Book.objects.create(title=f'Book {i}', author='Test Author', ISBN=f'123456789{i}', publication_date='2020-01-01')
+            borrowing = circulation.borrow(book.pk, self.borrower)
+            Borrowing.objects.filter(pk=borrowing.pk).update(borrow_date=borrow_date)
+            circulation.return_(borrowing.pk)
+            (self.old if borrow_date < '2023' else self.recent).append(borrowing.pk)
+        book = Book.objects.create(title='Open', author='Test Author', ISBN='1234567899', publication_date='2020-01-01')
+        self.open = circulation.borrow(book.pk, self.borrower)
+        Borrowing.objects.filter(pk=self.open.pk).update(borrow_date='2022-01-15')
+
+    def history_ids(self, name='borrowing_history', **params):
+        """
+        Return the ids listed on every page of a history list, following the cursors.
+        """
+        ids = []
+        while True:
+            page = self.client.get(reverse(name), params).context['page_obj']
+            ids.extend(borrowing.pk for borrowing in page)
+            if page.next_cursor is None:
+                return ids
+            params['cursor'] = page.next_cursor
+
+    def test_command_moves_old_returned_borrowings(self):
+        """
+        Test that archive_borrowings moves only returned borrowings before the horizon,
+        keeps their ids and the books' loan counts, and exports them to gzipped JSON Lines.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archive.jsonl.gz')
+            call_command('archive_borrowings', '--before', '2023-01-01', '--batch-size', '2', '--export', path, stdout=StringIO())
+            with gzip.open(path, 'rt', encoding='utf-8') as export_file:
+                exported = [json.loads(line) for line in export_file]
+
+        self.assertEqual(sorted(ArchivedBorrowing.objects.values_list('id', flat=True)), sorted(self.old))
+        self.assertEqual(sorted(Borrowing.objects.values_list('id', flat=True)), sorted(self.recent + [self.open.pk]))
+        self.assertEqual(sorted(row['id'] for row in exported), sorted(self.old))
+        self.assertEqual(exported[0]['borrow_date'][:4], '2022')
+        self.assertEqual(set(Book.objects.exclude(title='Open').values_list('total_loans', flat=True)), {1})
+        self.assertEqual(circulation.reconcile_counters(), {'books': 0})
+        self.assertEqual(archive.get_archive_horizon(), datetime.date(2023, 1, 1))
+
+    def test_run_waits_for_cached_horizons_to_expire(self):
+        """
+        Test that a run moving the horizon waits out the horizon cache timeout before it
+        moves any rows, and that a run at the same horizon does not wait.
+        """
+        with override_settings(ARCHIVE_HORIZON_CACHE_TIMEOUT=30), mock.patch('book_management.archive.time.sleep') as sleep:
+            self.assertFalse(archive.needs_archive())
+            sleep.side_effect = lambda seconds: self.assertEqual(ArchivedBorrowing.objects.count(), 0)
+            archive.archive_borrowings(datetime.date(2023, 1, 1))
+            sleep.assert_called_once_with(30)
+            self.assertTrue(archive.needs_archive())
+            archive.archive_borrowings(datetime.date(2023, 1, 1))
+            sleep.assert_called_once_with(30)
+        self.assertEqual(ArchivedBorrowing.objects.count(), 3)
+
+    def test_interrupted_run_resumes(self):
+        """
+        Test that a run stopped after a batch leaves that batch archived and the next run moves the rest.
+        """
+        horizon = datetime.date(2023, 1, 1)
+        self.assertEqual(archive.archive_borrowings(horizon, batch_size=2, max_batches=1), 2)
+        self.assertEqual(ArchivedBorrowing.objects.count(), 2)
+        self.assertEqual(archive.archive_borrowings(horizon, batch_size=2), 1)
+        self.assertEqual(archive.archive_borrowings(horizon), 0)
+        self.assertEqual(ArchivedBorrowing.objects.count(), 3)
+
+    def test_history_merges_archive(self):
+        """
+        Test that the history lists archived and live borrowings together in borrow date
+        order, by cursor and by page, and that borrowers see their archived loans.
+        """
+        expected = list(Borrowing.objects.filter(return_date__isnull=False).order_by('-borrow_date', '-id').values_list('id', flat=True))
+        archive.archive_borrowings(datetime.date(2023, 1, 1))
+
+        self.assertEqual(self.history_ids(dir='desc'), expected)
+        self.assertEqual(self.history_ids(dir='asc'), expected[::-1])
+        with override_settings(BORROWING_PAGINATION_MODE='offset'):
+            pages = [self.client.get(reverse('borrowing_history'), {'dir': 'desc', 'page': page}).context['page_obj'] for page in (1, 2)]
+        self.assertEqual(pages[0].paginator.count, 6)
+        self.assertEqual([borrowing.pk for page in pages for borrowing in page], expected)
+        self.assertEqual(self.history_ids(dir='desc', until='2022-02-15'), expected[-2:])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower.user.groups.add(Group.objects.get(name=BORROWER_GROUP))
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.history_ids('borrower_borrowing_history', dir='desc'), expected)
+
+    def test_recent_range_skips_archive(self):
+        """
+        Test that a range starting after the horizon reads the borrowing table alone.
+        """
+        archive.archive_borrowings(datetime.date(2023, 1, 1))
+        with CaptureQueriesContext(connection) as captured:
+            ids = self.history_ids(since='2023-06-01')
+        self.assertEqual(sorted(ids), sorted(self.recent))
+        self.assertFalse([query for query in captured.captured_queries if 'archivedborrowing' in query['sql']])
+
+    def test_archived_detail_and_export(self):
+        """
+        Test that an archived borrowing's detail page resolves, and that the export
+        includes archived rows only when the range needs them.
+        """
+        archive.archive_borrowings(datetime.date(2023, 1, 1))
+        response = self.client.get(reverse('borrowing_detail', args=[self.old[0]]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['borrowing'].book.title, 'Book 0')
+
+        response = self.client.get(reverse('borrowing_history_export'), {'order_by': 'book__title'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row[1] for row in rows[1:]], [f'Book {i}' for i in range(6)])
+        response = self.client.get(reverse('borrowing_history_export'), {'since': '2023-06-01'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(sorted(int(row[0]) for row in rows[1:]), sorted(self.recent))
+
+class BorrowerRoleSignalTests(TestCase):
+    def setUp(self):
+        """
+        Set up two users and a borrower for the first one.
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.user2 = User.objects.create_user(username='testuser2', password='testpass2')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+
+    def has_borrower_rights(self, user):
+        """
+        Reload the user and check both borrower permissions.
+        """
+        user = User.objects.get(pk=user.pk)
+        return user.has_perm('book_management.can_borrow') and user.has_perm('book_management.can_return')
+
+    def test_borrower_rights_come_from_group(self):
+        """
+        Test that creating a borrower adds the user to the Borrower group instead of granting per-user permissions.
+        """
+        self.assertTrue(self.user.groups.filter(name=BORROWER_GROUP).exists())
+        self.assertFalse(self.user.user_permissions.exists())
+        self.assertTrue(self.has_borrower_rights(self.user))
+
+    def test_save_without_user_change_costs_one_query(self):
+        """
+        Test that saving a borrower whose user did not change runs only the UPDATE.
+        """
+        borrower = Borrower.objects.get(pk=self.borrower.pk)
+        borrower.name = 'Renamed Borrower'
+        with self.assertNumQueries(1):
+            borrower.save()
+
+    def test_changing_user_moves_rights(self):
+        """
+        Test that changing a borrower's user moves the borrower rights to the new user.
+        """
+        self.borrower.user = self.user2
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower.save()
+        self.assertFalse(self.has_borrower_rights(self.user))
+        self.assertTrue(self.has_borrower_rights(self.user2))
+
+    def test_delete_revokes_rights(self):
+        """
+        Test that deleting a borrower removes the user's borrower rights.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower.delete()
+        self.assertFalse(self.has_borrower_rights(self.user))
+
+    def test_role_changes_wait_for_commit(self):
+        """
+        Test that the rights are granted by a task queued for after the commit, and that
+        nothing is queued when the transaction rolls back.
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            Borrower.objects.create(name='Second Borrower', user=self.user2, phone_number='1234567891')
+        self.assertFalse(self.has_borrower_rights(self.user2))
+        self.assertEqual(len(callbacks), 1)
+        with mock.patch.object(tasks.sync_borrower_roles, 'delay') as delay:
+            callbacks[0]()
+        delay.assert_called_once_with(self.user2.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    Borrower.objects.filter(pk=self.borrower.pk).get().delete()
+                    raise ValidationError('Rolled back.')
+            except ValidationError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    def test_sync_task_follows_current_rows(self):
+        """
+        Test that the role task grants or revokes from the borrower rows, whatever order it runs in.
+        """
+        Borrower.objects.filter(pk=self.borrower.pk).update(user=self.user2)
+        tasks.sync_borrower_roles.delay(self.user2.pk, self.user.pk)
+        self.assertFalse(self.has_borrower_rights(self.user))
+        self.assertTrue(self.has_borrower_rights(self.user2))
+        tasks.sync_borrower_roles.delay(self.user2.pk)
+        self.assertTrue(self.has_borrower_rights(self.user2))
+
+
+class IdentitySnapshotTests(TestCase):
+    def setUp(self):
+        """
+        Set up a borrower with a book on loan.
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        book = Book.objects.create(title='Test Book', author='Test Author', ISBN='1234567890123', publication_date='2022-01-01')
+        self.borrowing = circulation.borrow(book.pk, self.borrower)
+
+    def test_borrower_page_reads_identity_from_cache(self):
+        """
+        Test that once warm, a borrower's page only reads the user and the page of loans.
+        """
+        self.client.login(username='testuser', password='testpass')
+        self.client.get(reverse('borrower_pending_borrowing'))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('borrower_pending_borrowing'))
+        self.assertContains(response, 'Test Book')
+        self.assertEqual(response.wsgi_request.borrower.borrower_id, self.borrower.pk)
+
+    def test_identity_follows_role_and_permission_changes(self):
+        """
+        Test that the cached identity is dropped when the borrower role, the group's
+        permissions or the staff flag change.
+        """
+        identity = get_identity(User.objects.get(pk=self.user.pk))
+        self.assertEqual(identity.borrower_id, self.borrower.pk)
+        self.assertTrue(identity.has_perms(('book_management.can_borrow', 'book_management.can_return')))
+        self.assertIsNotNone(cache.get(get_identity_key(self.user.pk)))
+
+        Group.objects.get(name=BORROWER_GROUP).permissions.remove(Permission.objects.get(codename='can_return'))
+        self.assertIsNone(cache.get(get_identity_key(self.user.pk)))
+        self.assertFalse(User.objects.get(pk=self.user.pk).has_perm('book_management.can_return'))
+
+        circulation.return_(self.borrowing.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower.delete()
+        identity = get_identity(User.objects.get(pk=self.user.pk))
+        self.assertIsNone(identity.borrower_id)
+        self.assertFalse(identity.has_perm('book_management.can_borrow'))
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(get_identity(User.objects.get(pk=self.user.pk)).is_staff)
+
+class SeedLibraryCommandTests(TestCase):
+    def snapshot(self):
+        """
+        Return the generated borrowings in an id-independent form.
+        """
+        return list(Borrowing.objects.order_by('book__ISBN', 'borrow_date', 'id').values_list(
+            'book__ISBN', 'borrower__user__username', 'borrow_date', 'return_date',
+        ))
+
+    def test_seed_library_creates_consistent_data(self):
+        """
+        Test that seed_library creates the requested rows, grants borrower rights and keeps availability consistent.
+        """
+        stdout = StringIO()
+        call_command('seed_library', '--books', '40', '--borrowers', '10', '--borrowings', '300', '--open-ratio', '0.5', '--batch-size', '50', stdout=stdout)
+        self.assertIn('Created 40 books, 10 borrowers and 300 borrowings', stdout.getvalue())
+        self.assertEqual(Borrower.objects.count(), 10)
+        self.assertEqual(User.objects.filter(groups__name=BORROWER_GROUP).count(), 10)
+
+        open_loans = Borrowing.objects.filter(return_date__isnull=True)
+        self.assertTrue(open_loans.exists())
+        self.assertEqual(open_loans.values('book').distinct().count(), open_loans.count())
+        self.assertEqual(set(open_loans.values_list('book', flat=True)), set(Book.objects.filter(availability_status=False).values_list('id', flat=True)))
+        self.assertFalse(Borrowing.objects.filter(return_date__lt=models.F('borrow_date')).exists())
+
+    def test_seed_is_reproducible(self):
+        """
+        Test that the same seed and sizes produce the same borrowings.
+        """
+        snapshots = []
+        for attempt in range(2):
+            with transaction.atomic():
+                LibrarySeeder(books=20, borrowers=5, borrowings=100, seed=7, end_date=datetime.date(2024, 1, 1)).run()
+                snapshots.append(self.snapshot())
+                transaction.set_rollback(True)
+        self.assertEqual(len(snapshots[0]), 100)
+        self.assertEqual(snapshots[0], snapshots[1])
+
+    def test_seed_library_refuses_existing_prefix(self):
+        """
+        Test that seed_library does not reuse an existing username prefix.
+        """
+        User.objects.create_user(username='reader0')
+        with self.assertRaises(CommandError):
+            call_command('seed_library', '--books', '1', '--borrowers', '1', '--borrowings', '1', stdout=StringIO())
+
+
+class CirculationIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Seed a small library with open and returned borrowings.
+        """
+        LibrarySeeder(books=60, borrowers=8, borrowings=400, open_ratio=0.3, end_date=datetime.date(2024, 1, 31)).run()
+        cls.librarian = User.objects.create_user(username='librarian', is_staff=True)
+        cls.borrower = Borrower.objects.select_related('user').order_by('id').first()
+
+    def plan(self, queryset):
+        """
+        Return the query plan of queryset, steering PostgreSQL away from sequential scans
+        which it would otherwise prefer on a table this small.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def view_queryset(self, view_class, user):
+        """
+        Return the queryset view_class lists for user.
+        """
+        request = RequestFactory().get('/')
+        request.user = user
+        request.borrower = get_identity(user)
+        view = view_class()
+        view.setup(request)
+        return view.get_queryset()
+
+    def test_pending_borrowings_use_partial_index(self):
+        """
+        Test that the librarian's pending list reads open loans from the partial index.
+        """
+        self.assertIn('borrowing_open_idx', self.plan(self.view_queryset(PendingBorrowing, self.librarian)))
+
+    def test_borrower_lists_use_borrower_index(self):
+        """
+        Test that a borrower's pending and history lists use the borrower composite index.
+        """
+        for view_class in (BorrowerPendingBrrowingListView, BorrowerBorrowingHistoryView):
+            with self.subTest(view=view_class.__name__):
+                self.assertIn('borrowing_borrower_idx', self.plan(self.view_queryset(view_class, self.borrower.user)))
+
+    def test_pending_return_checks_use_composite_indexes(self):
+        """
+        Test that the delete guards on books and borrowers use the composite indexes.
+        """
+        book = Book.objects.order_by('id').first()
+        self.assertIn('borrowing_book_idx', self.plan(book.borrowing_set.filter(return_date__isnull=True)))
+        self.assertIn('borrowing_borrower_idx', self.plan(self.borrower.borrowing_set.filter(return_date__isnull=True)))
+
+    def test_open_loan_counts_use_borrower_index(self):
+        """
+        Test that the borrower list counts each borrower's open loans from the borrower composite index.
+        """
+        self.assertIn('borrowing_borrower_idx', self.plan(self.view_queryset(BorrowerListView, self.librarian)))
+
+    def test_overdue_refresh_uses_due_date_index(self):
+        """
+        Test that the overdue refresh finds newly due loans with a range scan of the open-loans-by-due-date index.
+        """
+        queryset = Borrowing.objects.filter(
+            return_date__isnull=True, due_date__lt=datetime.date(2024, 1, 31), due_date__gte=datetime.date(2024, 1, 30),
+        )
+        self.assertIn('borrowing_open_due_idx', self.plan(queryset))
+
+    def test_available_books_use_availability_index(self):
+        """
+        Test that the available books listing uses book_available_title_idx, the partial index on title where availability_status is true.
+        """
+        self.assertIn('book_available_title_idx', self.plan(self.view_queryset(AvailableBooksAnoymous, self.librarian)))
+
+
+class BorrowingProjectionTests(TestCase):
+    def setUp(self):
+        """
+        Set up a librarian and a borrower with five open borrowings.
+        """
+        self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass', email='testuser@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        self.borrowings = [
+            Borrowing.objects.create(
+                borrower=self.borrower,
+                book=Book.objects.create(title=f'Book {i}', author='Test Author', ISBN=f'123456789{i}', publication_date='2022-01-01', availability_status=False),
+                borrow_date='2023-01-01',
+            )
+            for i in range(5)
+        ]
+        self.client.force_login(self.admin_user)
+
+    def count_queries(self, url):
+        """
+        Return the number of queries a GET of url runs.
+        """
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_listing_query_count_does_not_grow_with_rows(self):
+        """
+        Test that the pending list costs the same number of queries for one row as for five.
+        """
+        Borrowing.objects.filter(pk__in=[b.pk for b in self.borrowings[1:]]).update(return_date='2023-01-02')
+        one_row = self.count_queries(reverse('pending_borrowing'))
+        Borrowing.objects.update(return_date=None)
+        self.assertEqual(self.count_queries(reverse('pending_borrowing')), one_row)
+
+    def test_detail_joins_book_borrower_and_user(self):
+        """
+        Test that for_detail() loads everything the borrowing detail page shows in one query.
+        """
+        with self.assertNumQueries(1):
+            borrowing = Borrowing.objects.for_detail().get(pk=self.borrowings[0].pk)
+            self.assertEqual(borrowing.book.title, 'Book 0')
+            self.assertEqual(borrowing.borrower.user.email, 'testuser@example.com')
+
+
+class CachedCountPaginatorTests(TestCase):
+    def setUp(self):
+        """
+        Set up twenty books and log in as a librarian.
+        """
+        cache.clear()
+        self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+        self.client.force_login(self.admin_user)
+        Book.objects.bulk_create([
+            Book(title=f'Book {i:02d}', author='Test Author', ISBN=f'12345678{i:02d}', publication_date='2022-01-01')
+            for i in range(20)
+        ])
+
+    def count_queries(self, params=None):
+        """
+        Request the book list and return the response and the COUNT queries it ran.
+        """
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('book_list'), params or {})
+        return response, [query for query in captured if 'COUNT(' in query['sql']]
+
+    def test_count_is_cached_per_filter(self):
+        """
+        Test that a list's count is computed once per filter and search.
+        """
+        response, counts = self.count_queries()
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(response.context['paginator'].count, 20)
+        response, counts = self.count_queries({'page': 2, 'order_by': 'author'})
+        self.assertEqual(counts, [])
+        response, counts = self.count_queries({'q': 'Book 1'})
+        self.assertEqual(len(counts), 1)
+
+    def test_writes_invalidate_cached_counts(self):
+        """
+        Test that saving a book and returning a borrowing drop the cached counts.
+        """
+        self.count_queries()
+        Book.objects.create(title='Book 20', author='Test Author', ISBN='1234567820', publication_date='2022-01-01')
+        response, counts = self.count_queries()
+        self.assertEqual(response.context['paginator'].count, 21)
+
+        self.count_queries()
+        user = User.objects.create_user(username='testuser', password='testpass')
+        borrower = Borrower.objects.create(name='Test Borrower', user=user, phone_number='1234567890')
+        borrowing = circulation.borrow(Book.objects.get(ISBN='1234567820').pk, borrower)
+        self.count_queries()
+        circulation.return_(borrowing.pk)
+        response, counts = self.count_queries()
+        self.assertEqual(len(counts), 1)
+
+    @override_settings(PAGINATION_ESTIMATE_THRESHOLD=1000)
+    def test_large_unfiltered_lists_use_planner_estimate(self):
+        """
+        Test that an unfiltered list over a large table shows an estimated page count without
+        counting, and that the estimate is cached like a count.
+        """
+        with mock.patch('book_management.pagination.estimate_table_rows', return_value=5000) as estimate:
+            response, counts = self.count_queries()
+            self.assertEqual(counts, [])
+            self.assertTrue(response.context['paginator'].is_estimate)
+            self.assertContains(response, 'Page 1 of ~625')
+            self.assertTrue(response.context['page_obj'].has_next())
+
+            response, counts = self.count_queries({'page': 3})
+            self.assertTrue(response.context['paginator'].is_estimate)
+            self.assertFalse(response.context['page_obj'].has_next())
+            self.assertEqual(estimate.call_count, 1)
+
+            response, counts = self.count_queries({'q': 'Book'})
+            self.assertFalse(response.context['paginator'].is_estimate)
+            self.assertEqual(len(counts), 1)
+
+
+class AvailableBooksPageCacheTests(TestCase):
+    def setUp(self):
+        """
+        Set up two books, a borrower and a user without a borrower profile.
+        """
+        cache.clear()
+        self.book = Book.objects.create(title='Test Book', author='Test Author', ISBN='1234567890', publication_date='2022-01-01')
+        Book.objects.create(title='Other Book', author='Other Author', ISBN='0987654321', publication_date='2022-01-01')
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        self.visitor = User.objects.create_user(username='visitor', password='visitorpass')
+
+    def get_titles(self, name, params=None):
+        """
+        Request an available-books page and return the titles listed and the queries on books.
+        """
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse(name), params or {})
+        book_queries = [query for query in captured if 'book_management_book' in query['sql']]
+        return [book.title for book in response.context['object_list']], book_queries
+
+    def test_repeated_pages_are_served_from_cache(self):
+        """
+        Test that a repeated page, even for another user or search case, does not query books.
+        """
+        self.client.force_login(self.visitor)
+        titles, queries = self.get_titles('available_books_anonymous', {'q': 'Book'})
+        self.assertCountEqual(titles, ['Other Book', 'Test Book'])
+        self.assertTrue(queries)
+        self.client.force_login(self.user)
+        self.client.force_login(self.visitor)
+        cached_titles, queries = self.get_titles('available_books_anonymous', {'q': ' book '})
+        self.assertEqual(cached_titles, titles)
+        self.assertEqual(queries, [])
+
+    def test_book_writes_and_circulation_retire_cached_pages(self):
+        """
+        Test that saving a book and borrowing one change what the cached pages show.
+        """
+        self.client.force_login(self.user)
+        self.get_titles('available_books')
+        self.book.title = 'Renamed Book'
+        self.book.save()
+        titles, queries = self.get_titles('available_books')
+        self.assertEqual(titles, ['Other Book', 'Renamed Book'])
+
+        self.client.post(reverse('borrow_book'), {'book_id': self.book.pk})
+        titles, queries = self.get_titles('available_books')
+        self.assertEqual(titles, ['Other Book'])
+
+    def test_single_flight_waits_for_the_computing_process(self):
+        """
+        Test that a miss on a key another process is computing waits for its value instead of computing it.
+        """
+        cache.add('key:lock', 1)
+        compute = mock.Mock(return_value='mine')
+        with mock.patch('book_management.page_cache.time.sleep', side_effect=lambda seconds: cache.set('key', 'theirs')):
+            self.assertEqual(page_cache.get_or_compute('key', compute, 60), 'theirs')
+        compute.assert_not_called()
+
+
+class KioskApiTests(TestCase):
+    def setUp(self):
+        """
+        Set up three books, a borrower with an open borrowing, a second borrower and a librarian.
+        """
+        self.books = [
+            Book.objects.create(title=f'Book {i}', author='Test Author', ISBN=f'123456789{i}', publication_date='2022-01-01')
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user(username='testuser', password='testpass', email='testuser@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        self.other_user = User.objects.create_user(username='otheruser', password='otherpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_borrower = Borrower.objects.create(name='Other Borrower', user=self.other_user, phone_number='1234567891')
+        self.other_borrowing = circulation.borrow(self.books[2].pk, self.other_borrower)
+        self.admin_user = User.objects.create_user(username='adminuser', password='adminpass', is_staff=True)
+
+    def post_json(self, name, payload):
+        """
+        POST payload as JSON to the named route.
+        """
+        return self.client.post(reverse(name), payload, content_type='application/json')
+
+    def test_sparse_fieldsets_and_keyset_pages(self):
+        """
+        Test that lists return only the requested fields and page by id.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_book_list'), {'fields': 'title,isbn', 'page_size': 2})
+        data = response.json()
+        self.assertEqual(data['results'], [{'title': 'Book 0', 'isbn': '1234567890'}, {'title': 'Book 1', 'isbn': '1234567891'}])
+        response = self.client.get(reverse('api_book_list'), {'fields': 'title', 'after': data['next']})
+        self.assertEqual(response.json(), {'results': [{'title': 'Book 2'}], 'next': None})
+
+        response = self.client.get(reverse('api_book_detail', args=[self.books[0].pk]), {'fields': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_resources_respect_roles(self):
+        """
+        Test that borrowers see only their own borrowings and cannot list borrowers.
+        """
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('api_borrower_list')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('api_borrowing_list')).json()['results'], [])
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_book_list')).status_code, 401)
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('api_borrower_detail', args=[self.borrower.pk]), {'fields': 'name,email'})
+        self.assertEqual(response.json(), {'name': 'Test Borrower', 'email': 'testuser@example.com'})
+        response = self.client.get(reverse('api_borrowing_list'), {'fields': 'book_title,borrower_name', 'open': 'true'})
+        self.assertEqual(response.json()['results'], [{'book_title': 'Book 2', 'borrower_name': 'Other Borrower'}])
+
+    @override_settings(ARCHIVE_HORIZON_CACHE_TIMEOUT=0)
+    def test_archived_borrowings_are_served(self):
+        """
+        Test that borrowings moved to the archive are still listed, paged and shown by id,
+        to their borrower and librarians only.
+        """
+        cache.delete(archive.HORIZON_KEY)
+        self.addCleanup(cache.delete, archive.HORIZON_KEY)
+        returned = circulation.borrow(self.books[0].pk, self.borrower)
+        circulation.return_(returned.pk)
+        live = circulation.borrow(self.books[1].pk, self.borrower)
+        Borrowing.objects.filter(pk=returned.pk).update(borrow_date=datetime.date(2020, 1, 1))
+        archive.archive_borrowings(datetime.date(2021, 1, 1))
+        self.assertTrue(ArchivedBorrowing.objects.filter(pk=returned.pk).exists())
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_borrowing_list'), {'fields': 'id,book_title', 'page_size': 1})
+        data = response.json()
+        self.assertEqual(data['results'], [{'id': returned.pk, 'book_title': 'Book 0'}])
+        response = self.client.get(reverse('api_borrowing_list'), {'fields': 'id,book_title', 'after': data['next']})
+        self.assertEqual(response.json(), {'results': [{'id': live.pk, 'book_title': 'Book 1'}], 'next': None})
+        response = self.client.get(reverse('api_borrowing_list'), {'fields': 'id', 'open': 'false'})
+        self.assertEqual(response.json()['results'], [{'id': returned.pk}])
+        response = self.client.get(reverse('api_borrowing_detail', args=[returned.pk]), {'fields': 'book_id,return_date'})
+        self.assertEqual(response.json(), {'book_id': self.books[0].pk, 'return_date': timezone.localdate().isoformat()})
+
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.client.get(reverse('api_borrowing_detail', args=[returned.pk])).status_code, 404)
+
+    def test_book_search_is_not_ranked(self):
+        """
+        Test that the book list filters by the search without computing a relevance rank it
+        would discard, and keeps its id order.
+        """
+        queryset = search_books(Book.objects.all(), 'Book', ranked=False)
+        self.assertNotIn('search_rank', queryset.query.annotations)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_book_list'), {'fields': 'id', 'q': 'Book'})
+        self.assertEqual(response.json()['results'], [{'id': book.pk} for book in self.books])
+
+    def test_batch_borrow_reports_each_item(self):
+        """
+        Test that a batch borrow lends the available books and reports the unavailable one.
+        """
+        self.client.force_login(self.user)
+        book_ids = [book.pk for book in self.books]
+        response = self.post_json('api_borrow', {'book_ids': book_ids})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['succeeded'], 2)
+        self.assertEqual([result['ok'] for result in data['results']], [True, True, False])
+        self.assertEqual(data['results'][2]['errors'], ['Book is not available.'])
+        self.assertEqual(Borrowing.objects.filter(borrower=self.borrower, return_date__isnull=True).count(), 2)
+
+        returned = self.post_json('api_return', {'borrowing_ids': [data['results'][0]['borrowing_id'], data['results'][0]['borrowing_id']]}).json()
+        self.assertEqual([result['ok'] for result in returned['results']], [True, False])
+        self.assertTrue(Book.objects.get(pk=book_ids[0]).availability_status)
+
+    def test_batch_endpoints_check_permissions_and_input(self):
+        """
+        Test that the batch endpoints require the borrower permissions and a list of ids.
+        """
+        self.client.force_login(self.admin_user)
+        self.assertEqual(self.post_json('api_borrow', {'book_ids': [self.books[0].pk]}).status_code, 403)
+        self.assertEqual(self.post_json('api_return', {'borrowing_ids': [self.other_borrowing.pk]}).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.post_json('api_borrow', {'book_ids': 'all'}).status_code, 400)
+        self.assertEqual(self.post_json('api_borrow', {'book_ids': list(range(1, 100))}).status_code, 400)
+        self.assertTrue(Book.objects.get(pk=self.books[0].pk).availability_status)
+
+
+@override_settings(ARCHIVE_HORIZON_CACHE_TIMEOUT=0)
+class AsyncListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Seed a small library and create a librarian and a plain user.
+        """
+        LibrarySeeder(books=30, borrowers=5, borrowings=60, open_ratio=0.3, end_date=datetime.date(2024, 1, 31)).run()
+        cls.librarian = User.objects.create_user(username='librarian', is_staff=True)
+        cls.visitor = User.objects.create_user(username='visitor')
+
+    def setUp(self):
+        cache.clear()
+
+    def request(self, user, params=None):
+        """
+        Return a GET request made by user.
+        """
+        request = RequestFactory().get('/', params or {})
+        request.user = user
+        return request
+
+    async def render(self, view_class, request):
+        """
+        Call view_class like the ASGI handler would and return the rendered response.
+        """
+        view = view_class.as_view()
+        if view_class.view_is_async:
+            response = await view(request)
+        else:
+            response = await sync_to_async(view)(request)
+        if hasattr(response, 'render'):
+            await sync_to_async(response.render)()
+        return response
+
+    async def test_async_views_match_sync_views(self):
+        """
+        Test that each async list view renders the same page as its sync version.
+        """
+        pairs = [
+            (AvailableBooksAnoymous, async_views.AvailableBooksAnoymousAsync, self.visitor, {'page': 2}),
+            (BookListView, async_views.BookListAsyncView, self.librarian, {'order_by': 'author', 'page': 3}),
+            (BorrowingHistoryView, async_views.BorrowingHistoryAsyncView, self.librarian, {'order_by': 'book__title'}),
+        ]
+        for sync_class, async_class, user, params in pairs:
+            with self.subTest(view=async_class.__name__):
+                self.assertTrue(async_class.view_is_async)
+                sync_response = await self.render(sync_class, self.request(user, params))
+                async_response = await self.render(async_class, self.request(user, params))
+                self.assertEqual(async_response.status_code, 200)
+                self.assertEqual(
+                    [obj.pk for obj in async_response.context_data['object_list']],
+                    [obj.pk for obj in sync_response.context_data['object_list']],
+                )
+                self.assertEqual(async_response.content, sync_response.content)
+
+    async def test_async_views_check_access(self):
+        """
+        Test that the async views refuse the users their sync versions refuse.
+        """
+        response = await self.render(async_views.BookListAsyncView, self.request(self.visitor))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse('login')))
+        response = await self.render(async_views.BorrowingHistoryAsyncView, self.request(AnonymousUser()))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_async_history_reads_archive(self):
+        """
+        Test that the async history lists archived borrowings like the sync view.
+        """
+        moved = await sync_to_async(archive.archive_borrowings)(datetime.date(2024, 1, 1))
+        self.assertGreater(moved, 0)
+        params = {'order_by': 'borrow_date'}
+        sync_response = await self.render(BorrowingHistoryView, self.request(self.librarian, params))
+        async_response = await self.render(async_views.BorrowingHistoryAsyncView, self.request(self.librarian, params))
+        self.assertEqual(
+            [obj.pk for obj in async_response.context_data['object_list']],
+            [obj.pk for obj in sync_response.context_data['object_list']],
+        )
+        self.assertTrue(any(isinstance(obj, ArchivedBorrowing) for obj in async_response.context_data['object_list']))
+
+
+class OverdueReportTests(TestCase):
+    def setUp(self):
+        """
+        Set up a librarian, a borrower and three books.
+        """
+        self.librarian = User.objects.create_user(username='librarian', password='librarianpass', is_staff=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.borrower = Borrower.objects.create(name='Test Borrower', user=self.user, phone_number='1234567890')
+        self.books = [
+            Book.objects.create(title=f'Book {i}', author='Test Author', ISBN=f'123456789{i}', publication_date='2022-01-01')
+            for i in range(3)
+        ]
+        cache.delete(overdue.REFRESH_LOCK_KEY)
+
+    def lend(self, book, borrow_date, return_date=None):
+        """
+        Create a borrowing of book, with the default loan period.
+        """
+        return Borrowing.objects.create(book=book, borrower=self.borrower, borrow_date=borrow_date, return_date=return_date)
+
+    def listed(self):
+        """
+        Return the ids of the borrowings in the overdue summary.
+        """
+        return set(OverdueLoan.objects.values_list('borrowing_id', flat=True))
+
+    @override_settings(LOAN_PERIOD_DAYS=7)
+    def test_due_date_follows_loan_period(self):
+        """
+        Test that borrowing sets the due date from LOAN_PERIOD_DAYS, and that save() fills it in.
+        """
+        borrowing = circulation.borrow(self.books[0].pk, self.borrower)
+        self.assertEqual(borrowing.due_date, borrowing.borrow_date + datetime.timedelta(days=7))
+        self.assertEqual(self.lend(self.books[1], '2024-01-01').due_date, datetime.date(2024, 1, 8))
+
+    @override_settings(LOAN_PERIOD_DAYS=14)
+    def test_refresh_follows_changed_loans(self):
+        """
+        Test that a refresh adds the loans that fell due, were backdated or were given an
+        earlier due date since the last one, and drops those returned or given a later due date.
+        """
+        first = self.lend(self.books[0], datetime.date(2024, 1, 1))
+        second = self.lend(self.books[1], datetime.date(2024, 1, 10))
+        result = overdue.refresh_overdue_report(today=datetime.date(2024, 1, 20))
+        self.assertEqual(result['added'], 1)
+        self.assertEqual(self.listed(), {first.pk})
+
+        # A loan backdated to before the last refresh is picked up by the next one.
+        backdated = self.lend(self.books[2], datetime.date(2023, 12, 1))
+        Borrowing.objects.filter(pk=first.pk).update(return_date=datetime.date(2024, 1, 21))
+        result = overdue.refresh_overdue_report(today=datetime.date(2024, 1, 30))
+        self.assertEqual((result['added'], result['removed']), (2, 1))
+        self.assertEqual(self.listed(), {second.pk, backdated.pk})
+
+        Borrowing.objects.filter(pk=second.pk).update(due_date=datetime.date(2024, 2, 28))
+        result = overdue.refresh_overdue_report(today=datetime.date(2024, 1, 31))
+        self.assertEqual((result['added'], result['removed']), (0, 1))
+        self.assertEqual(self.listed(), {backdated.pk})
+
+        # A due date moved to before the last refresh lists the loan again.
+        Borrowing.objects.filter(pk=second.pk).update(due_date=datetime.date(2024, 1, 15))
+        result = overdue.refresh_overdue_report(today=datetime.date(2024, 1, 31))
+        self.assertEqual((result['added'], result['removed']), (1, 0))
+        self.assertEqual(self.listed(), {second.pk, backdated.pk})
+
+        overdue.refresh_overdue_report(today=datetime.date(2024, 1, 31), full=True)
+        self.assertEqual(self.listed(), {second.pk, backdated.pk})
+
+    def test_report_view(self):
+        """
+        Test that the report is for librarians and refreshes a summary left from an earlier day.
+        """
+        borrowing = self.lend(self.books[0], datetime.date(2024, 1, 1))
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('overdue_report'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.login(username='librarian', password='librarianpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('overdue_report'))
+        self.assertNotContains(response, 'Book 0')
+        response = self.client.get(reverse('overdue_report'))
+        self.assertContains(response, 'Book 0')
+        self.assertEqual(response.context['report'].as_of, timezone.localdate())
+
+        # Returned loans disappear before the next refresh drops them.
+        circulation.return_(borrowing.pk)
+        response = self.client.get(reverse('overdue_report'))
+        self.assertNotContains(response, 'Book 0')
+
+    def test_stale_report_queues_one_refresh(self):
+        """
+        Test that repeated reads of a stale report queue a single refresh until the lock expires.
+        """
+        self.client.login(username='librarian', password='librarianpass')
+        with mock.patch.object(tasks, 'delay_on_commit') as delay_on_commit:
+            for _ in range(3):
+                self.client.get(reverse('overdue_report'))
+            self.assertEqual(delay_on_commit.call_count, 1)
+
+            cache.delete(overdue.REFRESH_LOCK_KEY)
+            self.client.get(reverse('overdue_report'))
+            self.assertEqual(delay_on_commit.call_count, 2)
+
+    def test_overdue_report_command(self):
+        """
+        Test that the command refreshes the summary and lists the overdue loans.
+        """
+        self.lend(self.books[0], datetime.date(2024, 1, 1))
+        stdout = StringIO()
+        call_command('overdue_report', stdout=stdout)
+        self.assertIn('Added 1 and removed 0 overdue loans', stdout.getvalue())
+        self.assertIn('Book 0  (Test Borrower)', stdout.getvalue())
+
+
+class ConnectionStatsTests(TestCase):
+    def setUp(self):
+        """
+        Set up a separate SQLite connection that records statistics. The database is a file,
+        since SQLite never closes an in-memory one.
+        """
+        connection_stats.reset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper_class = type('DatabaseWrapper', (ConnectionStatsMixin, sqlite_base.DatabaseWrapper), {})
+        self.db = wrapper_class({
+            **connection.settings_dict,
+            'NAME': os.path.join(directory.name, 'stats.sqlite3'),
+            'CONN_HEALTH_CHECKS': True,
+        }, alias='stats')
+        self.addCleanup(self.db.close)
+
+    def counters(self):
+        """
+        Return the statistics of the test connection.
+        """
+        return connection_stats.snapshot()['stats']
+
+    def test_connection_life_cycle(self):
+        """
+        Test that opening, using, releasing and closing a connection are counted.
+        """
+        self.db.cursor().execute('SELECT 1')
+        self.db.cursor().execute('SELECT 1')
+        counters = self.counters()
+        self.assertEqual((counters['open'], counters['opened'], counters['in_use'], counters['acquired']), (1, 1, 1, 1))
+        self.assertGreater(counters['wait_seconds_max'], 0)
+
+        self.db.release()
+        self.assertEqual((self.counters()['in_use'], self.counters()['idle']), (0, 1))
+        self.db.cursor().execute('SELECT 1')
+        self.assertEqual((self.counters()['in_use'], self.counters()['acquired']), (1, 2))
+
+        self.db.close()
+        counters = self.counters()
+        self.assertEqual((counters['open'], counters['closed'], counters['in_use']), (0, 1, 0))
+
+    def test_failed_health_check_reconnects(self):
+        """
+        Test that a connection failing its health check is closed, counted and replaced.
+        """
+        self.db.cursor().execute('SELECT 1')
+        self.db.release()
+        self.db.health_check_done = False
+        with mock.patch.object(self.db, 'is_usable', return_value=False):
+            self.db.cursor().execute('SELECT 1')
+        counters = self.counters()
+        self.assertEqual(counters['health_check_failures'], 1)
+        self.assertEqual((counters['opened'], counters['closed'], counters['open'], counters['in_use']), (2, 1, 1, 1))
+
+    def test_stats_endpoint_is_for_librarians(self):
+        """
+        Test that the statistics endpoint reports the connection settings to librarians only.
+        """
+        User.objects.create_user(username='librarian', password='librarianpass', is_staff=True)
+        User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.client.get(reverse('api_database_stats')).status_code, 403)
+        self.client.login(username='librarian', password='librarianpass')
+        response = self.client.get(reverse('api_database_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('conn_max_age', response.json()['databases']['default'])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        """
+        Set up a librarian, a borrower-less user and an empty metrics directory.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(METRICS_DIR=directory.name, METRICS_TOKEN='scrape-token')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+        metrics.registry.reset()
+        self.librarian = User.objects.create_user(username='librarian', password='librarianpass', is_staff=True)
+        User.objects.create_user(username='testuser', password='testpass')
+
+    def test_requests_are_recorded_per_view_and_status(self):
+        """
+        Test that latency, query count and SQL time are recorded under the URL name and status.
+        """
+        self.client.login(username='librarian', password='librarianpass')
+        self.client.get(reverse('book_list'))
+        self.client.get('/no-such-page/')
+        totals = metrics.registry.collect()
+        series = totals[('book_list', '200')]
+        self.assertEqual(series['count'], 1)
+        # At least the user is read; the session comes from the cache.
+        self.assertGreaterEqual(series['queries'], 1)
+        self.assertGreater(series['sql_seconds'], 0)
+        self.assertEqual(series['buckets'][-1], 1)
+        self.assertEqual((totals[('unresolved', '404')]['count'], totals[('unresolved', '404')]['queries']), (1, 0))
+
+    def test_processes_are_added_up(self):
+        """
+        Test that the endpoint adds up the files written by other processes.
+        """
+        other = metrics.empty_series()
+        other.update(count=2, seconds=0.5, queries=6, sql_seconds=0.1)
+        other['buckets'] = [0, 0, 0, 0, 0, 2, 2, 2, 2, 2, 2]
+        # Written by a process that is still running: the test runner's parent.
+        with open(os.path.join(self.directory, f'{os.getppid()}-1.json'), 'w') as metrics_file:
+            json.dump([['book_list', '200', other]], metrics_file)
+        self.client.login(username='librarian', password='librarianpass')
+        self.client.get(reverse('book_list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('library_http_request_duration_seconds_count{view="book_list",status="200"} 3', body)
+        self.assertIn('library_http_request_duration_seconds_bucket{view="book_list",status="200",le="+Inf"} 3', body)
+        self.assertIn('# TYPE library_db_queries_total counter', body)
+
+    def test_files_of_stopped_processes_are_deleted(self):
+        """
+        Test that collecting deletes, and leaves out, the files of processes no longer running.
+        """
+        stopped = metrics.empty_series()
+        stopped.update(count=2)
+        path = os.path.join(self.directory, '99999-1.json')
+        with open(path, 'w') as metrics_file:
+            json.dump([['book_list', '200', stopped]], metrics_file)
+        with mock.patch.object(metrics, 'is_running', return_value=False):
+            totals = metrics.registry.collect()
+        self.assertNotIn(('book_list', '200'), totals)
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_flush_does_not_fail_the_request(self):
+        """
+        Test that a request whose metrics cannot be written still succeeds, and that
+        concurrent flushes each write through a temporary file of their own.
+        """
+        blocked = os.path.join(self.directory, 'not-a-directory')
+        open(blocked, 'w').close()
+        self.client.login(username='librarian', password='librarianpass')
+        with override_settings(METRICS_DIR=blocked, METRICS_FLUSH_INTERVAL=0), self.assertLogs('book_management.metrics', 'ERROR'):
+            self.assertEqual(self.client.get(reverse('book_list')).status_code, 200)
+
+        threads = [threading.Thread(target=metrics.registry.flush) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(['not-a-directory', metrics.registry.filename]))
+
+    def test_endpoint_is_for_staff_or_token(self):
+        """
+        Test that only staff users and requests with the metrics token can read the metrics.
+        """
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        """
+        Set up a librarian, a non-staff user and an empty profiling directory.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILING_DIR=directory.name, PROFILING_INTERVAL=0.001)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+        User.objects.create_user(username='librarian', password='librarianpass', is_staff=True)
+        User.objects.create_user(username='testuser', password='testpass')
+
+    def test_staff_request_is_profiled_on_demand(self):
+        """
+        Test that a librarian's flagged request writes a pstats or collapsed-stacks profile.
+        """
+        self.client.login(username='librarian', password='librarianpass')
+        response = self.client.get(reverse('book_list'), {'_profile': 'pstats'})
+        name = response['X-Profile-Name']
+        self.assertRegex(name, r'-book_list-\w+\.prof$')
+        self.assertGreater(pstats.Stats(os.path.join(self.directory, name)).total_calls, 0)
+
+        response = self.client.get(reverse('book_list'), HTTP_X_PROFILE='collapsed')
+        self.assertTrue(response['X-Profile-Name'].endswith('.txt'))
+        self.assertNotIn('X-Profile-Name', self.client.get(reverse('book_list')))
+
+    def test_flag_is_ignored_for_other_users(self):
+        """
+        Test that requests from users who are not staff are never profiled.
+        """
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('available_books_anonymous'), {'_profile': 'pstats'})
+        self.assertNotIn('X-Profile-Name', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_sampler_writes_collapsed_stacks(self):
+        """
+        Test that the sampler records the profiled thread's stack, root frame first.
+        """
+        def busy_wait():
+            deadline = time.monotonic() + 0.05
+            while time.monotonic() < deadline:
+                pass
+
+        sampler = profiling.StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        busy_wait()
+        sampler.stop()
+        path = os.path.join(self.directory, 'sample.txt')
+        sampler.write(path)
+        with open(path) as profile_file:
+            stack, count = profile_file.readline().rsplit(' ', 1)
+        self.assertIn('busy_wait (', stack.split(';')[-1])
+        self.assertGreater(int(count), 0)
+
+    def test_profiles_are_listed_and_downloaded_by_librarians(self):
+        """
+        Test that librarians can list and download profiles, and that other names are refused.
+        """
+        with open(os.path.join(self.directory, 'sample.txt'), 'w') as profile_file:
+            profile_file.write('main (manage.py:1) 1\n')
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.client.get(reverse('profile_list')).status_code, 302)
+
+        self.client.login(username='librarian', password='librarianpass')
+        self.assertContains(self.client.get(reverse('profile_list')), 'sample.txt')
+        response = self.client.get(reverse('profile_download', args=['sample.txt']))
+        self.assertEqual(b''.join(response.streaming_content), b'main (manage.py:1) 1\n')
+        self.assertEqual(self.client.get(reverse('profile_download', args=['settings.py'])).status_code, 404)
@@ -3,14 +3,33 @@ URLs for library_management application.
 """
 from django.urls import path
 from django.views.generic.base import RedirectView
+from django.conf import settings
+from .metrics import MetricsView
+from .profiling import ProfileDownloadView, ProfileListView
+from .api import (
+    BookListApiView, BookDetailApiView, BorrowerListApiView, BorrowerDetailApiView,
+    BorrowingListApiView, BorrowingDetailApiView, BorrowBatchApiView, ReturnBatchApiView, DatabaseStatsApiView,
+)
 from .views import (
     CustomLoginView, CustomSignupView, CustomLogoutView, 
     BorrowerListView, BorrowerCreateView, BorrowerUpdateView, BorrowerDeleteView, BorrowerDetailView,
     BookListView, BookCreateView, BookUpdateView, BookDeleteView, BookDetailView, AvailableBooks,
     BorrowBookView, ReturnBookView, PendingBorrowing, BorrowingDetailsView, BorrowerPendingBrrowingListView,
-    BorrowingHistoryView, BorrowerBorrowingHistoryView, AvailableBooksAnoymous,
+    BorrowingHistoryView, BorrowerBorrowingHistoryView, AvailableBooksAnoymous, BorrowingHistoryExportView,
+    OverdueReportView,
 )
 
+# ASGI deployments can serve the busiest lists, and the login, with their native async versions.
+if getattr(settings, 'ASYNC_LIST_VIEWS', False):
+    from .async_views import (
+        AvailableBooksAsync as AvailableBooks,
+        AvailableBooksAnoymousAsync as AvailableBooksAnoymous,
+        BookListAsyncView as BookListView,
+        BorrowingHistoryAsyncView as BorrowingHistoryView,
+    )
+if getattr(settings, 'ASYNC_LOGIN_VIEW', False):
+    from .async_views import CustomLoginAsyncView as CustomLoginView
+
 urlpatterns = [
     path('', RedirectView.as_view(url='login/', permanent=True),name='home'),
     path('login/', CustomLoginView.as_view(), name='login'),
@@ -31,8 +50,22 @@ urlpatterns = [
     path('borrow/', BorrowBookView.as_view(), name='borrow_book'),
     path('return/', ReturnBookView.as_view(), name='return_book'),
     path('pending/', PendingBorrowing.as_view(), name='pending_borrowing'),
+    path('overdue/', OverdueReportView.as_view(), name='overdue_report'),
     path('borrowing/<int:pk>/', BorrowingDetailsView.as_view(), name='borrowing_detail'),
     path('borrower/pending/', BorrowerPendingBrrowingListView.as_view(), name='borrower_pending_borrowing'),
     path('history/', BorrowingHistoryView.as_view(), name='borrowing_history'),
+    path('history/export/', BorrowingHistoryExportView.as_view(), name='borrowing_history_export'),
     path('borrower/history/', BorrowerBorrowingHistoryView.as_view(), name='borrower_borrowing_history'),
+    path('api/books/', BookListApiView.as_view(), name='api_book_list'),
+    path('api/books/<int:pk>/', BookDetailApiView.as_view(), name='api_book_detail'),
+    path('api/borrowers/', BorrowerListApiView.as_view(), name='api_borrower_list'),
+    path('api/borrowers/<int:pk>/', BorrowerDetailApiView.as_view(), name='api_borrower_detail'),
+    path('api/borrowings/', BorrowingListApiView.as_view(), name='api_borrowing_list'),
+    path('api/borrowings/<int:pk>/', BorrowingDetailApiView.as_view(), name='api_borrowing_detail'),
+    path('api/borrow/', BorrowBatchApiView.as_view(), name='api_borrow'),
+    path('api/return/', ReturnBatchApiView.as_view(), name='api_return'),
+    path('api/database/', DatabaseStatsApiView.as_view(), name='api_database_stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('profiles/', ProfileListView.as_view(), name='profile_list'),
+    path('profiles/<str:name>/', ProfileDownloadView.as_view(), name='profile_download'),
 ]
@@ -36,3 +36,32 @@ class CustomPasswordValidator:
             "Your password must contain at least one digit. <br>"
             "Your password must contain at least one uppercase letter."
         ).format(self.min_length)
+
+
+def normalize_isbn(value):
+    """
+    Normalise an ISBN by removing separators and upper-casing the ISBN-10 check digit,
+    then validate its length and check digit.
+
+    Args:
+        value: The raw ISBN, e.g. '0-306-40615-2' or '978 0 306 40615 7'.
+
+    Returns:
+        str: The 10 or 13 character ISBN.
+
+    Raises:
+        ValidationError: If the value is not a valid ISBN-10 or ISBN-13.
+    """
+    isbn = re.sub(r'[\s-]', '', str(value or '')).upper()
+
+    if re.fullmatch(r'\d{9}[\dX]', isbn):
+        digits = [10 if c == 'X' else int(c) for c in isbn]
+        valid = sum((10 - i) * d for i, d in enumerate(digits)) % 11 == 0
+    elif re.fullmatch(r'\d{13}', isbn):
+        valid = sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(isbn)) % 10 == 0
+    else:
+        raise ValidationError(_("'%(value)s' is not a 10 or 13 digit ISBN."), code='invalid_isbn', params={'value': value})
+
+    if not valid:
+        raise ValidationError(_("'%(value)s' has an invalid ISBN check digit."), code='invalid_isbn_checksum', params={'value': value})
+    return isbn
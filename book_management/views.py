@@ -1,22 +1,34 @@
 """
 Views for library_management application.
 """
+import tempfile
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib.auth.decorators import user_passes_test
 from django.db.models.query import QuerySet
 from django.core.exceptions import ValidationError
 from django.shortcuts import redirect, render
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.db.models import Q, Count
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, CreateView, UpdateView, FormView, DeleteView, View, DetailView
-from datetime import datetime
-from .models import Book, Borrower, Borrowing
+from . import circulation, tasks
+from .archive import fetch_keyed_rows, get_archive_horizon, needs_archive, union_keys
+from .models import ArchivedBorrowing, Book, Borrower, Borrowing, OverdueLoan
+from .overdue import claim_refresh, get_overdue_report
+from .exports import (
+    DEFAULT_CHUNK_SIZE, filter_borrow_dates, filter_history, history_rows, parse_history_range, stream_csv, write_xlsx,
+)
 from .forms import BookForm, BorrowerForm, CustomSignupForm, CustomLoginForm
+from .identity import get_identity
+from .page_cache import CachedPageMixin
+from .pagination import CachedCountMixin, KeysetPaginationMixin
+from .search import search_books
 
 def is_library_staff(user):
     """
@@ -43,11 +55,79 @@ class LibrarianRequiredMixin(LoginRequiredMixin):
         """
         return super().dispatch(request, *args, **kwargs)
 
-class BookListView(LibrarianRequiredMixin, ListView):
+class ArchivedHistoryMixin:
+    """
+    Mixin for the borrowing history lists, ahead of KeysetPaginationMixin. Adds the
+    'since' and 'until' borrow date parameters and, when the range starts before the
+    archive horizon, pages through the live and archived borrowings together.
+
+    Views implement filter_history_queryset(queryset), which is applied to both tables.
+    """
+    def get_history_range(self):
+        """
+        Return the requested (since, until) borrow dates, either of which may be None.
+        """
+        return parse_history_range(self.request.GET.get('since'), self.request.GET.get('until'))
+
+    def needs_archive(self):
+        """
+        Return whether the requested range reaches back into the archive, looking the
+        horizon up once per request.
+        """
+        if not hasattr(self, '_needs_archive'):
+            self._needs_archive = needs_archive(self.get_history_range()[0])
+        return self._needs_archive
+
+    def get_queryset(self):
+        """
+        Return the borrowings matching the request.
+        """
+        return self.filter_history_queryset(super().get_queryset())
+
+    def get_archive_queryset(self):
+        """
+        Return the archived borrowings matching the request.
+        """
+        return self.filter_history_queryset(ArchivedBorrowing.objects.for_listing())
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Paginate the borrowings, together with the archived ones when the range needs them.
+        The two tables are merged and ordered by the database, then the page's rows are
+        read from each.
+        """
+        if not self.needs_archive():
+            return super().paginate_queryset(queryset, page_size)
+        archive = self.get_archive_queryset()
+        if self.is_cursor_mode():
+            queryset, ascending, forward, pk = self.filter_keyset(queryset)
+            archive = self.filter_keyset(archive)[0]
+            keys = list(union_keys(queryset, archive, ascending)[:page_size + 1])
+            return self.build_keyset_page(fetch_keyed_rows(keys, queryset, archive), page_size, forward, pk)
+
+        field, descending = self.get_keyset_ordering()
+        queryset, archive = self.annotate_keyset(queryset), self.annotate_keyset(archive)
+        keys = union_keys(queryset, archive, not descending)
+        paginator, page, object_list, is_paginated = super().paginate_queryset(keys, page_size)
+        page.object_list = fetch_keyed_rows(list(page.object_list), queryset, archive)
+        return paginator, page, page.object_list, is_paginated
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the requested borrow date range, as YYYY-MM-DD strings.
+        """
+        context = super().get_context_data(**kwargs)
+        since, until = self.get_history_range()
+        context['since'] = since.isoformat() if since else ''
+        context['until'] = until.isoformat() if until else ''
+        return context
+
+class BookListView(LibrarianRequiredMixin, CachedCountMixin, ListView):
     """
     View for displaying a list of books. It checks if the user has permission to access the page.
     """
     model = Book
+    queryset = Book.objects.for_listing()
     template_name = 'book_list.html'
     paginate_by = 8
     ordering = ['title']
@@ -57,23 +137,16 @@ class BookListView(LibrarianRequiredMixin, ListView):
         Return the queryset after filtering based on the request parameters 'q', 'order_by', and 'dir'.
         """
         query = self.request.GET.get('q')
-        order_by = self.request.GET.get('order_by', 'title')
+        order_by = self.request.GET.get('order_by', '' if query else 'title')
         dir = self.request.GET.get('dir', 'asc')
 
-        queryset = super().get_queryset()
-
-        if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query) |
-                Q(availability_status__icontains=query)
-            )
+        queryset = search_books(super().get_queryset(), query, match_status=True)
 
         if order_by:
             if dir == 'asc':
-                queryset = queryset.order_by(order_by)
+                queryset = queryset.order_by(order_by, 'id')
             elif dir == 'desc':
-                queryset = queryset.order_by(f'-{order_by}')
+                queryset = queryset.order_by(f'-{order_by}', '-id')
 
         return queryset
 
@@ -92,6 +165,7 @@ class BookDetailView(LoginRequiredMixin, DetailView):
     View for displaying details of a single book.
     """
     model = Book
+    queryset = Book.objects.for_detail()
     template_name = 'book_detail.html'
     context_object_name = 'book'
 
@@ -166,7 +240,7 @@ class BookDeleteView(LibrarianRequiredMixin, DeleteView):
                 messages.error(self.request, str(i), extra_tags='bg-danger')
             return redirect('book_list')
 
-class BorrowerListView(LibrarianRequiredMixin, ListView):
+class BorrowerListView(LibrarianRequiredMixin, CachedCountMixin, ListView):
     """
     View for displaying a list of borrowers. It checks if the user has permission to access the page.
     """
@@ -186,7 +260,7 @@ class BorrowerListView(LibrarianRequiredMixin, ListView):
         order_by = self.request.GET.get('order_by', 'name')
         dir = self.request.GET.get('dir', 'asc')
 
-        queryset = super().get_queryset().select_related('user')
+        queryset = super().get_queryset().select_related('user').with_open_loans()
 
         if query:
             queryset = queryset.filter(
@@ -195,9 +269,9 @@ class BorrowerListView(LibrarianRequiredMixin, ListView):
 
         if order_by:
             if dir == 'asc':
-                queryset = queryset.order_by(order_by)
+                queryset = queryset.order_by(order_by, 'id')
             elif dir == 'desc':
-                queryset = queryset.order_by(f'-{order_by}')
+                queryset = queryset.order_by(f'-{order_by}', '-id')
 
         return queryset
 
@@ -216,6 +290,7 @@ class BorrowerDetailView(LibrarianRequiredMixin, DetailView):
     View for displaying details of a single borrower. It checks if the user has permission to access the page.
     """
     model = Borrower
+    queryset = Borrower.objects.select_related('user')
     template_name = 'borrower_detail.html'
     context_object_name = 'borrower'
 
@@ -296,11 +371,12 @@ class BorrowerDeleteView(LibrarianRequiredMixin, DeleteView):
                 messages.error(self.request, str(i), extra_tags='bg-danger')
             return redirect('borrower_list')
 
-class AvailableBooks(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class AvailableBooks(LoginRequiredMixin, PermissionRequiredMixin, CachedPageMixin, CachedCountMixin, ListView):
     """
     View for displaying a list of available books. It checks if the user has permission to access the page.
     """
     model = Book
+    queryset = Book.objects.for_listing()
     template_name = 'available_books.html'
     paginate_by = 5
     ordering = ['title']
@@ -336,16 +412,10 @@ class AvailableBooks(LoginRequiredMixin, PermissionRequiredMixin, ListView):
             queryset: The filtered queryset based on the request parameters.
         """
         query = self.request.GET.get('q')
-        order_by = self.request.GET.get('order_by', 'title')
+        order_by = self.request.GET.get('order_by', '' if query else 'title')
         dir = self.request.GET.get('dir', 'asc')
 
-        queryset = super().get_queryset().filter(availability_status=True)
-
-        if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query)
-            )
+        queryset = search_books(super().get_queryset().filter(availability_status=True), query)
 
         if order_by:
             if dir == 'asc':
@@ -355,11 +425,12 @@ class AvailableBooks(LoginRequiredMixin, PermissionRequiredMixin, ListView):
 
         return queryset
     
-class AvailableBooksAnoymous(LoginRequiredMixin, ListView):
+class AvailableBooksAnoymous(LoginRequiredMixin, CachedPageMixin, CachedCountMixin, ListView):
     """
     View for displaying a list of available books for Users that are not borrower or staff.
     """
     model = Book
+    queryset = Book.objects.for_listing()
     template_name = 'available_books_anonymous.html'
     paginate_by = 5
     ordering = ['title']
@@ -375,16 +446,10 @@ class AvailableBooksAnoymous(LoginRequiredMixin, ListView):
             queryset: A filtered queryset based on the request parameters.
         """
         query = self.request.GET.get('q')
-        order_by = self.request.GET.get('order_by', 'title')
+        order_by = self.request.GET.get('order_by', '' if query else 'title')
         dir = self.request.GET.get('dir', 'asc')
 
-        queryset = super().get_queryset().filter(availability_status=True)
-
-        if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query)
-            )
+        queryset = search_books(super().get_queryset().filter(availability_status=True), query)
 
         if order_by:
             if dir == 'asc':
@@ -447,19 +512,17 @@ class BorrowBookView(LoginRequiredMixin, PermissionRequiredMixin, View):
         :return: Redirect to the 'available_books' URL
         """
         book_id = request.POST.get('book_id')
-        username = request.POST.get('username')
-        book = Book.objects.get(pk=book_id)
-        user = User.objects.get(username=username)
-        borrower = Borrower.objects.get(user=user)
-        if book and user:
-            book = Book.objects.get(pk=book_id)
-            if book.availability_status:
-                borrowing = Borrowing.objects.create(borrower=borrower, book=book, borrow_date=datetime.now())
-                book.availability_status = False
-                book.save()
-                messages.success(request, f'Book borrowed successfully. borrowing_id: {str(borrowing.id)}',extra_tags='bg-success')
-            else:
-                messages.error(request, 'Book is not available.', extra_tags='bg-danger')
+        borrower_id = request.borrower.borrower_id
+        if borrower_id is None:
+            messages.error(request, 'You are not registered as a borrower.', extra_tags='bg-danger')
+            return redirect('available_books')
+        try:
+            borrowing = circulation.borrow(book_id, borrower_id)
+        except ValidationError as e:
+            for i in e:
+                messages.error(request, str(i), extra_tags='bg-danger')
+        else:
+            messages.success(request, f'Book borrowed successfully. borrowing_id: {str(borrowing.id)}',extra_tags='bg-success')
         return redirect('available_books')
 
 class ReturnBookView(LoginRequiredMixin, PermissionRequiredMixin,View):
@@ -495,27 +558,25 @@ class ReturnBookView(LoginRequiredMixin, PermissionRequiredMixin,View):
         :return: A redirect to the 'borrower_pending_borrowing' URL
         """
         borrowing_id = request.POST.get('borrowing_id')
-        borrowing = Borrowing.objects.filter(pk=borrowing_id).exists()
-        if borrowing:
-            borrowing = Borrowing.objects.get(pk=borrowing_id)
-            book = borrowing.book
-            book.availability_status = True
-            book.save()
-            borrowing.return_date = datetime.now()
-            borrowing.save()
-            messages.success(request, 'Book returned successfully.', extra_tags='bg-success')
+        try:
+            circulation.return_(borrowing_id)
+        except ValidationError as e:
+            for i in e:
+                messages.error(request, str(i), extra_tags='bg-danger')
         else:
-            messages.error(request, 'Book is not borrowed.', extra_tags='bg-danger')
+            messages.success(request, 'Book returned successfully.', extra_tags='bg-success')
         return redirect('borrower_pending_borrowing')
 
-class PendingBorrowing(LibrarianRequiredMixin, ListView):
+class PendingBorrowing(LibrarianRequiredMixin, KeysetPaginationMixin, CachedCountMixin, ListView):
     """
     View for displaying pending borrowing records. It checks if user have permission to view pending borrowing records.
     """
     model = Borrowing
+    queryset = Borrowing.objects.for_listing()
     template_name = 'pending_borrowings.html'
     paginate_by = 5
     ordering = ['borrow_date']
+    keyset_fields = ('borrow_date', 'book__title', 'borrower__name')
 
     def get_queryset(self):
         """
@@ -553,16 +614,61 @@ class PendingBorrowing(LibrarianRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['order_by'] = self.request.GET.get('order_by', 'borrow_date')
         context['dir'] = self.request.GET.get('dir', 'asc')
+        context['search_query'] = self.request.GET.get('q')
+        context['today'] = timezone.localdate()
+        return context
+
+class OverdueReportView(LibrarianRequiredMixin, ListView):
+    """
+    View for the overdue-loans report. It lists the open loans past their due date, longest
+    overdue first, from the OverdueLoan summary table, and queues a refresh of the summary
+    when it was last refreshed on an earlier day, at most once per REFRESH_LOCK_TIMEOUT.
+    """
+    model = OverdueLoan
+    queryset = OverdueLoan.objects.select_related('borrowing__book', 'borrowing__borrower').only(
+        'due_date', 'borrowing__borrow_date', 'borrowing__book__title', 'borrowing__borrower__name',
+    )
+    template_name = 'overdue_report.html'
+    paginate_by = 10
+
+    def get(self, request, *args, **kwargs):
+        self.report = get_overdue_report()
+        # Only the first reader of a stale report queues the refresh.
+        if self.report.as_of != timezone.localdate() and claim_refresh():
+            tasks.delay_on_commit(tasks.refresh_overdue_report)
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """
+        Return the listed loans that are still open, longest overdue first.
+
+        :return: QuerySet: The overdue loans, with their borrowing, book and borrower.
+        """
+        # Loans returned since the last refresh are hidden until it drops them.
+        return super().get_queryset().filter(borrowing__return_date__isnull=True).order_by('due_date', 'borrowing_id')
+
+    def get_context_data(self, **kwargs):
+        """
+        Get the context data for the report.
+
+        :param kwargs: additional keyword arguments
+        :return: the context data including 'report' and 'today'
+        """
+        context = super().get_context_data(**kwargs)
+        context['report'] = self.report
+        context['today'] = timezone.localdate()
         return context
 
-class BorrowerPendingBrrowingListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class BorrowerPendingBrrowingListView(LoginRequiredMixin, PermissionRequiredMixin, KeysetPaginationMixin, CachedCountMixin, ListView):
     """
     View for displaying the pending borrowings of a borrower. It checks if the user has permission to access the page.
     """
     model = Borrowing
+    queryset = Borrowing.objects.for_listing()
     template_name = 'borrower_pending_borrowings.html'
     paginate_by = 5
     ordering = ['borrow_date']
+    keyset_fields = ('borrow_date', 'book__title', 'book__author')
     permission_required = ('book_management.can_borrow', 'book_management.can_return')
     raise_exception = False
 
@@ -611,8 +717,10 @@ class BorrowerPendingBrrowingListView(LoginRequiredMixin, PermissionRequiredMixi
         query = self.request.GET.get('q')
         order_by = self.request.GET.get('order_by', 'borrow_date')
         dir = self.request.GET.get('dir', 'asc')
-        borrower = Borrower.objects.get(user=self.request.user)
-        queryset = super().get_queryset().filter(return_date__isnull=True, borrower=borrower)
+        borrower_id = self.request.borrower.borrower_id
+        if borrower_id is None:
+            return super().get_queryset().none()
+        queryset = super().get_queryset().filter(return_date__isnull=True, borrower_id=borrower_id)
 
         if query:
             queryset = queryset.filter(
@@ -641,23 +749,27 @@ class BorrowerPendingBrrowingListView(LoginRequiredMixin, PermissionRequiredMixi
         context = super().get_context_data(**kwargs)
         context['order_by'] = self.request.GET.get('order_by', 'borrow_date')
         context['dir'] = self.request.GET.get('dir', 'asc')
+        context['search_query'] = self.request.GET.get('q')
+        context['today'] = timezone.localdate()
         return context
     
-class BorrowingHistoryView(LibrarianRequiredMixin, ListView):
+class BorrowingHistoryView(LibrarianRequiredMixin, ArchivedHistoryMixin, KeysetPaginationMixin, CachedCountMixin, ListView):
     """
     View for displaying the history of borrowed books. It checks if the user has permission to access the page.
     """
     model = Borrowing
+    queryset = Borrowing.objects.for_listing()
     template_name = 'borrowing_history.html'
     paginate_by = 5
     ordering = ['borrow_date']
+    keyset_fields = ('borrow_date', 'return_date', 'book__title', 'borrower__name')
 
-    def get_queryset(self):
+    def filter_history_queryset(self, queryset):
         """
-        Returns the filtered queryset based on the request parameters.
+        Returns the queryset filtered based on the request parameters.
 
         Parameters:
-            self: The instance of the class.
+            queryset: The borrowings, or the archived borrowings, to filter.
         
         Returns:
             QuerySet: The filtered queryset based on the request parameters.
@@ -666,21 +778,7 @@ class BorrowingHistoryView(LibrarianRequiredMixin, ListView):
         order_by = self.request.GET.get('order_by', 'borrow_date')
         dir = self.request.GET.get('dir', 'asc')
 
-        queryset = super().get_queryset().filter(return_date__isnull=False)
-
-        if query:
-            queryset = queryset.filter(
-                Q(borrower__name__icontains=query) |
-                Q(book__title__icontains=query)
-            )
-
-        if order_by:
-            if dir == 'asc':
-                queryset = queryset.order_by(order_by)
-            elif dir == 'desc':
-                queryset = queryset.order_by(f'-{order_by}')
-
-        return queryset
+        return filter_history(queryset, query, order_by, dir, *self.get_history_range())
 
     def get_context_data(self, **kwargs):
         """
@@ -692,16 +790,56 @@ class BorrowingHistoryView(LibrarianRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['order_by'] = self.request.GET.get('order_by', 'borrow_date')
         context['dir'] = self.request.GET.get('dir', 'asc')
+        context['search_query'] = self.request.GET.get('q')
         return context
 
-class BorrowerBorrowingHistoryView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class BorrowingHistoryExportView(LibrarianRequiredMixin, View):
+    """
+    View for exporting the borrowing history as CSV or XLSX. It accepts the same 'q', 'order_by',
+    'dir', 'since' and 'until' parameters as BorrowingHistoryView and streams the rows instead
+    of paginating them.
+    """
+    chunk_size = DEFAULT_CHUNK_SIZE
+
+    def get(self, request, *args, **kwargs):
+        """
+        Stream the filtered borrowing history in the requested format ('csv' by default, or 'xlsx').
+        """
+        since, until = parse_history_range(request.GET.get('since'), request.GET.get('until'))
+        rows = history_rows(
+            request.GET.get('q'),
+            request.GET.get('order_by', 'borrow_date'),
+            request.GET.get('dir', 'asc'),
+            chunk_size=self.chunk_size,
+            since=since,
+            until=until,
+        )
+        if request.GET.get('format') == 'xlsx':
+            # XLSX is a zip archive, so it is spooled to a temporary file and streamed from there.
+            file = tempfile.TemporaryFile()
+            write_xlsx(rows, file)
+            file.seek(0)
+            return FileResponse(
+                file,
+                as_attachment=True,
+                filename='borrowing_history.xlsx',
+                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            )
+
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="borrowing_history.csv"'
+        return response
+
+class BorrowerBorrowingHistoryView(LoginRequiredMixin, PermissionRequiredMixin, ArchivedHistoryMixin, KeysetPaginationMixin, CachedCountMixin, ListView):
     """
     View for displaying the history of borrowed books of a borrower. It checks if the user has permission to access the page.
     """
     model = Borrowing
+    queryset = Borrowing.objects.for_listing()
     template_name = 'borrowing_history.html'
     paginate_by = 5
     ordering = ['borrow_date']
+    keyset_fields = ('borrow_date', 'return_date', 'book__title')
     permission_required = ('book_management.can_borrow', 'book_management.can_return')
     raise_exception = False
 
@@ -734,12 +872,12 @@ class BorrowerBorrowingHistoryView(LoginRequiredMixin, PermissionRequiredMixin,
         """
         return redirect(reverse_lazy('login'))
 
-    def get_queryset(self):
+    def filter_history_queryset(self, queryset):
         """
-        Return the filtered queryset based on the request parameters.
+        Return the queryset filtered based on the request parameters.
 
         Parameters:
-            self: The instance of the class.
+            queryset: The borrowings, or the archived borrowings, to filter.
         
         Returns:
             Queryset: The filtered queryset based on the request parameters.
@@ -747,9 +885,11 @@ class BorrowerBorrowingHistoryView(LoginRequiredMixin, PermissionRequiredMixin,
         query = self.request.GET.get('q')
         order_by = self.request.GET.get('order_by', 'borrow_date')
         dir = self.request.GET.get('dir', 'asc')
-        borrower = Borrower.objects.get(user=self.request.user)
-
-        queryset = super().get_queryset().filter(return_date__isnull=False, borrower=borrower)
+        borrower_id = self.request.borrower.borrower_id
+        if borrower_id is None:
+            return queryset.none()
+        queryset = queryset.filter(return_date__isnull=False, borrower_id=borrower_id)
+        queryset = filter_borrow_dates(queryset, *self.get_history_range())
 
         if query:
             queryset = queryset.filter(
@@ -772,6 +912,7 @@ class BorrowerBorrowingHistoryView(LoginRequiredMixin, PermissionRequiredMixin,
         context = super().get_context_data(**kwargs)
         context['order_by'] = self.request.GET.get('order_by', 'borrow_date')
         context['dir'] = self.request.GET.get('dir', 'asc')
+        context['search_query'] = self.request.GET.get('q')
         return context
 
 class BorrowingDetailsView(LoginRequiredMixin, DetailView):
@@ -779,9 +920,21 @@ class BorrowingDetailsView(LoginRequiredMixin, DetailView):
     View for displaying the details of a borrowing. It checks if the user has permission to access the page.
     """
     model = Borrowing
+    queryset = Borrowing.objects.for_detail()
     template_name = 'borrowing_detail.html'
     context_object_name = 'borrowing'
 
+    def get_object(self, queryset=None):
+        """
+        Return the borrowing, looking in the archive once it has been moved there.
+        """
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            if queryset is not None or get_archive_horizon() is None:
+                raise
+            return super().get_object(ArchivedBorrowing.objects.for_detail())
+
 class CustomSignupView(FormView):
     """
     View for signing up a user.
@@ -801,6 +954,8 @@ class CustomSignupView(FormView):
             The result of calling the parent class's form_valid method.
         """
         user = form.save()
+        if user is None:
+            return self.form_invalid(form)
         messages.success(self.request, 'Account created successfully.', extra_tags='bg-success')
         return super().form_valid(form)
 
@@ -812,6 +967,14 @@ class CustomLoginView(FormView):
     form_class = CustomLoginForm
     success_url = reverse_lazy('book_list')
 
+    def get_form_kwargs(self):
+        """
+        Pass the request to the form, for the authentication backend.
+        """
+        kwargs = super().get_form_kwargs()
+        kwargs['request'] = self.request
+        return kwargs
+
     def form_valid(self, form):
         """
         Method to handle the validation of a form.
@@ -831,10 +994,11 @@ class CustomLoginView(FormView):
         """
         Return the success URL based on the user's permissions and status.
         """
-        # Check if the user is a staff user
-        if self.request.user.is_staff:
+        # The identity of the user just logged in, which also answers has_perms().
+        identity = get_identity(self.request.user)
+        if identity.is_staff:
             return reverse_lazy('book_list')
-        elif self.request.user.has_perm('book_management.can_borrow') and self.request.user.has_perm('book_management.can_return'):
+        elif identity.has_perms(('book_management.can_borrow', 'book_management.can_return')):
             return reverse_lazy('available_books')
         else:
             return reverse_lazy('available_books_anonymous') 
@@ -0,0 +1,15 @@
+"""
+Celery app for library_management project.
+
+Settings prefixed with CELERY_ in settings.py configure it. Start a worker with:
+    celery -A library_management worker
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_management.settings')
+
+app = Celery('library_management')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
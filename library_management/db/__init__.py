@@ -0,0 +1,144 @@
+"""
+Database connection statistics for library_management project.
+
+Django keeps one connection per thread and alias; with CONN_MAX_AGE set, a connection
+outlives the request that opened it and the threads' connections act as a pool. The
+database backends in this package record, per process and alias, how many connections
+are open, how many are in use by a running request, how often they are opened, closed
+or fail their health check, and how long requests wait to get one (the handshake when a
+new connection is needed, the health check when one is reused).
+"""
+import threading
+import time
+
+from django.core.signals import request_finished
+from django.db import connections
+
+
+class ConnectionStats:
+    """
+    Thread-safe connection counters for the current process, per database alias.
+    """
+    COUNTERS = ('open', 'in_use', 'opened', 'closed', 'health_check_failures', 'acquired')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.aliases = {}
+
+    def get(self, alias):
+        """
+        Return the counters of alias, creating them on first use. Call with the lock held.
+        """
+        if alias not in self.aliases:
+            self.aliases[alias] = {**dict.fromkeys(self.COUNTERS, 0), 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+        return self.aliases[alias]
+
+    def add(self, alias, **deltas):
+        """
+        Add deltas to the counters of alias.
+        """
+        with self.lock:
+            counters = self.get(alias)
+            for name, delta in deltas.items():
+                counters[name] += delta
+
+    def record_wait(self, alias, seconds):
+        """
+        Record that a request got a connection of alias after waiting seconds.
+        """
+        with self.lock:
+            counters = self.get(alias)
+            counters['acquired'] += 1
+            counters['in_use'] += 1
+            counters['wait_seconds_total'] += seconds
+            counters['wait_seconds_max'] = max(counters['wait_seconds_max'], seconds)
+
+    def snapshot(self):
+        """
+        Return a copy of the counters per alias, with the idle count and the mean wait.
+        """
+        with self.lock:
+            result = {}
+            for alias, counters in self.aliases.items():
+                counters = dict(counters)
+                counters['idle'] = max(counters['open'] - counters['in_use'], 0)
+                counters['wait_seconds_avg'] = counters['wait_seconds_total'] / counters['acquired'] if counters['acquired'] else 0.0
+                result[alias] = counters
+            return result
+
+    def reset(self):
+        """
+        Forget all counters.
+        """
+        with self.lock:
+            self.aliases.clear()
+
+
+stats = ConnectionStats()
+
+
+class ConnectionStatsMixin:
+    """
+    DatabaseWrapper mixin that records its connection's life cycle in stats.
+
+    A connection is in use from the first query of a request until the request finishes
+    (or until it is closed, outside a request).
+    """
+    in_use = False
+    health_check_seconds = 0.0
+
+    def connect(self):
+        super().connect()
+        stats.add(self.alias, open=1, opened=1)
+
+    def close(self):
+        was_open = self.connection is not None
+        super().close()
+        if was_open and self.connection is None:
+            self.release()
+            stats.add(self.alias, open=-1, closed=1)
+
+    def close_if_health_check_failed(self):
+        checking = self.connection is not None and self.health_check_enabled and not self.health_check_done
+        started = time.perf_counter()
+        super().close_if_health_check_failed()
+        if checking:
+            # The check runs just before the connection is handed out; count it as waiting.
+            self.health_check_seconds = time.perf_counter() - started
+            if self.connection is None:
+                stats.add(self.alias, health_check_failures=1)
+
+    def ensure_connection(self):
+        if self.in_use and self.connection is not None:
+            return super().ensure_connection()
+        started = time.perf_counter()
+        # Marked first: connecting calls ensure_connection() again.
+        self.in_use = True
+        try:
+            super().ensure_connection()
+        except Exception:
+            self.in_use = False
+            raise
+        waited = time.perf_counter() - started + self.health_check_seconds
+        self.health_check_seconds = 0.0
+        stats.record_wait(self.alias, waited)
+
+    def release(self):
+        """
+        Mark the connection as no longer used by the current request.
+        """
+        if self.in_use:
+            self.in_use = False
+            stats.add(self.alias, in_use=-1)
+
+
+def release_connections(**kwargs):
+    """
+    Return the current thread's connections to the idle count when a request finishes.
+    """
+    for connection in connections.all(initialized_only=True):
+        if isinstance(connection, ConnectionStatsMixin):
+            connection.release()
+
+
+request_finished.connect(release_connections)
@@ -0,0 +1,13 @@
+"""
+PostgreSQL backend for library_management project: Django's backend with connection
+statistics (see library_management.db).
+"""
+from django.db.backends.postgresql import base
+
+from library_management.db import ConnectionStatsMixin
+
+
+class DatabaseWrapper(ConnectionStatsMixin, base.DatabaseWrapper):
+    """
+    PostgreSQL DatabaseWrapper that records connection statistics.
+    """
@@ -14,12 +14,21 @@ from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 import os
+import sys
 
 POSTGREDB_NAME = os.getenv("POSTGREDB_NAME")
 POSTGREDB_USER = os.getenv("POSTGREDB_USER")
 POSTGREDB_PASSWORD = os.getenv("POSTGREDB_PASSWORD")
 POSTGREDB_HOST = os.getenv("POSTGREDB_HOST")
 POSTGREDB_PORT = os.getenv("POSTGREDB_PORT")
+POSTGREDB_CONN_MAX_AGE = int(os.getenv("POSTGREDB_CONN_MAX_AGE", "60"))
+POSTGREDB_CONN_HEALTH_CHECKS = os.getenv("POSTGREDB_CONN_HEALTH_CHECKS", "True").lower() in ("1", "true", "yes")
+POSTGREDB_PGBOUNCER = os.getenv("POSTGREDB_PGBOUNCER", "False").lower() in ("1", "true", "yes")
+POSTGREDB_CONNECT_TIMEOUT = int(os.getenv("POSTGREDB_CONNECT_TIMEOUT", "5"))
+REDIS_URL = os.getenv("REDIS_URL")
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
+ASYNC_LIST_VIEWS = os.getenv("ASYNC_LIST_VIEWS", "False").lower() in ("1", "true", "yes")
+ASYNC_LOGIN_VIEW = os.getenv("ASYNC_LOGIN_VIEW", "False").lower() in ("1", "true", "yes")
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -32,7 +41,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-i@q50&^+ol+1%-wlptfhl54%8gim1tq5#pl(tt(x!r!qr@sq+!'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv("DEBUG", "True").lower() in ("1", "true", "yes")
 
 ALLOWED_HOSTS = []
 
@@ -51,20 +60,33 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'book_management',
     'django_bootstrap5',
-    'debug_toolbar',
+    'django_celery_results',
 ]
 
 MIDDLEWARE = [
+    # First, so the latency it records includes the other middleware.
+    'book_management.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Sets request.borrower (see book_management.identity); needs request.user.
+    'book_management.identity.IdentityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    # Profiles requests that ask for it; needs request.user (see book_management.profiling).
+    'book_management.profiling.ProfilingMiddleware',
 ]
 
+# The debug toolbar is for local development only: it is left out unless DEBUG is on,
+# and when running tests.
+DEBUG_TOOLBAR = DEBUG and 'test' not in sys.argv
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+    INTERNAL_IPS = ['127.0.0.1']
+
 ROOT_URLCONF = 'library_management.urls'
 
 TEMPLATES = [
@@ -85,6 +107,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'library_management.wsgi.application'
 
+# Under ASGI, set ASYNC_LIST_VIEWS=True in .env to serve the available-books, book list
+# and borrowing history pages with their async views (book_management.async_views).
+# Likewise set ASYNC_LOGIN_VIEW=True to check login passwords in a pool of
+# LOGIN_HASH_WORKERS threads (default: one per CPU) instead of the shared sync thread.
+LOGIN_HASH_WORKERS = None
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -93,7 +121,8 @@ DATABASES = {
 
     'default': {
 
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        # Django's PostgreSQL backend, recording connection statistics (library_management.db).
+        'ENGINE': 'library_management.db.postgresql',
 
         'NAME': POSTGREDB_NAME,
 
@@ -105,11 +134,96 @@ DATABASES = {
 
         'PORT': POSTGREDB_PORT,
 
+        # Keep each thread's connection open between requests instead of reconnecting.
+        'CONN_MAX_AGE': POSTGREDB_CONN_MAX_AGE,
+
+        # Check a kept connection before a request reuses it, and reconnect if it is dead.
+        'CONN_HEALTH_CHECKS': POSTGREDB_CONN_HEALTH_CHECKS,
+
+        # PgBouncer in transaction mode hands each transaction to any server connection, so
+        # the server-side cursors behind .iterator() cannot be used.
+        'DISABLE_SERVER_SIDE_CURSORS': POSTGREDB_PGBOUNCER,
+
+        'OPTIONS': {
+            'connect_timeout': POSTGREDB_CONNECT_TIMEOUT,
+        },
+
     }
 
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Redis when REDIS_URL is set; tests always use a per-process local-memory cache.
+
+if REDIS_URL and 'test' not in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Celery
+# https://docs.celeryq.dev/en/stable/django/first-steps-with-django.html
+# Tasks go to a worker through CELERY_BROKER_URL; without one, and in tests, they run
+# eagerly in the process that queues them.
+
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL or 'test' in sys.argv
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_RESULT_BACKEND = 'django-db'
+CELERY_TASK_ACKS_LATE = True
+
+# Seconds a cached page of available books is kept (see book_management.page_cache).
+PAGE_CACHE_TIMEOUT = 300
+
+# Request metrics (see book_management.metrics): each process writes its figures to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds; /metrics/ adds them up for staff users
+# or for a scraper sending 'Authorization: Bearer <METRICS_TOKEN>'.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Request profiling (see book_management.profiling): where profiles are written, and the
+# sampling interval in seconds of the collapsed-stacks profiler.
+PROFILING_DIR = os.getenv("PROFILING_DIR")
+PROFILING_INTERVAL = 0.005
+
+# Days a book may be kept before it is overdue (see book_management.models.due_date_for).
+LOAN_PERIOD_DAYS = 14
+
+# Processes hashing passwords when provisioning borrowers from CSV (see
+# book_management.provisioning); None uses one per CPU.
+PROVISIONING_WORKERS = None
+
+# Returned borrowings older than this many days are moved to the archive table by the
+# archive_borrowings command (see book_management.archive).
+ARCHIVE_AFTER_DAYS = 730
+
+# Seconds each process caches the archive horizon; archive_borrowings waits this long
+# after moving the horizon before it moves any rows.
+ARCHIVE_HORIZON_CACHE_TIMEOUT = 60
+
+# Sessions are read from the cache and written through to the database, so a request
+# only queries the session table on a cache miss.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Permission checks read the user's cached identity snapshot (see book_management.identity),
+# which is kept for IDENTITY_CACHE_TIMEOUT seconds unless a signal drops it sooner.
+AUTHENTICATION_BACKENDS = ['book_management.identity.IdentityBackend']
+IDENTITY_CACHE_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -152,3 +266,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles/')
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Leaves the benchmarks (book_management/test_benchmarks.py) out unless run with
+# --tag benchmark.
+TEST_RUNNER = 'library_management.test_runner.LibraryTestRunner'
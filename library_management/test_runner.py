@@ -0,0 +1,25 @@
+"""
+Test runner for library_management project.
+"""
+import logging
+import sys
+
+from django.test.runner import DiscoverRunner
+
+BENCHMARK_TAG = 'benchmark'
+
+
+class LibraryTestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that leaves out the benchmarks unless they are asked for with
+    --tag benchmark. With --verbosity 2 or more, the benchmarks' measurements are logged to
+    stderr.
+    """
+    def __init__(self, *args, tags=None, exclude_tags=None, verbosity=1, **kwargs):
+        if not tags or BENCHMARK_TAG not in tags:
+            exclude_tags = set(exclude_tags or ()) | {BENCHMARK_TAG}
+        super().__init__(*args, tags=tags, exclude_tags=exclude_tags, verbosity=verbosity, **kwargs)
+        if verbosity >= 2:
+            logger = logging.getLogger('book_management.benchmarks')
+            logger.setLevel(logging.INFO)
+            logger.addHandler(logging.StreamHandler(sys.stderr))
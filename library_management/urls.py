@@ -24,6 +24,10 @@ urlpatterns = [
     path('', include('book_management.urls')),
 ]
 
+# The debug toolbar's own pages, when it is enabled.
+if getattr(settings, 'DEBUG_TOOLBAR', False):
+    urlpatterns += [path('__debug__/', include('debug_toolbar.urls'))]
+
 # Serve static files during development
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file